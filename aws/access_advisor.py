@@ -0,0 +1,152 @@
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AccessAdvisorCollector:
+    """
+    Runs IAM Access Advisor (generate_service_last_accessed_details) jobs for many roles at once.
+    A single scheduler thread hands every in-flight job to a small poll pool when it is due,
+    each job backing off on its own, and completed results are cached by role ARN for the run.
+    """
+
+    def __init__(self, max_in_flight=200, poll_workers=8, base_delay=1, max_delay=30, timeout=600):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.results = {}
+        self.events = {}
+        self.pending = []
+        self.sequence = itertools.count()
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+        self.condition = threading.Condition()
+        self.executor = ThreadPoolExecutor(max_workers=poll_workers)
+        self.closed = False
+        self.stats = {'submitted': 0, 'cached': 0, 'completed': 0, 'failed': 0, 'polls': 0}
+        self.scheduler = threading.Thread(target=self._run, name='access-advisor', daemon=True)
+        self.scheduler.start()
+
+    def submit(self, iam_client, role_arn):
+        """Start a job for the role unless one was already started in this run. Blocks while max_in_flight jobs are running"""
+        with self.condition:
+            if role_arn in self.events:
+                self.stats['cached'] += 1
+                return
+            self.events[role_arn] = threading.Event()
+
+        self.slots.acquire()
+        try:
+            job_id = iam_client.generate_service_last_accessed_details(Arn=role_arn, Granularity='SERVICE_LEVEL')['JobId']
+        except Exception as e:
+            self._finish(role_arn, {'job_status': 'FAILED', 'error': str(e)})
+            return
+
+        with self.condition:
+            self.stats['submitted'] += 1
+            self._schedule({'role_arn': role_arn, 'job_id': job_id, 'client': iam_client,
+                            'started': time.monotonic(), 'attempt': 0})
+
+    def get(self, role_arn, timeout=None):
+        """Wait for the result of a submitted role. None if the role was never submitted"""
+        with self.condition:
+            event = self.events.get(role_arn)
+        if event is None:
+            return None
+        if not event.wait(timeout):
+            return {'job_status': 'FAILED', 'error': 'Timed out waiting for Access Advisor job'}
+        return self.results[role_arn]
+
+    def _schedule(self, job):
+        # Caller holds self.condition
+        delay = min(self.base_delay * (2 ** job['attempt']), self.max_delay)
+        heapq.heappush(self.pending, (time.monotonic() + delay, next(self.sequence), job))
+        self.condition.notify()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.closed and (not self.pending or self.pending[0][0] > time.monotonic()):
+                    self.condition.wait(self.pending[0][0] - time.monotonic() if self.pending else None)
+                if self.closed:
+                    return
+                now = time.monotonic()
+                due_jobs = []
+                while self.pending and self.pending[0][0] <= now:
+                    due_jobs.append(heapq.heappop(self.pending)[2])
+            for job in due_jobs:
+                self.executor.submit(self._poll, job)
+
+    def _poll(self, job):
+        role_arn = job['role_arn']
+        try:
+            response = job['client'].get_service_last_accessed_details(JobId=job['job_id'])
+            with self.condition:
+                self.stats['polls'] += 1
+
+            if response['JobStatus'] == 'IN_PROGRESS':
+                if time.monotonic() - job['started'] > self.timeout:
+                    self._finish(role_arn, {'job_status': 'FAILED', 'error': f"Job {job['job_id']} did not finish in {self.timeout}s"})
+                    return
+                with self.condition:
+                    job['attempt'] += 1
+                    self._schedule(job)
+                return
+
+            if response['JobStatus'] != 'COMPLETED':
+                self._finish(role_arn, {'job_status': response['JobStatus'],
+                                        'error': response.get('Error', {}).get('Message', 'Access Advisor job failed')})
+                return
+
+            services = list(response.get('ServicesLastAccessed', []))
+            while response.get('IsTruncated'):
+                response = job['client'].get_service_last_accessed_details(JobId=job['job_id'], Marker=response['Marker'])
+                services.extend(response.get('ServicesLastAccessed', []))
+            self._finish(role_arn, {'job_status': 'COMPLETED', 'job_completion_date': response.get('JobCompletionDate'),
+                                    'services': services})
+        except Exception as e:
+            self._finish(role_arn, {'job_status': 'FAILED', 'error': str(e)})
+
+    def _finish(self, role_arn, result):
+        with self.condition:
+            self.results[role_arn] = result
+            self.stats['completed' if result['job_status'] == 'COMPLETED' else 'failed'] += 1
+            event = self.events[role_arn]
+        self.slots.release()
+        event.set()
+
+    def print_stats(self):
+        print(f"INFO: Access Advisor: {self.stats['submitted']} jobs submitted, {self.stats['completed']} completed, "
+              f"{self.stats['failed']} failed, {self.stats['cached']} served from cache, {self.stats['polls']} status polls")
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.scheduler.join()
+        self.executor.shutdown(wait=True)
+
+
+def summarize_service_last_accessed(result):
+    """Evidence kept in the role backup: job outcome plus the services the role actually reached"""
+    if not result or result['job_status'] != 'COMPLETED':
+        return {'job_status': result['job_status'] if result else 'NOT_SUBMITTED',
+                'error': result.get('error') if result else None}
+
+    accessed = [
+        {
+            'ServiceNamespace': service['ServiceNamespace'],
+            'LastAuthenticated': service['LastAuthenticated'],
+            'LastAuthenticatedRegion': service.get('LastAuthenticatedRegion'),
+            'LastAuthenticatedEntity': service.get('LastAuthenticatedEntity')
+        }
+        for service in result['services'] if service.get('LastAuthenticated')
+    ]
+    accessed.sort(key=lambda service: service['LastAuthenticated'], reverse=True)
+    return {
+        'job_status': 'COMPLETED',
+        'job_completion_date': result.get('job_completion_date'),
+        'services_evaluated': len(result['services']),
+        'services_accessed': accessed
+    }
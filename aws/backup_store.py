@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+
+
+MANIFEST_FORMAT = 'role-backup-cas-v1'
+BLOB_REFERENCE = '$blob'
+
+# Sub-objects that repeat across role backups and are stored once under their hash
+BLOB_KEYS = {
+    'role_trust_relationship',
+    'role_raw_data',
+    'policy_document',
+    'policy_raw_data',
+    'AssumeRolePolicyDocument'
+}
+
+
+def serialize_backup(json_data):
+    """Byte format of a full role backup file"""
+    return json.dumps(json_data, indent=4, sort_keys=True, default=str).encode('utf-8')
+
+
+def canonical_json(json_data):
+    return json.dumps(json_data, sort_keys=True, separators=(',', ':'), default=str).encode('utf-8')
+
+
+def split_blobs(json_data, blobs):
+    """
+    Replace every sub-object stored under one of BLOB_KEYS with a reference to its hash.
+    Inner objects are split first, so a blob may itself reference other blobs.
+    blobs is filled with hash -> canonical JSON bytes.
+    """
+    if isinstance(json_data, dict):
+        result = {}
+        for key, value in json_data.items():
+            value = split_blobs(value, blobs)
+            if key in BLOB_KEYS and isinstance(value, (dict, list)):
+                content = canonical_json(value)
+                digest = hashlib.sha256(content).hexdigest()
+                blobs[digest] = content
+                value = {BLOB_REFERENCE: digest}
+            result[key] = value
+        return result
+    if isinstance(json_data, list):
+        return [split_blobs(item, blobs) for item in json_data]
+    return json_data
+
+
+def join_blobs(json_data, get_blob):
+    """Resolve blob references recursively using get_blob(hash) -> bytes"""
+    if isinstance(json_data, dict):
+        if set(json_data.keys()) == {BLOB_REFERENCE}:
+            digest = json_data[BLOB_REFERENCE]
+            content = get_blob(digest)
+            if hashlib.sha256(content).hexdigest() != digest:
+                raise ValueError(f"Blob {digest} is corrupted")
+            return join_blobs(json.loads(content), get_blob)
+        return {key: join_blobs(value, get_blob) for key, value in json_data.items()}
+    if isinstance(json_data, list):
+        return [join_blobs(item, get_blob) for item in json_data]
+    return json_data
+
+
+def build_manifest(json_data, backup_bytes, slave_account_id, delete_role_name):
+    """Return the manifest and the blobs it references"""
+    blobs = {}
+    manifest = {
+        'format': MANIFEST_FORMAT,
+        'account_id': slave_account_id,
+        'role_name': delete_role_name,
+        'backup_sha256': hashlib.sha256(backup_bytes).hexdigest(),
+        'backup_size': len(backup_bytes),
+        'root': split_blobs(json_data, blobs)
+    }
+    return manifest, blobs
+
+
+def rebuild_backup(manifest, get_blob):
+    """Rebuild the exact bytes of the original backup file and check them against the manifest"""
+    if manifest.get('format') != MANIFEST_FORMAT:
+        raise ValueError(f"Unsupported manifest format {manifest.get('format')}")
+    backup_bytes = serialize_backup(join_blobs(manifest['root'], get_blob))
+    if hashlib.sha256(backup_bytes).hexdigest() != manifest['backup_sha256']:
+        raise ValueError(f"Rebuilt backup of role {manifest.get('role_name')} does not match its recorded sha256")
+    return backup_bytes
+
+
+class ContentAddressedStore:
+    """
+    Local store of role backups as manifests plus shared blobs.
+    Layout: <root>/blobs/<hash[:2]>/<hash>.json and <root>/manifests/<account>/<name>.manifest.json
+    """
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        self.blobs_dir = os.path.join(root_dir, 'blobs')
+        self.manifests_dir = os.path.join(root_dir, 'manifests')
+        self.lock = threading.Lock()
+        self.uploaded_blobs = set()
+        self.blobs_written = 0
+        self.blobs_reused = 0
+        os.makedirs(self.blobs_dir, exist_ok=True)
+        os.makedirs(self.manifests_dir, exist_ok=True)
+
+    def blob_path(self, digest):
+        return os.path.join(self.blobs_dir, digest[:2], f"{digest}.json")
+
+    def put_blob(self, digest, content):
+        """Write a blob unless it is already stored. Returns True when it was new"""
+        blob_path = self.blob_path(digest)
+        if os.path.exists(blob_path):
+            with self.lock:
+                self.blobs_reused += 1
+            return False
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        tmp_path = f"{blob_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, blob_path)
+        with self.lock:
+            self.blobs_written += 1
+        return True
+
+    def get_blob(self, digest):
+        with open(self.blob_path(digest), 'rb') as f:
+            return f.read()
+
+    def store(self, json_data, backup_bytes, slave_account_id, delete_role_name, backup_name):
+        """
+        Store one role backup. Returns (manifest_path, manifest_bytes, blobs) where blobs holds
+        every blob the manifest references, so callers can upload the ones missing remotely.
+        """
+        manifest, blobs = build_manifest(json_data, backup_bytes, slave_account_id, delete_role_name)
+        for digest, content in blobs.items():
+            self.put_blob(digest, content)
+
+        manifest_dir = os.path.join(self.manifests_dir, slave_account_id)
+        os.makedirs(manifest_dir, exist_ok=True)
+        manifest_path = os.path.join(manifest_dir, f"{os.path.splitext(backup_name)[0]}.manifest.json")
+        manifest_bytes = json.dumps(manifest, indent=1, sort_keys=True, default=str).encode('utf-8')
+        with open(manifest_path, 'wb') as f:
+            f.write(manifest_bytes)
+        return manifest_path, manifest_bytes, blobs
+
+    def rebuild(self, manifest_path):
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+        return rebuild_backup(manifest, self.get_blob)
+
+    def mark_uploaded(self, digest):
+        """Returns True the first time a blob is seen for upload in this run"""
+        with self.lock:
+            if digest in self.uploaded_blobs:
+                return False
+            self.uploaded_blobs.add(digest)
+            return True
+
+    def print_stats(self):
+        print(f"INFO: Backup store: {self.blobs_written} blobs written, {self.blobs_reused} blobs reused")
+
+
+def s3_blob_key(prefix, digest):
+    return f"{prefix.rstrip('/')}/blobs/{digest}.json"
+
+
+def s3_blob_reader(s3_client, bucket_name, prefix):
+    def get_blob(digest):
+        return s3_client.get_object(Bucket=bucket_name, Key=s3_blob_key(prefix, digest))['Body'].read()
+    return get_blob
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rebuild original role backup JSON from a content addressed backup')
+    parser.add_argument('--manifest', required=True, help='Manifest file path, or manifest key when --bucket is given')
+    parser.add_argument('--store', help='Local store directory holding blobs/')
+    parser.add_argument('--bucket', help='S3 bucket holding the manifest and blobs')
+    parser.add_argument('--prefix', default='role_backups', help='S3 prefix of the blob store')
+    parser.add_argument('--output', required=True, help='Where to write the rebuilt backup JSON')
+    args = parser.parse_args()
+
+    try:
+        if args.bucket:
+            import boto3
+            s3_client = boto3.client('s3')
+            manifest = json.loads(s3_client.get_object(Bucket=args.bucket, Key=args.manifest)['Body'].read())
+            backup_bytes = rebuild_backup(manifest, s3_blob_reader(s3_client, args.bucket, args.prefix))
+        elif args.store:
+            backup_bytes = ContentAddressedStore(args.store).rebuild(args.manifest)
+        else:
+            print("ERROR: Either --store or --bucket is required")
+            sys.exit(1)
+
+        with open(args.output, 'wb') as f:
+            f.write(backup_bytes)
+        print(f"SUCCESS: Rebuilt backup written to {args.output} (sha256 {hashlib.sha256(backup_bytes).hexdigest()})")
+    except Exception as e:
+        print(f"ERROR: Unable to rebuild backup from {args.manifest}: {str(e)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,552 @@
+import copy
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from filters import ResourceFilter, parse_filter
+from projection import parse_columns, project_columns
+from regions import clone_session
+from results_store import ResultsStore, default_run_id
+from sinks import CsvSink, ParquetDatasetSink, PartitionedCsvSink, choose_output_format, typed_schema
+from sharding import select_shard
+
+
+# Only read operations are served from the cache, anything else always goes to AWS
+CACHED_OPERATION_PREFIXES = ('describe_', 'get_', 'list_')
+# Reads whose answer changes while the run is going on, never served from the cache
+UNCACHED_OPERATIONS = {'get_service_last_accessed_details', 'get_credential_report', 'get_query_results'}
+# Bucket level S3 calls answer the same whatever region the client is in
+REGIONLESS_SERVICES = {'s3', 'iam', 'sts'}
+# Errors that are the answer about a resource ("it has no tags") and come back the same on every call.
+# Anything else (throttling, 5xx, access denied, region redirects) is left out of the cache and retried by the next caller
+ANSWER_ERRORS = {
+    'NoSuchTagSet', 'NoSuchLifecycleConfiguration', 'ServerSideEncryptionConfigurationNotFoundError', 'NoSuchBucketPolicy',
+    'NoSuchCORSConfiguration', 'NoSuchWebsiteConfiguration', 'ReplicationConfigurationNotFoundError',
+    'ObjectLockConfigurationNotFoundError', 'OwnershipControlsNotFoundError', 'NoSuchPublicAccessBlockConfiguration',
+    'NoSuchBucket', 'NoSuchKey', 'NoSuchEntity', 'TrailNotFoundException', 'InsightNotEnabledException'
+}
+DEFAULT_ACCOUNT_WORKERS = 4
+
+
+def is_cacheable_error(error):
+    # Expected errors such as NoSuchTagSet are answers too, every caller sees the same one
+    response = getattr(error, 'response', None)
+    code = response.get('Error', {}).get('Code') if isinstance(response, dict) else None
+    return code in ANSWER_ERRORS
+
+
+class _Flight:
+    """One AWS read, shared by every caller that asks for it while or after it runs"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.outcome = None
+
+
+class ResponseCache:
+    """
+    Reads of one account for the whole run, keyed by (account, region, service, operation, params).
+    Callers asking for a key that is already being fetched wait for that request instead of
+    sending their own. Errors other than AWS answers are handed to the waiting callers but not kept.
+    """
+
+    def __init__(self, account_id=None):
+        self.account_id = account_id
+        self.flights = {}
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'coalesced': 0, 'misses': 0, 'invalidated': 0}
+
+    def make_key(self, region, service, operation, params):
+        if service in REGIONLESS_SERVICES:
+            region = None
+        return (self.account_id, region, service, operation, json.dumps(params, sort_keys=True, default=str))
+
+    def call(self, key, request):
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = _Flight()
+                self.stats['misses'] += 1
+            else:
+                self.stats['hits' if flight.done.is_set() else 'coalesced'] += 1
+
+        if leader:
+            try:
+                flight.outcome = ('response', request())
+            except Exception as e:
+                flight.outcome = ('error', e)
+                if not is_cacheable_error(e):
+                    with self.lock:
+                        if self.flights.get(key) is flight:
+                            del self.flights[key]
+            flight.done.set()
+        else:
+            flight.done.wait()
+
+        kind, value = flight.outcome
+        if kind == 'error':
+            raise value
+        # Callers are free to modify what they get back
+        return copy.deepcopy(value)
+
+    def invalidate(self, service):
+        """Forget every read of the service, called after a write to it"""
+        with self.lock:
+            for key in [key for key in self.flights if key[2] == service]:
+                del self.flights[key]
+                self.stats['invalidated'] += 1
+
+
+class CachingClient:
+    """
+    boto3 client whose read operations go through the account's ResponseCache. Any other
+    operation goes straight to AWS and drops the cached reads of its service.
+    """
+
+    def __init__(self, client, service, cache):
+        self._client = client
+        self._service = service
+        self._cache = cache
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        if name not in self._client.meta.method_to_api_mapping:
+            return attribute
+
+        if name.startswith(CACHED_OPERATION_PREFIXES):
+            if name in UNCACHED_OPERATIONS:
+                return attribute
+
+            def cached_operation(**params):
+                key = self._cache.make_key(self._client.meta.region_name, self._service, name, params)
+                return self._cache.call(key, lambda: attribute(**params))
+            return cached_operation
+
+        def write_operation(**params):
+            try:
+                return attribute(**params)
+            finally:
+                self._cache.invalidate(self._service)
+        return write_operation
+
+
+class SharedSession:
+    """
+    One assumed account session shared by every collector of the account. Clients are
+    built once per (service, region) and shared, since boto3 clients are thread safe
+    while sessions are not. clone() hands out regional views over the same clients and cache.
+    """
+
+    def __init__(self, session, account_id, region_name=None, clients=None, cache=None, lock=None):
+        self.session = session
+        self.account_id = account_id
+        self.region_name = region_name or session.region_name
+        self.clients = clients if clients is not None else {}
+        self.cache = cache or ResponseCache(account_id)
+        self.lock = lock or threading.Lock()
+
+    def client(self, service_name, region_name=None, cached=True):
+        """Shared client of the service. cached=False gives the plain boto3 client, for callers that must see live state"""
+        region_name = region_name or self.region_name
+        with self.lock:
+            key = (service_name, region_name)
+            if key not in self.clients:
+                self.clients[key] = CachingClient(self.session.client(service_name, region_name=region_name), service_name, self.cache)
+            return self.clients[key] if cached else self.clients[key]._client
+
+    def clone(self, region_name=None):
+        return SharedSession(self.session, self.account_id, region_name or self.region_name, self.clients, self.cache, self.lock)
+
+    def get_credentials(self):
+        return self.session.get_credentials()
+
+    def get_available_regions(self, service_name):
+        with self.lock:
+            return self.session.get_available_regions(service_name)
+
+
+class CsvExporter:
+    """Writes every row to the CSV file as soon as a collector yields it, flushed after each account"""
+
+    def __init__(self, output_file, headers):
+        self.sink = CsvSink(output_file, headers)
+
+    def write(self, account_id, row):
+        self.sink.write(dict(row, account=account_id) if 'account' in self.sink.schema else row)
+
+    def account_done(self, account_id):
+        self.sink.flush()
+
+    def close(self):
+        self.sink.close()
+        print(f"CSV file '{self.sink.output_file}' has been created")
+
+
+class AccountCsvExporter:
+    """One CSV file per account (file_pattern.format(account_id)), complete as soon as the account is"""
+
+    def __init__(self, file_pattern, headers):
+        self.sink = PartitionedCsvSink(file_pattern, headers)
+
+    def write(self, account_id, row):
+        self.sink.write(account_id, row)
+
+    def account_done(self, account_id):
+        self.sink.close_partition(account_id)
+
+    def close(self):
+        self.sink.close()
+
+
+class ParquetExporter:
+    """
+    Typed rows of every account in one Parquet dataset under root_dir, partitioned by run date,
+    account and region_column (None for reports without a region). Complete per account like AccountCsvExporter.
+    """
+
+    def __init__(self, root_dir, schema, run_id, account_column='account', region_column=None):
+        self.account_column = account_column
+        self.sink = ParquetDatasetSink(root_dir, schema, run_id, account_column=account_column, region_column=region_column)
+
+    def write(self, account_id, row):
+        self.sink.write(dict(row, **{self.account_column: account_id}))
+
+    def account_done(self, account_id):
+        self.sink.close_account(account_id)
+
+    def close(self):
+        self.sink.close()
+        print(f"Parquet dataset '{self.sink.root_dir}' has been written, {self.sink.rows} rows in {self.sink.files} files")
+
+
+class StoreExporter:
+    """Rows of each account kept until the account is done, then written to the results store in one go"""
+
+    def __init__(self, store, report):
+        self.store = store
+        self.report = report
+        self.lock = threading.Lock()
+        self.rows = {}
+
+    def write(self, account_id, row):
+        with self.lock:
+            self.rows.setdefault(account_id, []).append(row)
+
+    def account_done(self, account_id):
+        with self.lock:
+            rows = self.rows.pop(account_id, [])
+        self.store.write_account(self.report, account_id, rows)
+
+    def close(self):
+        pass
+
+
+class MultiExporter:
+    """Hands every row to each of exporters, a collector then writes its report and the results store at once"""
+
+    def __init__(self, exporters):
+        self.exporters = exporters
+
+    def write(self, account_id, row):
+        for exporter in self.exporters:
+            exporter.write(account_id, row)
+
+    def account_done(self, account_id):
+        for exporter in self.exporters:
+            exporter.account_done(account_id)
+
+    def close(self):
+        for exporter in self.exporters:
+            exporter.close()
+
+
+class Collector:
+    """
+    One report over every scanned account. requires lists the account level reads the
+    collector makes as (service, operation, params); the engine fetches each distinct one
+    once per account before the collectors start, so they all read it from the cache.
+    """
+    name = None
+    # Name of the report, also used for its Parquet dataset and in the results store
+    report = None
+    requires = ()
+
+    def __init__(self, exporter, columns=None, resource_filter=None):
+        self.exporter = exporter
+        # Report columns asked for, None for all. Collectors that support it skip the calls of the others
+        self.columns = columns
+        self.resource_filter = resource_filter or ResourceFilter()
+
+    def collect(self, session, account_id):
+        """Yield the report rows of one account"""
+        raise NotImplementedError
+
+
+class CloudTrailCollector(Collector):
+    name = 'cloudtrail'
+    report = 'trails'
+    requires = (('cloudtrail', 'describe_trails', {'includeShadowTrails': True}),)
+
+    def collect(self, session, account_id):
+        from ct2 import analyze_cloudtrail_costs
+        for region, trails in analyze_cloudtrail_costs(session, slave_account_id=account_id, resource_filter=self.resource_filter).items():
+            for trail in trails:
+                yield dict(trail, region=region)
+
+
+class S3BucketsCollector(Collector):
+    name = 's3_buckets'
+    report = 's3_buckets'
+    requires = (('s3', 'list_buckets', {}),)
+
+    def collect(self, session, account_id):
+        from ct2 import analyze_s3_buckets
+        yield from analyze_s3_buckets(session, columns=self.columns, resource_filter=self.resource_filter)
+
+
+class S3MonitoringCollector(Collector):
+    name = 's3_monitoring'
+    report = 's3_monitoring'
+    requires = (('cloudtrail', 'describe_trails', {'includeShadowTrails': True}), ('s3', 'list_buckets', {}))
+
+    def collect(self, session, account_id):
+        from ct2 import check_s3_object_monitoring, monitoring_row
+        for bucket_name, details in check_s3_object_monitoring(session, resource_filter=self.resource_filter).items():
+            yield monitoring_row(bucket_name, details)
+
+
+class S3InventoryCollector(Collector):
+    name = 's3_inventory'
+    report = 's3_buckets_inventory'
+    requires = (('s3', 'list_buckets', {}), ('sts', 'get_caller_identity', {}))
+
+    def collect(self, session, account_id):
+        from s3.new_list import read_data
+        yield from read_data(session, self.resource_filter)
+
+
+class S3UsageCollector(Collector):
+    name = 's3_usage'
+    report = 's3_analysis'
+    requires = (('s3', 'list_buckets', {}),)
+
+    def __init__(self, exporter, columns=None, resource_filter=None, region_workers=8):
+        super().__init__(exporter, columns, resource_filter)
+        from s3.aws import S3Analyzer
+        # Only the bucket analysis of S3Analyzer is used, the engine does the role assumption
+        self.analyzer = S3Analyzer(session_name='', master_role='', slave_role='', region_workers=region_workers, columns=columns,
+                                   resource_filter=self.resource_filter)
+
+    def collect(self, session, account_id):
+        response = session.client('s3').list_buckets()
+        if len(response['Buckets']) >= 1000:
+            print(f"WARNING: Possible bucket list truncation in account {account_id}")
+        from s3.aws import Utility
+        owner_info = self.analyzer.owner_info(response)
+        for bucket_name, metrics in self.analyzer.analyze_account_buckets(session, account_id, response['Buckets'], owner_info).items():
+            yield Utility.bucket_row(bucket_name, metrics)
+
+
+def build_collectors(names, output_dir='.', columns=None, resource_filter=None, output_format='csv', run_id=None, store=None):
+    """
+    Collectors by name, each with the exporter that writes its usual report into output_dir.
+    columns applies to the collectors whose report has them (s3_buckets, s3_usage), each of
+    those keeps only its key columns when none of the requested ones are in its report.
+    resource_filter is handed to every collector. output_format='parquet' writes each report
+    as a typed Parquet dataset named after it instead, see ParquetExporter. Rows also go to
+    store (a ResultsStore) when one is given.
+    """
+    from ct2 import (S3_BUCKET_COLUMN_TYPES, S3_BUCKET_HEADERS, S3_BUCKET_KEY_COLUMNS, S3_MONITORING_COLUMN_TYPES,
+                     S3_MONITORING_HEADERS, TRAIL_COLUMN_TYPES, TRAIL_HEADERS)
+    from s3.aws import S3_ANALYSIS_COLUMNS, Utility
+    from s3.new_list import INVENTORY_COLUMN_TYPES, INVENTORY_HEADERS
+
+    def columns_of(report_columns):
+        return None if columns is None else [column for column in columns if column in report_columns]
+
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    run_id = run_id or timestamp
+    bucket_columns = columns_of(S3_BUCKET_HEADERS)
+    usage_columns = columns_of(S3_ANALYSIS_COLUMNS)
+    bucket_headers = project_columns(S3_BUCKET_HEADERS, bucket_columns, S3_BUCKET_KEY_COLUMNS)
+
+    if output_format == 'parquet':
+        def exporter(report, schema, region_column=None, account_column='account'):
+            return ParquetExporter(os.path.join(output_dir, report), schema, run_id, account_column, region_column)
+        exporters = {
+            'cloudtrail': lambda: exporter('trails', typed_schema(TRAIL_HEADERS, TRAIL_COLUMN_TYPES), 'region'),
+            's3_buckets': lambda: exporter('s3_buckets', typed_schema(bucket_headers, S3_BUCKET_COLUMN_TYPES), 'bucket_region'),
+            's3_monitoring': lambda: exporter('s3_monitoring', typed_schema(S3_MONITORING_HEADERS, S3_MONITORING_COLUMN_TYPES)),
+            's3_inventory': lambda: exporter('s3_buckets_inventory', typed_schema(INVENTORY_HEADERS, INVENTORY_COLUMN_TYPES),
+                                             account_column='Account ID'),
+            's3_usage': lambda: exporter('s3_analysis', Utility.analysis_schema(usage_columns), 'Region')
+        }
+    else:
+        exporters = {
+            'cloudtrail': lambda: CsvExporter(os.path.join(output_dir, 'trails.csv'), TRAIL_HEADERS),
+            's3_buckets': lambda: CsvExporter(os.path.join(output_dir, 's3_buckets.csv'), bucket_headers),
+            's3_monitoring': lambda: CsvExporter(os.path.join(output_dir, 's3_monitoring.csv'), S3_MONITORING_HEADERS),
+            's3_inventory': lambda: CsvExporter(os.path.join(output_dir, f"s3_buckets_inventory_{timestamp}.csv"), INVENTORY_HEADERS),
+            's3_usage': lambda: AccountCsvExporter(os.path.join(output_dir, 's3_analysis_{}.csv'), Utility.analysis_headers(usage_columns))
+        }
+    factories = {
+        'cloudtrail': lambda: CloudTrailCollector(exporters['cloudtrail'](), resource_filter=resource_filter),
+        's3_buckets': lambda: S3BucketsCollector(exporters['s3_buckets'](), bucket_columns, resource_filter),
+        's3_monitoring': lambda: S3MonitoringCollector(exporters['s3_monitoring'](), resource_filter=resource_filter),
+        's3_inventory': lambda: S3InventoryCollector(exporters['s3_inventory'](), resource_filter=resource_filter),
+        's3_usage': lambda: S3UsageCollector(exporters['s3_usage'](), usage_columns, resource_filter)
+    }
+    unknown = [name for name in names if name not in factories]
+    if unknown:
+        raise ValueError(f"Unknown collectors {', '.join(unknown)}, expected any of: {', '.join(factories)}")
+
+    if columns is not None:
+        known_columns = set(S3_BUCKET_HEADERS if 's3_buckets' in names else []) | set(S3_ANALYSIS_COLUMNS if 's3_usage' in names else [])
+        unknown = [column for column in columns if column not in known_columns]
+        if unknown:
+            raise ValueError(f"Columns {', '.join(unknown)} are not in the report of any selected collector")
+    collectors = [factories[name]() for name in names]
+    if store is not None:
+        for collector in collectors:
+            collector.exporter = MultiExporter([collector.exporter, StoreExporter(store, collector.report)])
+    return collectors
+
+
+COLLECTOR_NAMES = ['cloudtrail', 's3_buckets', 's3_monitoring', 's3_inventory', 's3_usage']
+
+
+def prefetch_requirements(session, collectors):
+    """Read every distinct account level requirement once so the collectors start from a warm cache"""
+    requirements = {}
+    for collector in collectors:
+        for service, operation, params in collector.requires:
+            requirements[session.cache.make_key(session.region_name, service, operation, params)] = (service, operation, params)
+    for service, operation, params in requirements.values():
+        try:
+            getattr(session.client(service), operation)(**params)
+        except Exception:
+            # Cached as well, the collectors report it in their own way
+            pass
+
+
+def run_collector(collector, session, account_id):
+    rows = 0
+    for row in collector.collect(session, account_id):
+        collector.exporter.write(account_id, row)
+        rows += 1
+    return rows
+
+
+def scan_account(account_id, assume_account, collectors):
+    """Assume the account once and run every collector over the shared session concurrently"""
+    session = SharedSession(assume_account(account_id), account_id)
+    prefetch_requirements(session, collectors)
+
+    rows = {}
+    with ThreadPoolExecutor(max_workers=len(collectors)) as executor:
+        futures = {executor.submit(run_collector, collector, session, account_id): collector for collector in collectors}
+        for future in as_completed(futures):
+            collector = futures[future]
+            try:
+                rows[collector.name] = future.result()
+            except Exception as e:
+                print(f"ERROR: Collector {collector.name} failed for account {account_id}: {str(e)}")
+            finally:
+                # Flushes what the account produced, so finished accounts survive a crash of the run
+                collector.exporter.account_done(account_id)
+
+    stats = session.cache.stats
+    print(f"INFO: Account {account_id} scanned, rows {rows}, {stats['misses']} AWS reads, {stats['hits']} served from cache, "
+          f"{stats['coalesced']} joined an in-flight read")
+    return rows
+
+
+def run_collectors(account_ids, assume_account, collectors, account_workers=DEFAULT_ACCOUNT_WORKERS):
+    """
+    Scan every account with every collector. assume_account(account_id) returns a boto3 session
+    for the account. Exporters are closed once all accounts are done. Returns the failed accounts.
+    """
+    failed_accounts = []
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, account_workers)) as executor:
+            futures = {executor.submit(scan_account, account_id, assume_account, collectors): account_id for account_id in account_ids}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except (Exception, SystemExit) as e:
+                    # assume_* helpers exit on failure, that must not take the other accounts down
+                    print(f"ERROR: Unable to scan account {futures[future]}: {str(e)}")
+                    failed_accounts.append(futures[future])
+    finally:
+        for collector in collectors:
+            try:
+                collector.exporter.close()
+            except Exception as e:
+                print(f"ERROR: Unable to write the {collector.name} report: {str(e)}")
+    return sorted(failed_accounts)
+
+
+def read_parameter(param_name, default=''):
+    param_value = os.environ.get(param_name, '').strip() or default
+    print(f"INFO: {param_name} = {param_value}")
+    return param_value
+
+
+if __name__ == '__main__':
+    from ct2 import assume_master_role, assume_slave_role
+
+    master_role_arn = read_parameter('MasterRoleArn', 'arn:aws:iam::038462757316:role/cia_master_management_terraform_role-v2')
+    slave_role_name = read_parameter('SlaveRoleName', 'cloud_management_terraform-ec2-role-v2')
+    session_name = f"CIA-Collectors-{os.environ.get('BUILD_NUMBER', 'manual')}"
+    collector_names = [name.strip() for name in read_parameter('Collectors', ','.join(COLLECTOR_NAMES)).split(',') if name.strip()]
+    output_dir = read_parameter('OutputDir', '.')
+    account_workers = int(read_parameter('AccountWorkers', str(DEFAULT_ACCOUNT_WORKERS)))
+
+    accounts_file = read_parameter('AccountsFile')
+    if not accounts_file:
+        print("ERROR: AccountsFile is required")
+        sys.exit(1)
+    with open(accounts_file, 'r') as f:
+        account_ids = [line.strip() for line in f if line.strip() and not line.strip().startswith('#')]
+    try:
+        account_ids = select_shard(account_ids, read_parameter('Shard'), read_parameter('ShardHistory') or None)
+        # Filter="bucket.name~^prod-;region=eu-west-1" skips accounts and resources early, see filters.ResourceFilter.parse
+        resource_filter = parse_filter(read_parameter('Filter'))
+        account_ids = resource_filter.accounts(account_ids)
+        os.makedirs(output_dir, exist_ok=True)
+        # OutputFormat=parquet writes typed datasets partitioned by run date, account and region, auto does so for large runs
+        output_format = choose_output_format(read_parameter('OutputFormat', 'auto'), len(account_ids))
+        # Columns=bucket_name,encryption limits the reports and the API calls to those columns
+        # ResultsStore=/path/results.db appends every row to the store shared by all runs, see results_store.py for queries
+        store_path = read_parameter('ResultsStore')
+        store = ResultsStore(store_path, default_run_id('collectors')) if store_path else None
+        collectors = build_collectors(collector_names, output_dir, parse_columns(read_parameter('Columns')), resource_filter,
+                                      output_format, run_id=os.environ.get('BUILD_NUMBER'), store=store)
+    except ValueError as e:
+        print(f"ERROR: {str(e)}")
+        sys.exit(1)
+
+    master_session = assume_master_role(master_role_arn=master_role_arn, session_name=session_name)
+
+    def assume_account(account_id):
+        return assume_slave_role(slave_account_id=account_id, slave_role_name=slave_role_name, session_name=session_name,
+                                 master_role_arn=master_role_arn, master_session=clone_session(master_session))
+
+    if store:
+        store.start_run(','.join(collector_names))
+    run_status = 'failed'
+    try:
+        failed_accounts = run_collectors(account_ids, assume_account, collectors, account_workers=account_workers)
+        run_status = 'failed' if failed_accounts else 'success'
+    finally:
+        if store:
+            store.finish_run(run_status)
+            store.close()
+    if failed_accounts:
+        print(f"ERROR: {len(failed_accounts)} accounts could not be scanned: {', '.join(failed_accounts)}")
+        sys.exit(1)
+    print(f"SUCCESS: {len(account_ids)} accounts scanned with {', '.join(collector_names)}")
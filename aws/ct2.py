@@ -1,7 +1,12 @@
 import boto3
 import os
 import sys
-import csv
+
+from filters import ResourceFilter, parse_filter
+from projection import parse_columns, project_columns, required_calls
+from regions import bucket_region, run_region_collectors
+from sinks import CsvSink, choose_output_format
+from sharding import select_shard
 
 
 def assume_master_role(master_role_arn, session_name):
@@ -118,118 +123,148 @@ def read_parameter(param_name):
 
 
 
-def get_trail_event_selectors(slave_session, result):
+def get_region_trail_event_selectors(slave_session, region, trails, resource_filter=None):
+    """Fill in tags, status and event selectors. Trails whose tags fail resource_filter are dropped before the other calls"""
+    resource_filter = resource_filter or ResourceFilter()
     try:
-        for region, trails in result.items():
-            slave_cloudtrail = slave_session.client('cloudtrail', region_name=region)
-            for trail in trails:
+        slave_cloudtrail = slave_session.client('cloudtrail', region_name=region)
+        for trail in trails:
+            try:
                 try:
-                    try:
-                        cia_team_trail = 'No'
-                        trail_role_tag_value = 'Not Found'
-                        tags_response = slave_cloudtrail.list_tags(ResourceIdList=[trail['trail_arn']])
-                        tags = {}
-                        for resource in tags_response.get('ResourceTagList', []):
-                            if resource['ResourceId'] == trail['trail_arn']:
-                                for tag in resource.get('TagsList', []):
-                                    tags[tag['Key']] = tag['Value']
-                                    if tag['Key'].lower() == 'role':
-                                        trail_role_tag_value = tag['Value']
-                                        if 'cia' in tag['Value'].lower():
-                                            cia_team_trail = 'Yes'
-
-                        if trail_role_tag_value == 'Not Found':
-                            cia_team_trail = 'Yes'
-                    except Exception as e:
-                        print(f"ERROR: Listing tags for trail {trail['trail_arn']} failed: {e}")
-                        trail['comments'] = 'Error finding tags'
-                    
-                    trail['trail_role_tag_value'] = trail_role_tag_value
-                    trail['cia_team_trail'] = cia_team_trail
-                    trail['trail_tags'] = tags
-
-                    try:
-                        status = slave_cloudtrail.get_trail_status(Name=trail['trail_arn'])
-                        trail_status = status.get('IsLogging', 'Error')
-                    except Exception as e:
-                        print(f"ERROR: Unable to get trail status for {trail['trail_name']}: {str(e)}")
-                        trail['comments'] = 'Error finding trail status'
-                    selectors = slave_cloudtrail.get_event_selectors(TrailName=trail['trail_name'])
-
-                    has_management_events = False
-                    has_data_events = False
-                    management_events_read_write = "NA"
-                    data_events_read_write = "NA"
-
-
-                    # Check EventSelectors
-                    for selector in selectors.get('EventSelectors', []):
-                    # Check for management events
-                        if selector.get('IncludeManagementEvents', False):
-                            has_management_events = True
-                            management_events_read_write = selector.get('ReadWriteType', 'NA')
-
-                        # Check for data events
-                        if selector.get('DataResources', []):
-                            has_data_events = True
-
-                        # Check Advanced Event Selectors (newer method)
-                    advanced_selectors = selectors.get('AdvancedEventSelectors', [])
-                    if advanced_selectors:
-                        for selector in advanced_selectors:
-                            field_selectors = selector.get('FieldSelectors', [])
-                            for field in field_selectors:
-                                if field.get('Field') == 'eventCategory':
-                                    if 'Management' in field.get('Equals', []):
-                                        has_management_events = True
-                                    if 'Data' in field.get('Equals', []):
-                                        has_data_events = True
-                                    
-                            for field in field_selectors:
-                                if has_management_events:
-                                    if field.get('Field') == 'readOnly':
-                                        if 'true' in field.get('Equals', []):
-                                            management_events_read_write = "ReadOnly"
-                                        elif 'false' in field.get('Equals', []):
-                                            management_events_read_write = "WriteOnly"
-                                        else:
-                                            management_events_read_write = "All"
-                                if has_data_events:
-                                    if field.get('Field') == 'readOnly':
-                                        if 'true' in field.get('Equals', []):
-                                            data_events_read_write =  "ReadOnly"
-                                        elif 'false' in field.get('Equals', []):
-                                            data_events_read_write = "WriteOnly"
-                                        else:
-                                            data_events_read_write = "All"
-                            if has_data_events and data_events_read_write not in ["ReadOnly", "WriteOnly"]:
-                                data_events_read_write = "All"
-                            if has_management_events and management_events_read_write not in ["ReadOnly", "WriteOnly"]:
-                                management_events_read_write = "All"
-   
-
-
-                            
-                    trail['has_management_events'] = has_management_events
-                    trail['has_data_events'] = has_data_events
-                    trail['management_events_read_write'] = management_events_read_write
-                    trail['data_events_read_write'] = data_events_read_write
-                    trail['trail_status'] = trail_status
+                    cia_team_trail = 'No'
+                    trail_role_tag_value = 'Not Found'
+                    tags_response = slave_cloudtrail.list_tags(ResourceIdList=[trail['trail_arn']])
+                    tags = {}
+                    for resource in tags_response.get('ResourceTagList', []):
+                        if resource['ResourceId'] == trail['trail_arn']:
+                            for tag in resource.get('TagsList', []):
+                                tags[tag['Key']] = tag['Value']
+                                if tag['Key'].lower() == 'role':
+                                    trail_role_tag_value = tag['Value']
+                                    if 'cia' in tag['Value'].lower():
+                                        cia_team_trail = 'Yes'
+
+                    if trail_role_tag_value == 'Not Found':
+                        cia_team_trail = 'Yes'
                 except Exception as e:
-                    print(f"ERROR: Exception occurred while processing event selectors of trail {trail['Name']}: {str(e)}")
+                    print(f"ERROR: Listing tags for trail {trail['trail_arn']} failed: {e}")
+                    trail['comments'] = 'Error finding tags'
+
+                trail['trail_role_tag_value'] = trail_role_tag_value
+                trail['cia_team_trail'] = cia_team_trail
+                trail['trail_tags'] = tags
+                if not resource_filter.check('trail', tags=tags):
+                    trail['filtered_out'] = True
                     continue
+
+                try:
+                    status = slave_cloudtrail.get_trail_status(Name=trail['trail_arn'])
+                    trail_status = status.get('IsLogging', 'Error')
+                except Exception as e:
+                    print(f"ERROR: Unable to get trail status for {trail['trail_name']}: {str(e)}")
+                    trail['comments'] = 'Error finding trail status'
+                selectors = slave_cloudtrail.get_event_selectors(TrailName=trail['trail_name'])
+
+                has_management_events = False
+                has_data_events = False
+                management_events_read_write = "NA"
+                data_events_read_write = "NA"
+
+
+                # Check EventSelectors
+                for selector in selectors.get('EventSelectors', []):
+                # Check for management events
+                    if selector.get('IncludeManagementEvents', False):
+                        has_management_events = True
+                        management_events_read_write = selector.get('ReadWriteType', 'NA')
+
+                    # Check for data events
+                    if selector.get('DataResources', []):
+                        has_data_events = True
+
+                    # Check Advanced Event Selectors (newer method)
+                advanced_selectors = selectors.get('AdvancedEventSelectors', [])
+                if advanced_selectors:
+                    for selector in advanced_selectors:
+                        field_selectors = selector.get('FieldSelectors', [])
+                        for field in field_selectors:
+                            if field.get('Field') == 'eventCategory':
+                                if 'Management' in field.get('Equals', []):
+                                    has_management_events = True
+                                if 'Data' in field.get('Equals', []):
+                                    has_data_events = True
+
+                        for field in field_selectors:
+                            if has_management_events:
+                                if field.get('Field') == 'readOnly':
+                                    if 'true' in field.get('Equals', []):
+                                        management_events_read_write = "ReadOnly"
+                                    elif 'false' in field.get('Equals', []):
+                                        management_events_read_write = "WriteOnly"
+                                    else:
+                                        management_events_read_write = "All"
+                            if has_data_events:
+                                if field.get('Field') == 'readOnly':
+                                    if 'true' in field.get('Equals', []):
+                                        data_events_read_write =  "ReadOnly"
+                                    elif 'false' in field.get('Equals', []):
+                                        data_events_read_write = "WriteOnly"
+                                    else:
+                                        data_events_read_write = "All"
+                        if has_data_events and data_events_read_write not in ["ReadOnly", "WriteOnly"]:
+                            data_events_read_write = "All"
+                        if has_management_events and management_events_read_write not in ["ReadOnly", "WriteOnly"]:
+                            management_events_read_write = "All"
+
+
+
+
+                trail['has_management_events'] = has_management_events
+                trail['has_data_events'] = has_data_events
+                trail['management_events_read_write'] = management_events_read_write
+                trail['data_events_read_write'] = data_events_read_write
+                trail['trail_status'] = trail_status
+            except Exception as e:
+                print(f"ERROR: Exception occurred while processing event selectors of trail {trail['Name']}: {str(e)}")
+                continue
     except Exception as e:
         _, _, tb = sys.exc_info()
         lineno = tb.tb_lineno if tb else 'unknown'
         print(f"ERROR: Unable to find event selector details for trail of region {region}, Exception occurred at line {lineno}: {str(e)}")
     
+    return [trail for trail in trails if not trail.pop('filtered_out', False)]
+
+
+def get_trail_event_selectors(slave_session, result, slave_account_id=None, resource_filter=None):
+    """Collect tags, status and event selectors for every home region concurrently"""
+    def collect_region(session, region):
+        return get_region_trail_event_selectors(session, region, result[region], resource_filter)
+
+    collected = run_region_collectors(
+        slave_session,
+        collect_region,
+        account_id=slave_account_id,
+        regions=list(result.keys()),
+        service_name='cloudtrail'
+    )
+
+    # Trails homed in a region that is not enabled cannot be queried there
+    for region, trails in result.items():
+        if region in collected:
+            result[region] = collected[region]
+            continue
+        for trail in trails:
+            trail.setdefault('comments', f'Home region {region} not enabled or not reachable')
+
     return result
 
 
 
 
 
-def analyze_cloudtrail_costs(slave_session):
+def analyze_cloudtrail_costs(slave_session, slave_account_id=None, resource_filter=None):
+    """Trails by home region. Name and home region filters are applied before any per-trail call"""
+    resource_filter = resource_filter or ResourceFilter()
     slave_cloudtrail = slave_session.client('cloudtrail')
 
     response = slave_cloudtrail.describe_trails(includeShadowTrails=True)
@@ -238,6 +273,8 @@ def analyze_cloudtrail_costs(slave_session):
     result = {}
 
     for trail in response['trailList']:
+        if not resource_filter.check('trail', name=trail['Name'], region=trail['HomeRegion']):
+            continue
         row = {}
         row['trail_name'] = trail['Name']
         row['is_multi_region'] = trail['IsMultiRegionTrail']
@@ -259,58 +296,55 @@ def analyze_cloudtrail_costs(slave_session):
 
 
     # Get event selector information
-    result = get_trail_event_selectors(slave_session, result)
-    return result
-
+    result = get_trail_event_selectors(slave_session, result, slave_account_id=slave_account_id, resource_filter=resource_filter)
+    return {region: trails for region, trails in result.items() if trails}
+
+
+
+# Column order of trails.csv, fixed so rows can be written as soon as a trail is analyzed
+TRAIL_HEADERS = [
+    'account',
+    'trail_name',
+    'trail_status',
+    'region',
+    'cia_team_trail',
+    'trail_role_tag_value',
+    'trail_s3_bucket',
+    'has_data_events',
+    'data_events_read_write',
+    'has_management_events',
+    'management_events_read_write',
+    'has_insight_selector',
+    'is_multi_region',
+    'is_organization_trail',
+    'has_custome_event_selector',
+    'include_global_service_events',
+    'trail_arn',
+    'trail_tags',
+    'comments'
+]
+# Column types of the Parquet trails dataset, the other columns are strings
+TRAIL_COLUMN_TYPES = {
+    'trail_status': 'bool',
+    'cia_team_trail': 'bool',
+    'has_data_events': 'bool',
+    'has_management_events': 'bool',
+    'has_insight_selector': 'bool',
+    'is_multi_region': 'bool',
+    'is_organization_trail': 'bool',
+    'has_custome_event_selector': 'bool',
+    'include_global_service_events': 'bool',
+    'trail_tags': 'tags'
+}
 
 
 def trails_to_csv(trails_data, output_file='trails.csv'):
-    # Get all possible fields from the trail dictionaries
-    fields = set()
-    for account, regions in trails_data.items():
-        for region, trails in regions.items():
-            for trail in trails:
-                fields.update(trail.keys())
-
-    # Remove fields that will be handled separately to avoid duplicates
-    fields = fields - {'trail_name', 'trail_status', 'cia_team_trail', 'trail_role_tag_value', 'trail_s3_bucket', 'has_data_events', 'data_events_read_write', 'has_management_events', 'management_events_read_write', 'has_insight_selector', 'is_multi_region', 'is_organization_trail', 'trail_tags', 'comments'}
-
-    # Define column order with unique columns
-    base_columns = ['account', 'trail_name', 'trail_status', 'region', 'cia_team_trail', 'trail_role_tag_value', 'trail_s3_bucket', 'has_data_events', 'data_events_read_write', 'has_management_events', 'management_events_read_write', 'has_insight_selector', 'is_multi_region', 'is_organization_trail']
-    remaining_columns = sorted(list(fields))
-    remaining_columns.append('trail_tags')
-    remaining_columns.append('comments')
-
-    # Create final headers list with no duplicates
-    headers = []
-    seen = set()
-
-    # Add columns while checking for duplicates
-    for column in base_columns + remaining_columns:
-        if column not in seen and column.strip():  # Check if column name is not empty
-            headers.append(column)
-            seen.add(column)
-
-    with open(output_file, 'w', newline='') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=headers)
-        writer.writeheader()
-
+    with CsvSink(output_file, TRAIL_HEADERS) as sink:
         # Write each trail
         for account, regions in trails_data.items():
             for region, trails in regions.items():
                 for trail in trails:
-                    # Create row with basic info
-                    row = {
-                        'account': account,
-                        'region': region
-                    }
-
-                    # Add trail properties, handling any potential missing fields
-                    for key, value in trail.items():
-                        if key in headers:  # Only add if column exists in headers
-                            row[key] = value
-
-                    writer.writerow(row)
+                    sink.write(dict(trail, account=account, region=region))
 
     print(f"CSV file '{output_file}' has been created")
 
@@ -362,9 +396,20 @@ def get_s3_logging_status(s3_client, bucket_name):
             'target_prefix': 'Error check bucket logging status',
         }
 
-def analyze_s3_buckets(slave_session):
-    """Analyze S3 buckets and their configurations"""
+def analyze_s3_buckets(slave_session, columns=None, resource_filter=None):
+    """
+    Analyze S3 buckets and their configurations. columns restricts the work to the
+    s3_buckets.csv columns asked for, calls no requested column needs are skipped.
+    resource_filter drops buckets on name and creation date before any per-bucket call,
+    on region and tags right after the call that returns them.
+    """
     try:
+        resource_filter = resource_filter or ResourceFilter()
+        calls = required_calls(columns, S3_BUCKET_COLUMN_CALLS)
+        if resource_filter.needs('bucket', 'region'):
+            calls.add('get_bucket_location')
+        if resource_filter.needs('bucket', 'tags'):
+            calls.add('get_bucket_tagging')
         s3_client = slave_session.client('s3')
         result = []
 
@@ -373,6 +418,8 @@ def analyze_s3_buckets(slave_session):
 
         for bucket in response['Buckets']:
             bucket_name = bucket['Name']
+            if not resource_filter.check('bucket', name=bucket_name, created=bucket['CreationDate']):
+                continue
             bucket_info = {
                 'bucket_name': bucket_name,
                 'creation_date': bucket['CreationDate'].isoformat(),
@@ -388,40 +435,50 @@ def analyze_s3_buckets(slave_session):
 
             try:
                 # Get bucket location
-                location = s3_client.get_bucket_location(Bucket=bucket_name)
-                bucket_info['bucket_region'] = location.get('LocationConstraint') or 'us-east-1'
+                if 'get_bucket_location' in calls:
+                    location = s3_client.get_bucket_location(Bucket=bucket_name)
+                    bucket_info['bucket_region'] = bucket_region(location)
+                    if not resource_filter.check('bucket', region=bucket_info['bucket_region']):
+                        continue
 
                 # Get bucket tags
-                tags, role_tag_value, cia_team_bucket = get_s3_bucket_tags(s3_client, bucket_name)
-                bucket_info['bucket_tags'] = tags
-                bucket_info['bucket_role_tag_value'] = role_tag_value
-                bucket_info['cia_team_bucket'] = cia_team_bucket
+                if 'get_bucket_tagging' in calls:
+                    tags, role_tag_value, cia_team_bucket = get_s3_bucket_tags(s3_client, bucket_name)
+                    bucket_info['bucket_tags'] = tags
+                    bucket_info['bucket_role_tag_value'] = role_tag_value
+                    bucket_info['cia_team_bucket'] = cia_team_bucket
+                    if not resource_filter.check('bucket', tags=tags):
+                        continue
 
                 # Get versioning status
-                versioning = s3_client.get_bucket_versioning(Bucket=bucket_name)
-                bucket_info['versioning'] = versioning.get('Status', 'Disabled')
+                if 'get_bucket_versioning' in calls:
+                    versioning = s3_client.get_bucket_versioning(Bucket=bucket_name)
+                    bucket_info['versioning'] = versioning.get('Status', 'Disabled')
 
                 # Get lifecycle rules
-                try:
-                    lifecycle = s3_client.get_bucket_lifecycle_configuration(Bucket=bucket_name)
-                    bucket_info['lifecycle_rules'] = len(lifecycle.get('Rules', []))
-                except s3_client.exceptions.NoSuchLifecycleConfiguration:
-                    bucket_info['lifecycle_rules'] = 0
+                if 'get_bucket_lifecycle_configuration' in calls:
+                    try:
+                        lifecycle = s3_client.get_bucket_lifecycle_configuration(Bucket=bucket_name)
+                        bucket_info['lifecycle_rules'] = len(lifecycle.get('Rules', []))
+                    except s3_client.exceptions.NoSuchLifecycleConfiguration:
+                        bucket_info['lifecycle_rules'] = 0
 
                 
                 # Get encryption configuration
-                try:
-                    encryption = s3_client.get_bucket_encryption(Bucket=bucket_name)
-                    bucket_info['encryption'] = encryption['ServerSideEncryptionConfiguration']['Rules'][0]['ApplyServerSideEncryptionByDefault']['SSEAlgorithm']
-                except:
-                    bucket_info['encryption'] = 'Not configured'
+                if 'get_bucket_encryption' in calls:
+                    try:
+                        encryption = s3_client.get_bucket_encryption(Bucket=bucket_name)
+                        bucket_info['encryption'] = encryption['ServerSideEncryptionConfiguration']['Rules'][0]['ApplyServerSideEncryptionByDefault']['SSEAlgorithm']
+                    except:
+                        bucket_info['encryption'] = 'Not configured'
 
 
                 # Get server access logging status
-                logging_status = get_s3_logging_status(s3_client, bucket_name)
-                bucket_info['server_access_logging'] = logging_status['logging_enabled']
-                bucket_info['logging_target_bucket'] = logging_status['target_bucket']
-                bucket_info['logging_target_prefix'] = logging_status['target_prefix']
+                if 'get_bucket_logging' in calls:
+                    logging_status = get_s3_logging_status(s3_client, bucket_name)
+                    bucket_info['server_access_logging'] = logging_status['logging_enabled']
+                    bucket_info['logging_target_bucket'] = logging_status['target_bucket']
+                    bucket_info['logging_target_prefix'] = logging_status['target_prefix']
 
 
             except Exception as e:
@@ -438,35 +495,54 @@ def analyze_s3_buckets(slave_session):
 
 
 
-def s3_to_csv(s3_data, output_file='s3_buckets.csv'):
-    """Export S3 bucket information to CSV"""
-    # Define column order
-    headers = [
-        'account',
-        'bucket_name',
-        'bucket_region',
-        'creation_date',
-        'cia_team_bucket',
-        'bucket_role_tag_value',
-        'versioning',
-        'lifecycle_rules',
-        'encryption',
-        'server_access_logging',
-        'logging_target_bucket',
-        'logging_target_prefix',
-        'bucket_tags',
-        'comments'
-    ]
-
-    with open(output_file, 'w', newline='') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=headers)
-        writer.writeheader()
-
+# Column order of s3_buckets.csv
+S3_BUCKET_HEADERS = [
+    'account',
+    'bucket_name',
+    'bucket_region',
+    'creation_date',
+    'cia_team_bucket',
+    'bucket_role_tag_value',
+    'versioning',
+    'lifecycle_rules',
+    'encryption',
+    'server_access_logging',
+    'logging_target_bucket',
+    'logging_target_prefix',
+    'bucket_tags',
+    'comments'
+]
+S3_BUCKET_COLUMN_TYPES = {
+    'creation_date': 'timestamp',
+    'cia_team_bucket': 'bool',
+    'lifecycle_rules': 'int',
+    'bucket_tags': 'tags'
+}
+
+# API calls each s3_buckets.csv column depends on, the other columns come from list_buckets
+S3_BUCKET_COLUMN_CALLS = {
+    'bucket_region': ('get_bucket_location',),
+    'cia_team_bucket': ('get_bucket_tagging',),
+    'bucket_role_tag_value': ('get_bucket_tagging',),
+    'bucket_tags': ('get_bucket_tagging',),
+    'versioning': ('get_bucket_versioning',),
+    'lifecycle_rules': ('get_bucket_lifecycle_configuration',),
+    'encryption': ('get_bucket_encryption',),
+    'server_access_logging': ('get_bucket_logging',),
+    'logging_target_bucket': ('get_bucket_logging',),
+    'logging_target_prefix': ('get_bucket_logging',)
+}
+S3_BUCKET_KEY_COLUMNS = ['account', 'bucket_name']
+
+
+def s3_to_csv(s3_data, output_file='s3_buckets.csv', columns=None):
+    """Export S3 bucket information to CSV, only the given columns (plus account and bucket name) when columns is set"""
+    with CsvSink(output_file, project_columns(S3_BUCKET_HEADERS, columns, S3_BUCKET_KEY_COLUMNS)) as sink:
         for account, buckets in s3_data.items():
             for bucket in buckets:
                 row = {'account': account}
                 row.update(bucket)
-                writer.writerow(row)
+                sink.write(row)
 
     print(f"CSV file '{output_file}' has been created")
 
@@ -474,12 +550,14 @@ def s3_to_csv(s3_data, output_file='s3_buckets.csv'):
 
 
 
-def check_s3_object_monitoring(slave_session, bucket_name=None):
+def check_s3_object_monitoring(slave_session, bucket_name=None, resource_filter=None):
     """
     Check if S3 object-level monitoring is enabled for specific or all buckets
-    Returns dictionary of buckets with their monitoring status and details
+    Returns dictionary of buckets with their monitoring status and details.
+    Trails and buckets outside resource_filter are left out, trails before their selectors are read.
     """
     try:
+        resource_filter = resource_filter or ResourceFilter()
         cloudtrail = slave_session.client('cloudtrail')
         monitored_buckets = {}
 
@@ -489,8 +567,17 @@ def check_s3_object_monitoring(slave_session, bucket_name=None):
         for trail in trails['trailList']:
             trail_name = trail['Name']
             trail_arn = trail['TrailARN']
+            if not resource_filter.check('trail', name=trail_name, region=trail['HomeRegion']):
+                continue
 
             try:
+                if resource_filter.needs('trail', 'tags'):
+                    tags_response = slave_session.client('cloudtrail', region_name=trail['HomeRegion']).list_tags(ResourceIdList=[trail_arn])
+                    trail_tags = {tag['Key']: tag['Value'] for resource in tags_response.get('ResourceTagList', [])
+                                  if resource['ResourceId'] == trail_arn for tag in resource.get('TagsList', [])}
+                    if not resource_filter.check('trail', tags=trail_tags):
+                        continue
+
                 # Get event selectors
                 selectors = cloudtrail.get_event_selectors(TrailName=trail_name)
 
@@ -586,6 +673,8 @@ def check_s3_object_monitoring(slave_session, bucket_name=None):
                             all_buckets = s3.list_buckets()['Buckets']
                             for bucket in all_buckets:
                                 bucket_name = bucket['Name']
+                                if not resource_filter.check('bucket', name=bucket_name, created=bucket['CreationDate']):
+                                    continue
                                 if bucket_name not in monitored_buckets:
                                     monitored_buckets[bucket_name] = {
                                         'monitoring_enabled': True,
@@ -607,6 +696,35 @@ def check_s3_object_monitoring(slave_session, bucket_name=None):
                 print(f"Error processing trail {trail_name}: {str(e)}")
                 continue
 
+        monitored_buckets = {bucket: details for bucket, details in monitored_buckets.items()
+                             if resource_filter.check('bucket', name=bucket)}
+
+        # Selectors only name the buckets, the other bucket fields are fetched for the buckets left.
+        # A bucket whose field cannot be read (not listed in this account, location denied) does not match
+        needs_created = resource_filter.needs('bucket', 'created')
+        needs_region = resource_filter.needs('bucket', 'region')
+        needs_tags = resource_filter.needs('bucket', 'tags')
+        if monitored_buckets and (needs_created or needs_region or needs_tags):
+            s3 = slave_session.client('s3')
+            created = {bucket['Name']: bucket['CreationDate'] for bucket in s3.list_buckets()['Buckets']} if needs_created else {}
+            for bucket in list(monitored_buckets):
+                if needs_created and not resource_filter.check('bucket', created=created.get(bucket)):
+                    del monitored_buckets[bucket]
+                    continue
+                if needs_region:
+                    try:
+                        region = bucket_region(s3.get_bucket_location(Bucket=bucket))
+                    except Exception as e:
+                        print(f"ERROR: Unable to get location of bucket {bucket}: {str(e)}")
+                        region = None
+                    if not resource_filter.check('bucket', region=region):
+                        del monitored_buckets[bucket]
+                        continue
+                if needs_tags:
+                    tags, role_tag_value, _ = get_s3_bucket_tags(s3, bucket)
+                    if role_tag_value == 'Error checking Bucket tags' or not resource_filter.check('bucket', tags=tags):
+                        del monitored_buckets[bucket]
+
         # Convert set to list for JSON serialization
         for bucket in monitored_buckets:
             monitored_buckets[bucket]['read_write_type'] = list(monitored_buckets[bucket]['read_write_type'])
@@ -617,33 +735,35 @@ def check_s3_object_monitoring(slave_session, bucket_name=None):
         print(f"Error checking S3 object monitoring: {str(e)}")
         return {}
 
+S3_MONITORING_HEADERS = [
+    'account',
+    'bucket_name',
+    'monitoring_enabled',
+    'selector_type',
+    'read_write_types',
+    'monitoring_trails'
+]
+S3_MONITORING_COLUMN_TYPES = {'monitoring_enabled': 'bool'}
+
+
+def monitoring_row(bucket_name, details):
+    """s3_monitoring.csv row of one bucket from check_s3_object_monitoring"""
+    return {
+        'bucket_name': bucket_name,
+        'monitoring_enabled': details['monitoring_enabled'],
+        'selector_type': details['selector_type'],
+        'read_write_types': ', '.join(details['read_write_type']),
+        'monitoring_trails': ', '.join([f"{trail['trail_name']} ({trail['read_write_type']})"
+                                      for trail in details['monitoring_trails']])
+    }
+
+
 def export_s3_monitoring_to_csv(monitoring_data, output_file='s3__data_event_monitoring.csv'):
     """Export S3 monitoring information to CSV"""
-    headers = [
-        'account',
-        'bucket_name',
-        'monitoring_enabled',
-        'selector_type',
-        'read_write_types',
-        'monitoring_trails'
-    ]
-
-    with open(output_file, 'w', newline='') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=headers)
-        writer.writeheader()
-
+    with CsvSink(output_file, S3_MONITORING_HEADERS) as sink:
         for account, buckets in monitoring_data.items():
             for bucket_name, details in buckets.items():
-                row = {
-                    'account': account,
-                    'bucket_name': bucket_name,
-                    'monitoring_enabled': details['monitoring_enabled'],
-                    'selector_type': details['selector_type'],
-                    'read_write_types': ', '.join(details['read_write_type']),
-                    'monitoring_trails': ', '.join([f"{trail['trail_name']} ({trail['read_write_type']})"
-                                                  for trail in details['monitoring_trails']])
-                }
-                writer.writerow(row)
+                sink.write(dict(monitoring_row(bucket_name, details), account=account))
 
     print(f"CSV file '{output_file}' has been created")
 
@@ -658,29 +778,62 @@ if __name__ == '__main__':
     master_role_arn = f"arn:aws:iam::038462757316:role/cia_master_management_terraform_role-v2"
     slave_role_name = "cloud_management_terraform-ec2-role-v2"
     session_name = f"CIA-Terraform-Pipeline-CT"
-    slave_account_id = '038462757316'
+    slave_account_ids = ['038462757316']
 
-    result = {}
+    # AccountsFile lists one account per line (accounts.list format), Shard=i/N keeps this agent's share
+    accounts_file = os.environ.get('AccountsFile', '').strip()
+    if accounts_file:
+        with open(accounts_file, 'r') as f:
+            slave_account_ids = [line.strip() for line in f if line.strip() and not line.strip().startswith('#')]
+    try:
+        slave_account_ids = select_shard(slave_account_ids, os.environ.get('Shard', '').strip(),
+                                         os.environ.get('ShardHistory', '').strip() or None)
+    except ValueError as e:
+        print(f"ERROR: {str(e)}")
+        sys.exit(1)
 
+    # The collectors share one session per account and run side by side, accounts run concurrently too
+    from collectors import build_collectors, run_collectors, DEFAULT_ACCOUNT_WORKERS
+    from regions import clone_session
+    account_workers = int(os.environ.get('AccountWorkers', '').strip() or DEFAULT_ACCOUNT_WORKERS)
 
     master_session = assume_master_role(master_role_arn= master_role_arn, session_name=session_name)
-    slave_session = assume_slave_role(slave_account_id=slave_account_id, slave_role_name=slave_role_name, 
-                                           session_name=session_name, master_role_arn=master_role_arn, 
-                                           master_session=master_session)
 
+    # ResultsStore=/path/results.db also appends every row to the store shared by all runs
+    from results_store import ResultsStore, default_run_id
+    store_path = os.environ.get('ResultsStore', '').strip()
+    store = ResultsStore(store_path, default_run_id('ct2')) if store_path else None
 
-    if not slave_session:
-        sys.exit(1)
-    
+    def assume_account(slave_account_id):
+        return assume_slave_role(slave_account_id=slave_account_id, slave_role_name=slave_role_name,
+                                 session_name=session_name, master_role_arn=master_role_arn,
+                                 master_session=clone_session(master_session))
 
-    cloudtrail_data = {}
-    cloudtrail_data[slave_account_id] = analyze_cloudtrail_costs(slave_session)
-    trails_to_csv(cloudtrail_data, output_file='trails.csv')
-    
-    s3_data = {}
-    s3_data[slave_account_id] = analyze_s3_buckets(slave_session)
-    s3_to_csv(s3_data, output_file='s3_buckets.csv')
+    # Columns=bucket_name,encryption narrows s3_buckets.csv and skips the calls of the other columns
+    # Filter="trail.name~^org-;bucket.tag:env=prod" drops accounts, trails and buckets early, see filters.ResourceFilter.parse
+    try:
+        resource_filter = parse_filter(os.environ.get('Filter', ''))
+        slave_account_ids = resource_filter.accounts(slave_account_ids)
+        # OutputFormat=csv keeps the CSV reports, parquet (the default for large runs) writes typed datasets instead
+        collectors = build_collectors(['cloudtrail', 's3_buckets', 's3_monitoring'],
+                                      columns=parse_columns(os.environ.get('Columns', '')),
+                                      resource_filter=resource_filter,
+                                      output_format=choose_output_format(os.environ.get('OutputFormat', ''), len(slave_account_ids)),
+                                      run_id=os.environ.get('BUILD_NUMBER'),
+                                      store=store)
+    except ValueError as e:
+        print(f"ERROR: {str(e)}")
+        sys.exit(1)
 
-    s3_object_event_data = {}
-    s3_object_event_data[slave_account_id] = check_s3_object_monitoring(slave_session)
-    export_s3_monitoring_to_csv(s3_object_event_data, output_file='s3_monitoring.csv')
+    if store:
+        store.start_run('ct2')
+    run_status = 'failed'
+    try:
+        failed_accounts = run_collectors(slave_account_ids, assume_account, collectors, account_workers=account_workers)
+        run_status = 'failed' if failed_accounts else 'success'
+    finally:
+        if store:
+            store.finish_run(run_status)
+            store.close()
+    if failed_accounts:
+        sys.exit(1)
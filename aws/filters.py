@@ -0,0 +1,145 @@
+import re
+from datetime import date, datetime
+
+
+RESOURCE_KINDS = ('bucket', 'trail', 'role')
+DATE_OPERATORS = {
+    '>=': lambda value, limit: value >= limit,
+    '<=': lambda value, limit: value <= limit,
+    '>': lambda value, limit: value > limit,
+    '<': lambda value, limit: value < limit,
+    '=': lambda value, limit: value == limit
+}
+CLAUSE_PATTERN = re.compile(r'^(?P<negate>!)?\s*(?:(?P<kind>bucket|trail|role)\.)?'
+                            r'(?P<field>name|region|created|account|tag:[^=~!<>]+?)\s*'
+                            r'(?:(?P<operator>>=|<=|=|~|>|<)\s*(?P<value>.*))?$')
+
+
+def as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.fromisoformat(str(value).replace('Z', '+00:00')).date()
+
+
+class FilterClause:
+    """One condition of a filter expression, see ResourceFilter.parse"""
+
+    def __init__(self, kind, field, operator, value, negate=False, tag_key=None):
+        self.kind = kind
+        self.field = field
+        self.operator = operator
+        self.value = value
+        self.negate = negate
+        self.tag_key = tag_key
+
+    def test(self, value):
+        return self._test(value) != self.negate
+
+    def _test(self, value):
+        if self.field == 'name':
+            return self.value.search(value or '') is not None
+        if self.field in ('region', 'account'):
+            return value in self.value
+        if self.field == 'created':
+            return value is not None and DATE_OPERATORS[self.operator](as_date(value), self.value)
+        # tags: a {key: value} dict
+        tags = value or {}
+        if self.tag_key not in tags:
+            return False
+        if self.operator is None:
+            return True
+        if self.operator == '~':
+            return self.value.search(tags[self.tag_key]) is not None
+        return tags[self.tag_key] == self.value
+
+
+class ResourceFilter:
+    """
+    Conditions that accounts, buckets, trails and roles must all meet. Callers check each
+    field as soon as they hold it, so name and creation date are checked straight from the
+    listing, while region and tags wait for the call that returns them. An empty filter
+    lets everything through.
+    """
+
+    def __init__(self, clauses=()):
+        self.clauses = list(clauses)
+
+    @classmethod
+    def parse(cls, expression):
+        """
+        Clauses separated by ';', all of which must hold. Prefix a clause with bucket., trail. or
+        role. to scope it to one kind of resource and with ! to negate it.
+          name~REGEX                   resource name matches the regular expression
+          region=us-east-1,eu-west-1   bucket region or trail home region is one of these
+          created>=2024-01-01          creation date compared with >=, <=, >, < or =
+          tag:KEY / tag:KEY=VALUE / tag:KEY~REGEX
+          account=111111111111,222222222222
+        """
+        clauses = []
+        for text in (expression or '').split(';'):
+            text = text.strip()
+            if not text:
+                continue
+            match = CLAUSE_PATTERN.match(text)
+            if not match:
+                raise ValueError(f"Invalid filter clause '{text}'")
+            kind, field, operator, value = match.group('kind'), match.group('field'), match.group('operator'), (match.group('value') or '').strip()
+            negate = match.group('negate') is not None
+            tag_key = None
+
+            if field.startswith('tag:'):
+                tag_key = field[len('tag:'):].strip()
+                field = 'tags'
+                if operator not in (None, '=', '~'):
+                    raise ValueError(f"Invalid filter clause '{text}', tags take =, ~ or no value")
+                if operator == '~':
+                    value = re.compile(value)
+            elif field == 'name':
+                if operator != '~':
+                    raise ValueError(f"Invalid filter clause '{text}', expected name~REGEX")
+                value = re.compile(value)
+            elif field in ('region', 'account'):
+                if operator != '=':
+                    raise ValueError(f"Invalid filter clause '{text}', expected {field}=VALUE[,VALUE]")
+                value = {item.strip() for item in value.split(',') if item.strip()}
+            else:
+                if operator not in DATE_OPERATORS:
+                    raise ValueError(f"Invalid filter clause '{text}', expected created>=YYYY-MM-DD")
+                try:
+                    value = as_date(value)
+                except ValueError:
+                    raise ValueError(f"Invalid filter clause '{text}', '{value}' is not a date")
+            clauses.append(FilterClause(kind, field, operator, value, negate, tag_key))
+        return cls(clauses)
+
+    def needs(self, kind, field):
+        """Whether some clause reads this field of this kind of resource, so its data must be fetched"""
+        return any(clause.field == field and clause.kind in (None, kind) for clause in self.clauses)
+
+    def check(self, kind, **fields):
+        """False as soon as a clause on one of the given fields fails, clauses on other fields are left for later"""
+        for clause in self.clauses:
+            if clause.field == 'account' or clause.kind not in (None, kind) or clause.field not in fields:
+                continue
+            if not clause.test(fields[clause.field]):
+                return False
+        return True
+
+    def accounts(self, account_ids):
+        """Accounts that pass the account clauses, checked before any role is assumed"""
+        account_clauses = [clause for clause in self.clauses if clause.field == 'account']
+        return [account_id for account_id in account_ids if all(clause.test(account_id) for clause in account_clauses)]
+
+
+def parse_filter(expression):
+    try:
+        return ResourceFilter.parse(expression)
+    except re.error as e:
+        raise ValueError(f"Invalid regular expression in filter: {str(e)}")
+
+
+def tag_dict(tag_list):
+    """[{'Key': k, 'Value': v}] -> {k: v}"""
+    return {tag['Key']: tag['Value'] for tag in tag_list or []}
@@ -1,15 +1,37 @@
 #!/usr/bin/env python3
 
 
+import base64
 import boto3
+import hashlib
+import io
 import json
 import time
 import os
+import re
 import sys
+import tarfile
+import threading
+import zipfile
+import queue
 from time import sleep
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
 from arnparse import arnparse
 from datetime import datetime, timezone
 from botocore.exceptions import ClientError
+from regions import clone_session
+from backup_store import ContentAddressedStore, serialize_backup, s3_blob_key, s3_blob_reader, rebuild_backup
+from run_journal import RunJournal
+from access_advisor import AccessAdvisorCollector, summarize_service_last_accessed
+from sharding import parse_shard, select_shard
+from filters import ResourceFilter, parse_filter, tag_dict
+from results_store import ResultsStore, default_run_id
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 
 
@@ -126,6 +148,120 @@ def get_paginated_results(action, key, credentials, args=None):
         raise e
 
 
+# Shared by every IAM client handed out by get_iam_client, set up in __main__
+IAM_RATE_GOVERNOR = None
+IAM_READ_OPERATION_PREFIXES = ('get_', 'list_', 'generate_', 'simulate_')
+
+
+class TokenBucket:
+    """Token bucket that blocks until a token is available instead of failing"""
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class IamRateGovernor:
+    """
+    Separate read and write token buckets per account for every IAM call of the run.
+    Calls queue on the bucket rather than being throttled by IAM, and the time spent
+    waiting is recorded so the rates can be tuned.
+    """
+
+    def __init__(self, read_rate=10, write_rate=3, read_burst=20, write_burst=5):
+        self.limits = {'read': (read_rate, read_burst), 'write': (write_rate, write_burst)}
+        self.buckets = {}
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, account_id, kind):
+        key = (account_id, kind)
+        with self.lock:
+            if key not in self.buckets:
+                rate, burst = self.limits[kind]
+                self.buckets[key] = TokenBucket(rate, burst)
+                self.stats[key] = {'calls': 0, 'waited': 0.0}
+            bucket = self.buckets[key]
+
+        waited = bucket.acquire()
+        with self.lock:
+            self.stats[key]['calls'] += 1
+            self.stats[key]['waited'] += waited
+        return waited
+
+    def print_stats(self):
+        for (account_id, kind), counters in sorted(self.stats.items()):
+            print(f"INFO: IAM {kind} budget for account {account_id}: {counters['calls']} calls, "
+                  f"{counters['waited']:.1f}s spent waiting")
+
+
+class GovernedPaginator:
+    def __init__(self, paginator, governor, account_id):
+        self._paginator = paginator
+        self._governor = governor
+        self._account_id = account_id
+
+    def paginate(self, **kwargs):
+        # Each page is a separate request, take a token before asking for the next one
+        pages = iter(self._paginator.paginate(**kwargs))
+        while True:
+            self._governor.acquire(self._account_id, 'read')
+            try:
+                page = next(pages)
+            except StopIteration:
+                return
+            yield page
+
+
+class GovernedIamClient:
+    """IAM client proxy that takes a read or write token before every API operation"""
+
+    def __init__(self, client, governor, account_id):
+        self._client = client
+        self._governor = governor
+        self._account_id = account_id
+
+    def get_paginator(self, operation_name):
+        return GovernedPaginator(self._client.get_paginator(operation_name), self._governor, self._account_id)
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name not in self._client.meta.method_to_api_mapping:
+            return attr
+
+        kind = 'read' if name.startswith(IAM_READ_OPERATION_PREFIXES) else 'write'
+
+        def governed_call(*args, **kwargs):
+            self._governor.acquire(self._account_id, kind)
+            return attr(*args, **kwargs)
+        return governed_call
+
+
+def get_iam_client(slave_session, slave_account_id):
+    """IAM client for the account, rate limited when the run has a governor"""
+    slave_iam_client = slave_session.client('iam')
+    if IAM_RATE_GOVERNOR is None:
+        return slave_iam_client
+    return GovernedIamClient(slave_iam_client, IAM_RATE_GOVERNOR, slave_account_id)
+
+
 def get_instance_profile_details(delete_role_name, slave_iam_client, slave_account_id):
     # STEP 4: Get and validate instance profiles
     try:
@@ -205,7 +341,162 @@ def get_inline_policy_details(delete_role_name, slave_iam_client, slave_account_
         raise Exception(f"Error in get_inline_policy_details() at line {sys._getframe().f_lineno} for role {delete_role_name} in account {slave_account_id}: {str(e)}")
 
 
-def get_attached_policy_details(delete_role_name, slave_iam_client, slave_account_id):
+class PolicyDocumentCache:
+    """
+    LRU cache of managed policy documents keyed by (policy ARN, version id).
+    AWS managed documents are the same in every account and can also be kept in
+    cache_dir so later builds do not fetch them again. Customer managed entries are
+    dropped as soon as a different DefaultVersionId is seen for the policy.
+    """
+
+    def __init__(self, max_entries=2048, cache_dir=None):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.entries = OrderedDict()
+        self.default_versions = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def is_aws_managed(policy_arn):
+        return policy_arn.startswith('arn:aws:iam::aws:')
+
+    def _disk_path(self, policy_arn, version_id):
+        key = hashlib.sha256(f"{policy_arn}:{version_id}".encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _read_disk(self, policy_arn, version_id):
+        if not self.cache_dir or not self.is_aws_managed(policy_arn):
+            return None
+        try:
+            with open(self._disk_path(policy_arn, version_id), 'r') as f:
+                entry = json.load(f)
+            if entry.get('policy_arn') == policy_arn and entry.get('version_id') == version_id:
+                return entry['document']
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"WARNING: Ignoring unreadable policy cache entry for {policy_arn} {version_id}: {str(e)}")
+        return None
+
+    def _write_disk(self, policy_arn, version_id, document):
+        if not self.cache_dir or not self.is_aws_managed(policy_arn):
+            return
+        file_path = self._disk_path(policy_arn, version_id)
+        tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({'policy_arn': policy_arn, 'version_id': version_id, 'document': document}, f, sort_keys=True)
+            os.replace(tmp_path, file_path)
+        except Exception as e:
+            print(f"WARNING: Unable to persist policy cache entry for {policy_arn} {version_id}: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _store(self, policy_arn, version_id, document):
+        with self.lock:
+            self.entries[(policy_arn, version_id)] = document
+            self.entries.move_to_end((policy_arn, version_id))
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get(self, policy_arn, version_id):
+        with self.lock:
+            if not self.is_aws_managed(policy_arn):
+                known_version_id = self.default_versions.get(policy_arn)
+                if known_version_id and known_version_id != version_id:
+                    for key in [key for key in self.entries if key[0] == policy_arn]:
+                        del self.entries[key]
+                self.default_versions[policy_arn] = version_id
+
+            key = (policy_arn, version_id)
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+
+        document = self._read_disk(policy_arn, version_id)
+        if document is not None:
+            with self.lock:
+                self.disk_hits += 1
+            self._store(policy_arn, version_id, document)
+        return document
+
+    def get_document(self, slave_iam_client, policy_arn, version_id):
+        """Return the policy version document, calling get_policy_version only on a miss"""
+        document = self.get(policy_arn, version_id)
+        if document is not None:
+            return document
+
+        version_response = slave_iam_client.get_policy_version(
+            PolicyArn=policy_arn,
+            VersionId=version_id
+        )
+        if ('PolicyVersion' not in version_response or
+            'Document' not in version_response['PolicyVersion']):
+            print(f"CRITICAL: Invalid policy version response for policy {policy_arn}")
+            raise ValueError(f"Invalid policy version response for policy {policy_arn}")
+
+        document = version_response['PolicyVersion']['Document']
+        with self.lock:
+            self.misses += 1
+        self._store(policy_arn, version_id, document)
+        self._write_disk(policy_arn, version_id, document)
+        return document
+
+    def print_stats(self):
+        print(f"INFO: Policy document cache: {self.hits} memory hits, {self.disk_hits} disk hits, "
+              f"{self.misses} fetched, {len(self.entries)} entries held")
+
+
+def build_policy_details(policy_name, policy_arn, policy, policy_document):
+    """Shape a managed policy the way it is stored in the role backup"""
+    return {
+        'policy_name': policy_name,
+        'policy_arn': policy_arn,
+        'policy_description': policy.get('Description', ''),
+        'policy_tags': policy.get('Tags', []),
+        'policy_document': policy_document,
+        'policy_default_version_id': policy['DefaultVersionId'],
+        'policy_id': policy['PolicyId'],
+        'policy_path': policy['Path'],
+        'policy_permissions_boundary_usage_count': policy['PermissionsBoundaryUsageCount'],
+        'policy_create_date': policy['CreateDate'],
+        'policy_raw_data': policy
+    }
+
+
+def get_policy_details(policy_arn, policy_name, slave_iam_client, policy_cache=None):
+    # Get full policy details and the default version document
+    policy_response = slave_iam_client.get_policy(PolicyArn=policy_arn)
+    if 'Policy' not in policy_response:
+        print(f"CRITICAL: Invalid policy response for policy {policy_arn}")
+        raise ValueError(f"Invalid policy response for policy {policy_arn}")
+
+    policy_version_id = policy_response['Policy']['DefaultVersionId']
+
+    if policy_cache is not None:
+        policy_document = policy_cache.get_document(slave_iam_client, policy_arn, policy_version_id)
+        return build_policy_details(policy_name, policy_arn, policy_response['Policy'], policy_document)
+
+    version_response = slave_iam_client.get_policy_version(
+        PolicyArn=policy_arn,
+        VersionId=policy_version_id
+    )
+
+    if ('PolicyVersion' not in version_response or
+        'Document' not in version_response['PolicyVersion']):
+        print(f"CRITICAL: Invalid policy version response for policy {policy_arn}")
+        raise ValueError(f"Invalid policy version response for policy {policy_arn}")
+
+    return build_policy_details(policy_name, policy_arn, policy_response['Policy'], version_response['PolicyVersion']['Document'])
+
+
+def get_attached_policy_details(delete_role_name, slave_iam_client, slave_account_id, policy_cache=None):
     # STEP: Get and validate ALL attached policies
     try:
         all_attached_policies = get_paginated_results(
@@ -228,37 +519,7 @@ def get_attached_policy_details(delete_role_name, slave_iam_client, slave_accoun
             policy_arn = policy['PolicyArn']
             policy_name = policy['PolicyName']
             try:
-                # Get full policy details for customer managed policies
-                policy_response = slave_iam_client.get_policy(PolicyArn=policy_arn)
-                if 'Policy' not in policy_response:
-                    print(f"CRITICAL: Invalid policy response for policy {policy_arn}, role {delete_role_name} in account {slave_account_id}")
-                    raise ValueError(f"Invalid policy response for policy {policy_arn}, role {delete_role_name} in account {slave_account_id}")
-
-                policy_version_id = policy_response['Policy']['DefaultVersionId']
-
-                version_response = slave_iam_client.get_policy_version(
-                    PolicyArn=policy_arn,
-                    VersionId=policy_version_id
-                )
-
-                if ('PolicyVersion' not in version_response or
-                    'Document' not in version_response['PolicyVersion']):
-                    print(f"CRITICAL: Invalid policy version response for policy {policy_arn}, role {delete_role_name} in account {slave_account_id}")
-                    raise ValueError(f"Invalid policy version response for policy {policy_arn}, role {delete_role_name} in account {slave_account_id}")
-
-                policy_details = {
-                    'policy_name': policy_name,
-                    'policy_arn': policy_arn,
-                    'policy_description': policy_response['Policy'].get('Description', ''),
-                    'policy_tags': policy_response['Policy'].get('Tags', []),
-                    'policy_document': version_response['PolicyVersion']['Document'],
-                    'policy_default_version_id': policy_version_id,
-                    'policy_id': policy_response['Policy']['PolicyId'],
-                    'policy_path': policy_response['Policy']['Path'],
-                    'policy_permissions_boundary_usage_count': policy_response['Policy']['PermissionsBoundaryUsageCount'],
-                    'policy_create_date': policy_response['Policy']['CreateDate'],
-                    'policy_raw_data': policy_response['Policy'] 
-                }
+                policy_details = get_policy_details(policy_arn, policy_name, slave_iam_client, policy_cache=policy_cache)
             except Exception as e:
                 print(f"CRITICAL: Failed to get customer managed policy details for policy {policy_arn}, role {delete_role_name} in account {slave_account_id}: {e}")
                 raise Exception(f"Failed to get policy details for policy {policy_arn}, role {delete_role_name} in account {slave_account_id}: {e}")
@@ -299,6 +560,126 @@ def get_tag_details(delete_role_name, slave_iam_client, slave_account_id):
 
 
 
+def build_account_snapshot(slave_iam_client, slave_account_id):
+    """
+    Pull every role and managed policy of the account with a handful of paginated
+    get_account_authorization_details calls and index them by role name / policy ARN
+    """
+    print(f"INFO: Building IAM authorization snapshot for account {slave_account_id}")
+    snapshot = {
+        'account_id': slave_account_id,
+        'roles': {},
+        'policies': {},
+        'policy_tags': {},
+        'lock': threading.Lock()
+    }
+    try:
+        pages = 0
+        paginator = slave_iam_client.get_paginator('get_account_authorization_details')
+        for page in paginator.paginate(Filter=['Role', 'LocalManagedPolicy', 'AWSManagedPolicy']):
+            pages += 1
+            for role in page.get('RoleDetailList', []):
+                snapshot['roles'][role['RoleName']] = role
+            for policy in page.get('Policies', []):
+                snapshot['policies'][policy['Arn']] = policy
+    except ClientError as e:
+        error_code = e.response['Error']['Code']
+        error_message = e.response['Error']['Message']
+        print(f"ERROR: Unable to build IAM snapshot for account {slave_account_id} ({error_code}): {error_message}")
+        raise
+
+    print(f"INFO: IAM snapshot for account {slave_account_id} has {len(snapshot['roles'])} roles and "
+          f"{len(snapshot['policies'])} managed policies from {pages} API calls")
+    return snapshot
+
+
+def get_snapshot_policy_tags(policy_arn, account_snapshot, slave_iam_client):
+    # get_account_authorization_details does not return policy tags, fetch them once per policy
+    if policy_arn.startswith('arn:aws:iam::aws:'):
+        return []
+
+    with account_snapshot['lock']:
+        if policy_arn in account_snapshot['policy_tags']:
+            return account_snapshot['policy_tags'][policy_arn]
+
+    tags = get_paginated_results(
+        action='list_policy_tags',
+        key='Tags',
+        credentials=slave_iam_client,
+        args={'PolicyArn': policy_arn}
+    )
+    with account_snapshot['lock']:
+        account_snapshot['policy_tags'][policy_arn] = tags
+    return tags
+
+
+def get_snapshot_inline_policy_details(delete_role_name, role_detail, slave_account_id):
+    inline_policies = {}
+    for policy in role_detail.get('RolePolicyList', []):
+        if not all(key in policy for key in ['PolicyName', 'PolicyDocument']):
+            print(f"CRITICAL: Incomplete inline policy in snapshot for role {delete_role_name} in account {slave_account_id}")
+            raise ValueError(f"Incomplete inline policy in snapshot for role {delete_role_name} in account {slave_account_id}")
+        inline_policies[policy['PolicyName']] = {'policy_document': policy['PolicyDocument']}
+    return inline_policies
+
+
+def get_snapshot_attached_policy_details(delete_role_name, role_detail, account_snapshot, slave_iam_client, slave_account_id, policy_cache=None):
+    try:
+        role_details = {'aws_managed_policies' : {}, 'customer_managed_policies': {}}
+        for policy in role_detail.get('AttachedManagedPolicies', []):
+            if not all(key in policy for key in ['PolicyArn', 'PolicyName']):
+                print(f"CRITICAL: Incomplete policy information in snapshot for role {delete_role_name} in account {slave_account_id}")
+                raise ValueError(f"Incomplete policy information in snapshot for role {delete_role_name} in account {slave_account_id}")
+
+            policy_arn = policy['PolicyArn']
+            policy_name = policy['PolicyName']
+            managed_policy = account_snapshot['policies'].get(policy_arn)
+            if managed_policy is None:
+                # Not part of the snapshot (e.g. attached after it was taken), read it directly
+                print(f"WARNING: Policy {policy_arn} missing from snapshot of account {slave_account_id}, reading it directly")
+                policy_details = get_policy_details(policy_arn, policy_name, slave_iam_client, policy_cache=policy_cache)
+            else:
+                policy_version_id = managed_policy['DefaultVersionId']
+                default_versions = [version for version in managed_policy.get('PolicyVersionList', [])
+                                    if version.get('VersionId') == policy_version_id]
+                if not default_versions or 'Document' not in default_versions[0]:
+                    print(f"CRITICAL: Default version {policy_version_id} of policy {policy_arn} missing from snapshot of account {slave_account_id}")
+                    raise ValueError(f"Default version {policy_version_id} of policy {policy_arn} missing from snapshot of account {slave_account_id}")
+
+                # Same shape as get_policy returns
+                policy_raw_data = {key: value for key, value in managed_policy.items() if key != 'PolicyVersionList'}
+                policy_tags = get_snapshot_policy_tags(policy_arn, account_snapshot, slave_iam_client)
+                if policy_tags:
+                    policy_raw_data['Tags'] = policy_tags
+
+                policy_details = build_policy_details(policy_name, policy_arn, policy_raw_data, default_versions[0]['Document'])
+
+            if policy_arn.startswith('arn:aws:iam::aws:'):
+                role_details['aws_managed_policies'][policy_name] = policy_details
+            else:
+                role_details['customer_managed_policies'][policy_name] = policy_details
+        return role_details
+    except Exception as e:
+        print(f"CRITICAL: Error processing snapshot attached policies for role {delete_role_name} in account {slave_account_id}: {str(e)}")
+        raise Exception(f"Error processing snapshot attached policies for role {delete_role_name} in account {slave_account_id}: {str(e)}")
+
+
+def get_snapshot_instance_profile_details(delete_role_name, role_detail, slave_account_id):
+    instance_profiles = role_detail.get('InstanceProfileList', [])
+    required_profile_attrs = [
+        'Arn',
+        'InstanceProfileName',
+        'InstanceProfileId',
+        'Path',
+        'Roles'
+    ]
+    for profile in instance_profiles:
+        if not all(attr in profile for attr in required_profile_attrs):
+            print(f"CRITICAL: Incomplete instance profile information in snapshot for role {delete_role_name} in account {slave_account_id}")
+            raise ValueError(f"Incomplete instance profile information in snapshot for role {delete_role_name} in account {slave_account_id}")
+    return instance_profiles
+
+
 def check_role_deletion_criteria(delete_role_name, delete_role_details, slave_account_id, role_deletion_threshold_days):
     try:
         if not delete_role_details:
@@ -367,15 +748,60 @@ def check_role_deletion_criteria(delete_role_name, delete_role_details, slave_ac
         raise Exception(f"Failed to check deletion criteria for role {delete_role_name} in account {slave_account_id}: {str(e)}")
 
 
-def get_role_details(delete_role_name, slave_session, role_deletion_threshold_days, slave_account_id):
+def check_service_last_accessed_criteria(delete_role_name, service_last_accessed, slave_account_id, role_deletion_threshold_days):
+    """Access Advisor evidence: the role is still in use if any service was reached through it within the threshold"""
+    if service_last_accessed.get('job_status') != 'COMPLETED':
+        print(f"WARNING: No Access Advisor evidence for role {delete_role_name} in account {slave_account_id} "
+              f"({service_last_accessed.get('job_status')}: {service_last_accessed.get('error')}). Skipping Deletion for safety.....")
+        return False
+
+    current_time = datetime.now(timezone.utc)
+    for service in service_last_accessed.get('services_accessed', []):
+        last_authenticated = service['LastAuthenticated']
+        if isinstance(last_authenticated, str):
+            last_authenticated = datetime.fromisoformat(last_authenticated)
+        days_since_access = (current_time - last_authenticated).days
+        if days_since_access < role_deletion_threshold_days:
+            print(f"INFO: Role {delete_role_name} in account {slave_account_id} accessed {service['ServiceNamespace']} "
+                  f"{days_since_access} days ago in {service.get('LastAuthenticatedRegion', 'N/A')} "
+                  f"(threshold: {role_deletion_threshold_days} days)")
+            return False
+
+    print(f"INFO: Access Advisor shows no service access by role {delete_role_name} in account {slave_account_id} "
+          f"in the last {role_deletion_threshold_days} days ({service_last_accessed.get('services_evaluated', 0)} services evaluated)")
+    return True
+
+
+def get_role_details(delete_role_name, slave_session, role_deletion_threshold_days, slave_account_id, account_snapshot=None, policy_cache=None):
     print(f"INFO: Starting role details collection for role {delete_role_name} in account {slave_account_id}")
     print(f"INFO: Using deletion threshold of {role_deletion_threshold_days} days")
 
     try:
         # Initialize IAM client
-        slave_iam_client = slave_session.client('iam')
+        slave_iam_client = get_iam_client(slave_session, slave_account_id)
         print(f"INFO: Created IAM client for slave account {slave_account_id}")
 
+        role_detail = None
+        if account_snapshot is not None:
+            role_detail = account_snapshot['roles'].get(delete_role_name)
+            if role_detail is None:
+                print(f"ERROR: Role {delete_role_name} not found in snapshot of account {slave_account_id}")
+                raise Exception(f"Role {delete_role_name} not found in account {slave_account_id}")
+
+            # Snapshot record carries CreateDate and RoleLastUsed, so roles still in use never reach get_role
+            try:
+                if not check_role_deletion_criteria(
+                    delete_role_name=delete_role_name,
+                    delete_role_details=role_detail,
+                    slave_account_id=slave_account_id,
+                    role_deletion_threshold_days=role_deletion_threshold_days
+                ):
+                    print(f"INFO: Role {delete_role_name} does not meet deletion criteria in account {slave_account_id}")
+                    return False
+            except Exception as e:
+                print(f"ERROR: Failed to check deletion criteria for role {delete_role_name} in account {slave_account_id}: {str(e)}")
+                raise
+
         # Get role information
         print(f"INFO: Retrieving role information for {delete_role_name} in account {slave_account_id}")
         try:
@@ -417,29 +843,51 @@ def get_role_details(delete_role_name, slave_session, role_deletion_threshold_da
                 return False
         except Exception as e:
             print(f"ERROR: Failed to check deletion criteria for role {delete_role_name} in account {slave_account_id}: {str(e)}")
-            return False
+            raise
 
         # If role meets criteria, collect additional details
         try:
-            inline_policies = get_inline_policy_details(
-                delete_role_name=delete_role_name,
-                slave_iam_client=slave_iam_client,
-                slave_account_id=slave_account_id
-            )
-            attached_policies = get_attached_policy_details(
-                delete_role_name=delete_role_name,
-                slave_iam_client=slave_iam_client,
-                slave_account_id=slave_account_id
-            )
-            instance_profiles = get_instance_profile_details(
-                delete_role_name=delete_role_name,
-                slave_iam_client=slave_iam_client,
-                slave_account_id=slave_account_id
-            )
+            if role_detail is not None:
+                inline_policies = get_snapshot_inline_policy_details(
+                    delete_role_name=delete_role_name,
+                    role_detail=role_detail,
+                    slave_account_id=slave_account_id
+                )
+                attached_policies = get_snapshot_attached_policy_details(
+                    delete_role_name=delete_role_name,
+                    role_detail=role_detail,
+                    account_snapshot=account_snapshot,
+                    slave_iam_client=slave_iam_client,
+                    slave_account_id=slave_account_id,
+                    policy_cache=policy_cache
+                )
+                instance_profiles = get_snapshot_instance_profile_details(
+                    delete_role_name=delete_role_name,
+                    role_detail=role_detail,
+                    slave_account_id=slave_account_id
+                )
+            else:
+                inline_policies = get_inline_policy_details(
+                    delete_role_name=delete_role_name,
+                    slave_iam_client=slave_iam_client,
+                    slave_account_id=slave_account_id
+                )
+                attached_policies = get_attached_policy_details(
+                    delete_role_name=delete_role_name,
+                    slave_iam_client=slave_iam_client,
+                    slave_account_id=slave_account_id,
+                    policy_cache=policy_cache
+                )
+                instance_profiles = get_instance_profile_details(
+                    delete_role_name=delete_role_name,
+                    slave_iam_client=slave_iam_client,
+                    slave_account_id=slave_account_id
+                )
 
+            # Only a role that does not meet the criteria comes back empty, read errors raise
             if any(detail is None for detail in [inline_policies, attached_policies, instance_profiles]):
                 print(f"ERROR: Failed to collect complete policy details for role {delete_role_name}")
-                return False
+                raise Exception(f"Incomplete policy details for role {delete_role_name} in account {slave_account_id}")
 
             # Complete role details with policy information
             complete_role_details = {
@@ -476,23 +924,42 @@ def get_role_details(delete_role_name, slave_session, role_deletion_threshold_da
 
 
 
-def write_json_to_file(json_data, slave_account_id, delete_role_name, workspace):
+def serialize_role_backup(json_data):
+    """Serialize role details once, the same bytes are written to disk and uploaded to S3"""
+    return serialize_backup(json_data)
+
+
+def verify_backup_file(backup_file, backup_sha256):
+    """Check the file on disk holds exactly the bytes that were serialized"""
+    try:
+        if not os.path.exists(backup_file) or os.path.getsize(backup_file) == 0:
+            return False
+        with open(backup_file, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest() == backup_sha256
+    except OSError as e:
+        print(f"ERROR: Unable to read back backup file {backup_file}: {str(e)}")
+        return False
+
+
+def get_backup_file_name(slave_account_id, delete_role_name):
+    # Create a timestamp for the filename
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+
+    # Sanitize account ID and role name to ensure safe filename creation
+    safe_account_id = re.sub(r'[^a-zA-Z0-9_-]', '_', str(slave_account_id))
+    safe_role_name = re.sub(r'[^a-zA-Z0-9_-]', '_', str(delete_role_name))
+    return f"role_backup_{safe_account_id}_{safe_role_name}_{timestamp}.json"
+
+
+def write_json_to_file(json_data, slave_account_id, delete_role_name, workspace, backup_bytes=None):
     if not all([json_data, slave_account_id, delete_role_name, workspace]):
         print("ERROR: All parameters (json_data, slave_account_id, delete_role_name, workspace) are required")
         return None
         
     try:
-        # Create a timestamp for the filename
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        
         # Create account specific directory path
         account_dir = os.path.join(workspace, slave_account_id, 'json')  # Fixed 'json' string
         
-        # Sanitize filename components
-        # Sanitize account ID and role name to ensure safe filename creation
-        safe_account_id = re.sub(r'[^a-zA-Z0-9_-]', '_', str(slave_account_id))
-        safe_role_name = re.sub(r'[^a-zA-Z0-9_-]', '_', str(delete_role_name))
-        
         # Create directories if they don't exist
         try:
             os.makedirs(account_dir, exist_ok=True)
@@ -501,14 +968,16 @@ def write_json_to_file(json_data, slave_account_id, delete_role_name, workspace)
             return None
         
         # Create filename with account, role and timestamp
-        filename = f"role_backup_{safe_account_id}_{safe_role_name}_{timestamp}.json"
+        filename = get_backup_file_name(slave_account_id, delete_role_name)
         
         # Create full file path
         file_path = os.path.join(account_dir, filename)
         
         # Write JSON to file
-        with open(file_path, 'w') as f:
-            json.dump(json_data, f, indent=4, sort_keys=True, default=str)
+        if backup_bytes is None:
+            backup_bytes = serialize_role_backup(json_data)
+        with open(file_path, 'wb') as f:
+            f.write(backup_bytes)
             
         print(f"INFO: Successfully wrote role {delete_role_name} of account {slave_account_id} details to {file_path}")
         return file_path
@@ -598,11 +1067,117 @@ def zip_account_json_files(workspace, slave_account_id):
                 pass
         return None
 
-def upload_file_s3(bucket_name, file_name, file_content, max_retries = 3):
+class AccountBackupArchives:
+    """
+    One streaming archive per account. Backups are appended from memory as the backup
+    stage produces them, and each archive is closed once the last role of its account
+    has left the pipeline. archive_format is 'zip' (DEFLATE, same layout as
+    zip_account_json_files) or 'zstd' (tar stream with multi-threaded zstd compression).
+    """
+
+    def __init__(self, workspace, archive_format='zip', zstd_level=10, zstd_threads=-1):
+        if archive_format == 'zstd' and zstandard is None:
+            print("WARNING: zstandard module is not installed, falling back to zip archives")
+            archive_format = 'zip'
+        self.workspace = workspace
+        self.archive_format = archive_format
+        self.zstd_level = zstd_level
+        self.zstd_threads = zstd_threads
+        self.accounts = {}
+        self.lock = threading.Lock()
+
+    def _archive_path(self, slave_account_id):
+        extension = 'tar.zst' if self.archive_format == 'zstd' else 'zip'
+        return os.path.join(self.workspace, slave_account_id, f"role_backups_{slave_account_id}.{extension}")
+
+    def _open(self, slave_account_id):
+        archive_path = self._archive_path(slave_account_id)
+        os.makedirs(os.path.dirname(archive_path), exist_ok=True)
+        if self.archive_format == 'zstd':
+            compressor = zstandard.ZstdCompressor(level=self.zstd_level, threads=self.zstd_threads)
+            stream = compressor.stream_writer(open(archive_path, 'wb'))
+            return {'path': archive_path, 'stream': stream, 'writer': tarfile.open(fileobj=stream, mode='w|')}
+        return {'path': archive_path, 'stream': None, 'writer': zipfile.ZipFile(archive_path, 'w', zipfile.ZIP_DEFLATED)}
+
+    def open_account(self, slave_account_id):
+        with self.lock:
+            self.accounts[slave_account_id] = {'archive': None, 'pending': 0, 'sealed': False,
+                                               'closed': False, 'added': 0, 'lock': threading.Lock()}
+
+    def job_queued(self, slave_account_id):
+        with self.lock:
+            self.accounts[slave_account_id]['pending'] += 1
+
+    def add(self, slave_account_id, file_name, data):
+        state = self.accounts[slave_account_id]
+        arcname = os.path.join('json', file_name)  # Preserve directory structure in archive
+        with state['lock']:
+            if state['archive'] is None:
+                state['archive'] = self._open(slave_account_id)
+            writer = state['archive']['writer']
+            if self.archive_format == 'zstd':
+                info = tarfile.TarInfo(arcname)
+                info.size = len(data)
+                info.mtime = int(time.time())
+                writer.addfile(info, io.BytesIO(data))
+            else:
+                writer.writestr(arcname, data)
+            state['added'] += 1
+
+    def job_done(self, slave_account_id):
+        with self.lock:
+            state = self.accounts[slave_account_id]
+            state['pending'] -= 1
+            ready = state['sealed'] and state['pending'] == 0
+        if ready:
+            self.close(slave_account_id)
+
+    def seal_account(self, slave_account_id):
+        """No more roles will be queued for the account"""
+        with self.lock:
+            state = self.accounts[slave_account_id]
+            state['sealed'] = True
+            ready = state['pending'] == 0
+        if ready:
+            self.close(slave_account_id)
+
+    def close(self, slave_account_id):
+        state = self.accounts[slave_account_id]
+        with state['lock']:
+            if state['closed']:
+                return None
+            state['closed'] = True
+            archive = state['archive']
+            state['archive'] = None
+            if archive is None:
+                if not state['added']:
+                    print(f"WARNING: No backup archive created for account {slave_account_id}")
+                return None
+            try:
+                archive['writer'].close()
+                if archive['stream'] is not None:
+                    archive['stream'].close()
+                print(f"SUCCESS: Created backup archive for account {slave_account_id} with {state['added']} roles at {archive['path']}")
+                return archive['path']
+            except Exception as e:
+                print(f"ERROR: Failed to close backup archive for account {slave_account_id}: {str(e)}")
+                return None
+
+    def close_all(self):
+        for slave_account_id in list(self.accounts):
+            self.close(slave_account_id)
+
+
+def upload_file_s3(bucket_name, file_name, file_content, max_retries = 3, s3_client=None, checksum_sha256=None):
+    # Reuse one client across attempts and uploads instead of building a new one each time
+    s3 = s3_client or get_worker_s3_client()
+    put_args = {'Bucket': bucket_name, 'Key': file_name, 'Body': file_content}
+    if checksum_sha256:
+        # S3 rejects the upload if the received bytes do not match the hash
+        put_args['ChecksumSHA256'] = base64.b64encode(bytes.fromhex(checksum_sha256)).decode('ascii')
     for attempt in range(max_retries):
         try:
-            s3 = boto3.client('s3', region_name='ap-northeast-2')
-            s3.put_object(Bucket=bucket_name, Key=file_name, Body=file_content)
+            s3.put_object(**put_args)
             print(f"INFO: Successfully uploaded {file_name} to {bucket_name}")
             return True
         except ClientError as e:
@@ -621,13 +1196,13 @@ def upload_file_s3(bucket_name, file_name, file_content, max_retries = 3):
 
 
 
-def read_parameter(param_name):
+def read_parameter(param_name, default=''):
     if not param_name:
         print("ERROR: Parameter name cannot be empty")
         sys.exit(1)
 
     try:
-        param_value = os.environ.get(param_name, '').strip()
+        param_value = os.environ.get(param_name, default).strip()
         print(f"INFO: {param_name} = {param_value}")
         if not param_value:
             print(f"WARNING: Parameter '{param_name}' is empty or not set")
@@ -681,6 +1256,155 @@ def read_account_file(file):
         sys.exit(1)
 
 
+# Service linked roles can only be removed through their service, never through delete_role
+DISCOVERY_EXCLUDED_PATHS = ['/aws-service-role/']
+
+
+def list_org_accounts(master_session):
+    """Active accounts of the organization the master account manages"""
+    org_client = master_session.client('organizations')
+    account_ids = []
+    for page in org_client.get_paginator('list_accounts').paginate():
+        account_ids.extend(account['Id'] for account in page['Accounts'] if account['Status'] == 'ACTIVE')
+    return sorted(account_ids)
+
+
+def parse_tag_filters(value):
+    """'keep,owner=platform' -> [('keep', None), ('owner', 'platform')]"""
+    tag_filters = []
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        key, _, tag_value = item.partition('=')
+        tag_filters.append((key.strip(), tag_value.strip() if tag_value else None))
+    return tag_filters
+
+
+def role_matches_tag_filters(tags, tag_filters):
+    role_tags = {tag['Key']: tag['Value'] for tag in tags or []}
+    return any(key in role_tags and (tag_value is None or role_tags[key] == tag_value) for key, tag_value in tag_filters)
+
+
+def prefilter_role(role, role_deletion_threshold_days, excluded_paths, protected_roles, current_time, resource_filter=None):
+    """Checks that need nothing beyond the list_roles record. Returns the reason to skip the role, or None"""
+    if role['RoleName'] in protected_roles:
+        return 'protected'
+    if any(role.get('Path', '/').startswith(path) for path in excluded_paths):
+        return 'path'
+    if (current_time - role['CreateDate']).days <= role_deletion_threshold_days:
+        return 'age'
+    if resource_filter and not resource_filter.check('role', name=role['RoleName'], created=role['CreateDate']):
+        return 'filter'
+    return None
+
+
+def build_candidate(slave_account_id, role, current_time):
+    last_used_date = role.get('RoleLastUsed', {}).get('LastUsedDate')
+    return {
+        'account_id': slave_account_id,
+        'role_name': role['RoleName'],
+        'idle_days': (current_time - (last_used_date or role['CreateDate'])).days,
+        'last_used': last_used_date.date().isoformat() if last_used_date else 'never',
+        'created': role['CreateDate'].date().isoformat()
+    }
+
+
+def discover_account_roles(slave_session, slave_account_id, role_deletion_threshold_days, excluded_paths, excluded_tags, protected_roles, max_workers=4,
+                           resource_filter=None):
+    """
+    Stream list_roles and call get_role only for roles that pass the prefilters.
+    list_roles carries neither Tags nor RoleLastUsed, so the tag filters and the
+    deletion criteria run on the get_role response.
+    """
+    resource_filter = resource_filter or ResourceFilter()
+    slave_iam_client = get_iam_client(slave_session, slave_account_id)
+    current_time = datetime.now(timezone.utc)
+    skipped = {'protected': 0, 'path': 0, 'age': 0, 'filter': 0, 'tag': 0, 'criteria': 0, 'error': 0}
+    listed = 0
+    candidates = []
+
+    def inspect_role(role_name):
+        role = slave_iam_client.get_role(RoleName=role_name)['Role']
+        if excluded_tags and role_matches_tag_filters(role.get('Tags'), excluded_tags):
+            return 'tag', None
+        if not resource_filter.check('role', tags=tag_dict(role.get('Tags'))):
+            return 'filter', None
+        if not check_role_deletion_criteria(
+            delete_role_name=role_name,
+            delete_role_details=role,
+            slave_account_id=slave_account_id,
+            role_deletion_threshold_days=role_deletion_threshold_days
+        ):
+            return 'criteria', None
+        return None, build_candidate(slave_account_id, role, current_time)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for page in slave_iam_client.get_paginator('list_roles').paginate():
+            for role in page['Roles']:
+                listed += 1
+                reason = prefilter_role(role, role_deletion_threshold_days, excluded_paths, protected_roles, current_time, resource_filter)
+                if reason:
+                    skipped[reason] += 1
+                    continue
+                futures[executor.submit(inspect_role, role['RoleName'])] = role['RoleName']
+
+        for future in as_completed(futures):
+            try:
+                reason, candidate = future.result()
+            except Exception as e:
+                print(f"ERROR: Failed to inspect role {futures[future]} in account {slave_account_id}: {str(e)}")
+                skipped['error'] += 1
+                continue
+            if reason:
+                skipped[reason] += 1
+            else:
+                candidates.append(candidate)
+
+    print(f"INFO: Account {slave_account_id}: {listed} roles listed, {len(futures)} read with get_role, "
+          f"{len(candidates)} candidates, skipped " + ', '.join(f"{reason} {count}" for reason, count in skipped.items()))
+    return candidates
+
+
+def discover_candidates(account_ids, master_session, slave_role_name, session_name, master_role_arn, role_deletion_threshold_days,
+                        excluded_paths, excluded_tags, account_workers=8, role_workers=4, resource_filter=None):
+    """Run discover_account_roles for every account concurrently and rank the candidates, longest idle first"""
+    protected_roles = {slave_role_name, arnparse(master_role_arn).resource}
+    resource_filter = resource_filter or ResourceFilter()
+
+    def discover_account(slave_account_id):
+        slave_session = assume_slave_role(slave_account_id=slave_account_id, slave_role_name=slave_role_name,
+                                          session_name=session_name, master_role_arn=master_role_arn,
+                                          master_session=clone_session(master_session))
+        return discover_account_roles(slave_session, slave_account_id, role_deletion_threshold_days,
+                                      excluded_paths, excluded_tags, protected_roles, max_workers=role_workers,
+                                      resource_filter=resource_filter)
+
+    candidates = []
+    with ThreadPoolExecutor(max_workers=account_workers) as executor:
+        futures = {executor.submit(discover_account, slave_account_id): slave_account_id
+                   for slave_account_id in resource_filter.accounts(account_ids)}
+        for future in as_completed(futures):
+            try:
+                candidates.extend(future.result())
+            # assume_slave_role exits on failure, which must not end the scan of the other accounts
+            except (Exception, SystemExit) as e:
+                print(f"ERROR: Discovery failed for account {futures[future]}: {str(e)}")
+
+    candidates.sort(key=lambda candidate: (-candidate['idle_days'], candidate['account_id'], candidate['role_name']))
+    return candidates
+
+
+def write_candidate_file(candidates, file):
+    """Write candidates as account,role lines readable by read_account_file, ranking details in the trailing columns"""
+    with open(file, 'w') as candidate_file:
+        for candidate in candidates:
+            candidate_file.write(f"{candidate['account_id']},{candidate['role_name']},{candidate['idle_days']},"
+                                 f"{candidate['last_used']},{candidate['created']}\n")
+    print(f"SUCCESS: Wrote {len(candidates)} role candidates to {file}")
+
+
 
 
 def remove_instance_profiles(delete_role_name, instance_profiles, slave_iam_client, slave_account_id):
@@ -758,7 +1482,71 @@ def verify_role_deletion(delete_role_name, slave_iam_client, slave_account_id):
         print(f"ERROR: Failed to verify role {delete_role_name} deletion for account {slave_account_id}: {str(e)}")
         return False
 
-def delete_role_safely(delete_role_name, delete_role_details, slave_session, role_deletion_threshold_days, slave_account_id):
+def wait_for_role_deletion(delete_role_name, slave_iam_client, slave_account_id, max_attempts=5, base_delay=1, max_delay=8):
+    """Poll verify_role_deletion with capped exponential backoff"""
+    for attempt in range(max_attempts):
+        if verify_role_deletion(
+            delete_role_name=delete_role_name,
+            slave_iam_client=slave_iam_client,
+            slave_account_id=slave_account_id
+        ):
+            return True
+        if attempt < max_attempts - 1:
+            delay = min(base_delay * (2 ** attempt), max_delay)
+            print(f"INFO: Role {delete_role_name} in account {slave_account_id} still visible, checking again in {delay}s (attempt {attempt + 1}/{max_attempts})")
+            time.sleep(delay)
+    return False
+
+
+def run_step_graph(steps, max_workers=4):
+    """
+    Run steps concurrently while honouring their dependencies.
+
+    steps maps a step name to {'action', 'description', 'depends_on'}. A step starts once
+    every step in depends_on succeeded; if one of them failed the step is not run.
+    Failures are reported per step the same way the sequential cleanup did.
+    Returns a dictionary of step name -> True/False.
+    """
+    results = {}
+    pending = dict(steps)
+    running = {}
+
+    def run_step(name, step):
+        try:
+            if not step['action']():
+                print(f"ERROR: Failed to {step['description']} ({name})")
+                return False
+            return True
+        except Exception as e:
+            print(f"ERROR: {step['description']} ({name}) failed: {str(e)}")
+            return False
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        while pending or running:
+            for name in list(pending):
+                depends_on = pending[name].get('depends_on', [])
+                if any(results.get(dependency) is False for dependency in depends_on):
+                    print(f"ERROR: Skipping {pending[name]['description']} ({name}), a step it depends on failed")
+                    results[name] = False
+                    del pending[name]
+                elif all(results.get(dependency) for dependency in depends_on):
+                    running[executor.submit(run_step, name, pending.pop(name))] = name
+
+            if not running:
+                # Dependencies that can never be satisfied (unknown step names)
+                for name in pending:
+                    print(f"ERROR: Unable to schedule {pending[name]['description']} ({name}), unresolved dependencies")
+                    results[name] = False
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[running.pop(future)] = future.result()
+
+    return results
+
+
+def delete_role_safely(delete_role_name, delete_role_details, slave_session, role_deletion_threshold_days, slave_account_id, max_workers=4, on_deleted=None):
     if not delete_role_details:
         print(f"ERROR: No role details provided for role {delete_role_name} deletion in account {slave_account_id}")
         return False
@@ -780,82 +1568,96 @@ def delete_role_safely(delete_role_name, delete_role_details, slave_session, rol
             ):
                 print(f"INFO: Role {delete_role_name} does not meet deletion criteria in account {slave_account_id}")
                 return False
+            if 'role_service_last_accessed' in delete_role_details and not check_service_last_accessed_criteria(
+                delete_role_name=delete_role_name,
+                service_last_accessed=delete_role_details['role_service_last_accessed'],
+                slave_account_id=slave_account_id,
+                role_deletion_threshold_days=role_deletion_threshold_days
+            ):
+                print(f"INFO: Role {delete_role_name} does not meet Access Advisor criteria in account {slave_account_id}")
+                return False
         except Exception as e:
             print(f"ERROR: Failed to check deletion criteria for role {delete_role_name} in account {slave_account_id}: {str(e)}")
             return False
 
         # Create IAM client only if role meets deletion criteria
         try:
-            slave_iam_client = slave_session.client('iam')
+            slave_iam_client = get_iam_client(slave_session, slave_account_id)
         except Exception as e:
             print(f"ERROR: Failed to create IAM client for account {slave_account_id} while checking role {delete_role_name}: {str(e)}")
             return False
 
 
         
-        # Sequential cleanup with proper error handling
-        cleanup_steps = [
-            {
-                'action': lambda: remove_instance_profiles(
+        # Every attachment is removed by its own step so they run concurrently,
+        # delete_role waits for all of them
+        cleanup_steps = {}
+        for profile in delete_role_details.get('role_instance_profiles', []):
+            cleanup_steps[f"instance_profile:{profile.get('InstanceProfileName')}"] = {
+                'action': lambda profile=profile: remove_instance_profiles(
                     delete_role_name=delete_role_name,
-                    instance_profiles=delete_role_details.get('role_instance_profiles', []),
+                    instance_profiles=[profile],
                     slave_iam_client=slave_iam_client,
                     slave_account_id=slave_account_id
                 ),
                 'description': 'Remove instance profiles'
-            },
-            {
-                'action': lambda: detach_managed_policies(
+            }
+        for policy_name, policy_info in delete_role_details.get('role_aws_managed_policies', {}).items():
+            cleanup_steps[f"aws_managed:{policy_name}"] = {
+                'action': lambda policy_name=policy_name, policy_info=policy_info: detach_managed_policies(
                     delete_role_name=delete_role_name,
-                    policy_details=delete_role_details.get('role_aws_managed_policies', {}),
+                    policy_details={policy_name: policy_info},
                     slave_iam_client=slave_iam_client,
                     policy_type='AWS managed',
                     slave_account_id=slave_account_id
                 ),
                 'description': 'Detach AWS managed policies'
-            },
-            {
-                'action': lambda: detach_managed_policies(
+            }
+        for policy_name, policy_info in delete_role_details.get('role_customer_managed_policies', {}).items():
+            cleanup_steps[f"customer_managed:{policy_name}"] = {
+                'action': lambda policy_name=policy_name, policy_info=policy_info: detach_managed_policies(
                     delete_role_name=delete_role_name,
-                    policy_details=delete_role_details.get('role_customer_managed_policies', {}),
+                    policy_details={policy_name: policy_info},
                     slave_iam_client=slave_iam_client,
                     policy_type='customer managed',
                     slave_account_id=slave_account_id
                 ),
                 'description': 'Detach customer managed policies'
-            },
-            {
-                'action': lambda: delete_inline_policies(
+            }
+        for policy_name, policy_info in delete_role_details.get('role_inline_policies', {}).items():
+            cleanup_steps[f"inline:{policy_name}"] = {
+                'action': lambda policy_name=policy_name, policy_info=policy_info: delete_inline_policies(
                     delete_role_name=delete_role_name,
-                    inline_policies=delete_role_details.get('role_inline_policies', {}),
+                    inline_policies={policy_name: policy_info},
                     slave_iam_client=slave_iam_client,
                     slave_account_id=slave_account_id
                 ),
                 'description': 'Delete inline policies'
             }
-        ]
-
-        # Execute cleanup steps
-        for step in cleanup_steps:
-            try:
-                if not step['action']():
-                    print(f"ERROR: Failed to {step['description']} for role {delete_role_name} in account {slave_account_id}")
-                    return False
-            except Exception as e:
-                print(f"ERROR: {step['description']} failed for role {delete_role_name} in account {slave_account_id}: {str(e)}")
-                return False
 
-        # Delete the role
-        try:
+        def delete_role():
             print(f"INFO: Deleting role {delete_role_name} in account {slave_account_id}")
             slave_iam_client.delete_role(RoleName=delete_role_name)
-        except Exception as e:
-            print(f"ERROR: Failed to delete role {delete_role_name} in account {slave_account_id}: {str(e)}")
+            if on_deleted is not None:
+                on_deleted()
+            return True
+
+        cleanup_steps['delete_role'] = {
+            'action': delete_role,
+            'description': 'Delete role',
+            'depends_on': [name for name in cleanup_steps]
+        }
+
+        step_results = run_step_graph(cleanup_steps, max_workers=max_workers)
+        if not step_results.get('delete_role'):
+            for name, succeeded in step_results.items():
+                if not succeeded:
+                    print(f"ERROR: Failed to {cleanup_steps[name]['description']} ({name}) for role {delete_role_name} in account {slave_account_id}")
             return False
 
-        # Verify deletion
+        # Verify deletion, IAM is eventually consistent so give it a few tries
         try:
-            if verify_role_deletion(
+            if wait_for_role_deletion(
                 delete_role_name=delete_role_name,
                 slave_iam_client=slave_iam_client,
                 slave_account_id=slave_account_id
@@ -875,6 +1677,711 @@ def delete_role_safely(delete_role_name, delete_role_details, slave_session, rol
 
 
 
+ROLE_BACKUP_NAME_PATTERN = re.compile(r'^role_backup_(\d{12})_(.+)_(\d{8}_\d{6})(\.manifest)?\.json$')
+ROLE_BACKUP_PREFIX = 'role_backups'
+
+
+def find_local_role_backups(restore_path):
+    """Backup files (full JSON or backup store manifests) under restore_path as (account, role, timestamp, loader)"""
+    backups = []
+    for root, _, files in os.walk(restore_path):
+        for file_name in files:
+            match = ROLE_BACKUP_NAME_PATTERN.match(file_name)
+            if not match:
+                continue
+            file_path = os.path.join(root, file_name)
+            if match.group(4):
+                # <store>/manifests/<account>/<name>.manifest.json
+                store_dir = os.path.dirname(os.path.dirname(os.path.dirname(file_path)))
+                loader = lambda file_path=file_path, store_dir=store_dir: ContentAddressedStore(store_dir).rebuild(file_path)
+            else:
+                def loader(file_path=file_path):
+                    with open(file_path, 'rb') as f:
+                        return f.read()
+            backups.append((match.group(1), match.group(2), match.group(3), loader))
+    return backups
+
+
+def find_s3_role_backups(s3_client, bucket_name, prefix):
+    """Same as find_local_role_backups for the uploaded backups under an S3 prefix"""
+    backups = []
+    blob_prefix = f"{ROLE_BACKUP_PREFIX}/blobs/"
+    get_blob = s3_blob_reader(s3_client, bucket_name, ROLE_BACKUP_PREFIX)
+    for page in s3_client.get_paginator('list_objects_v2').paginate(Bucket=bucket_name, Prefix=prefix):
+        for s3_object in page.get('Contents', []):
+            key = s3_object['Key']
+            match = ROLE_BACKUP_NAME_PATTERN.match(os.path.basename(key))
+            if key.startswith(blob_prefix) or not match:
+                continue
+
+            def loader(key=key, is_manifest=bool(match.group(4))):
+                content = s3_client.get_object(Bucket=bucket_name, Key=key)['Body'].read()
+                return rebuild_backup(json.loads(content), get_blob) if is_manifest else content
+            backups.append((match.group(1), match.group(2), match.group(3), loader))
+    return backups
+
+
+def latest_role_backups(backups, account_ids=None, role_name=None):
+    """Keep the most recent backup of every role, optionally only for some accounts or one role"""
+    latest = {}
+    for slave_account_id, safe_role_name, timestamp, loader in backups:
+        if account_ids is not None and slave_account_id not in account_ids:
+            continue
+        if role_name and safe_role_name != re.sub(r'[^a-zA-Z0-9_-]', '_', role_name):
+            continue
+        key = (slave_account_id, safe_role_name)
+        if key not in latest or timestamp > latest[key][0]:
+            latest[key] = (timestamp, loader)
+    return {key: loader for key, (_, loader) in sorted(latest.items())}
+
+
+def ensure_role(role_backup, slave_iam_client, slave_account_id):
+    """Create the role from its backup, or bring an existing role back in line with it"""
+    role_name = role_backup['role_name']
+    trust_policy = json.dumps(role_backup['role_trust_relationship'])
+    tags = role_backup.get('role_tags') or []
+    boundary_arn = role_backup.get('role_permissions_boundary_arn')
+
+    create_args = {'RoleName': role_name, 'Path': role_backup['role_path'], 'AssumeRolePolicyDocument': trust_policy}
+    if role_backup.get('role_description'):
+        create_args['Description'] = role_backup['role_description']
+    if role_backup.get('role_max_session'):
+        create_args['MaxSessionDuration'] = role_backup['role_max_session']
+    if tags:
+        create_args['Tags'] = tags
+    if boundary_arn:
+        create_args['PermissionsBoundary'] = boundary_arn
+
+    try:
+        slave_iam_client.create_role(**create_args)
+        print(f"INFO: Created role {role_name} in account {slave_account_id}")
+        return True
+    except slave_iam_client.exceptions.EntityAlreadyExistsException:
+        print(f"INFO: Role {role_name} already exists in account {slave_account_id}, applying backup settings to it")
+
+    slave_iam_client.update_assume_role_policy(RoleName=role_name, PolicyDocument=trust_policy)
+    update_args = {'RoleName': role_name}
+    if 'Description' in create_args:
+        update_args['Description'] = create_args['Description']
+    if 'MaxSessionDuration' in create_args:
+        update_args['MaxSessionDuration'] = create_args['MaxSessionDuration']
+    slave_iam_client.update_role(**update_args)
+    if tags:
+        slave_iam_client.tag_role(RoleName=role_name, Tags=tags)
+    if boundary_arn:
+        slave_iam_client.put_role_permissions_boundary(RoleName=role_name, PermissionsBoundary=boundary_arn)
+    return True
+
+
+def ensure_instance_profile(role_name, profile, slave_iam_client, slave_account_id):
+    """Recreate an instance profile removed with the role and put the role back into it"""
+    profile_name = profile['InstanceProfileName']
+    try:
+        profile_roles = slave_iam_client.get_instance_profile(InstanceProfileName=profile_name)['InstanceProfile']['Roles']
+    except slave_iam_client.exceptions.NoSuchEntityException:
+        create_args = {'InstanceProfileName': profile_name, 'Path': profile['Path']}
+        if profile.get('Tags'):
+            create_args['Tags'] = profile['Tags']
+        slave_iam_client.create_instance_profile(**create_args)
+        print(f"INFO: Created instance profile {profile_name} in account {slave_account_id}")
+        profile_roles = []
+
+    if any(profile_role['RoleName'] == role_name for profile_role in profile_roles):
+        return True
+    print(f"INFO: Adding role {role_name} to instance profile {profile_name} in account {slave_account_id}")
+    slave_iam_client.add_role_to_instance_profile(InstanceProfileName=profile_name, RoleName=role_name)
+    return True
+
+
+def restore_role(role_backup, slave_iam_client, slave_account_id, max_workers=4):
+    """
+    Recreate a role from its backup: trust policy, tags and permissions boundary first,
+    then inline policies, managed policy attachments and instance profiles concurrently.
+    Every step is safe to repeat, so a rerun only fills in what is missing.
+    """
+    role_name = role_backup['role_name']
+    restore_steps = {
+        'role': {
+            'action': lambda: ensure_role(role_backup, slave_iam_client, slave_account_id),
+            'description': 'Create role'
+        }
+    }
+    for policy_name, policy_info in role_backup.get('role_inline_policies', {}).items():
+        restore_steps[f"inline:{policy_name}"] = {
+            'action': lambda policy_name=policy_name, policy_info=policy_info: slave_iam_client.put_role_policy(
+                RoleName=role_name,
+                PolicyName=policy_name,
+                PolicyDocument=json.dumps(policy_info['policy_document'])
+            ) is not None,
+            'description': 'Put inline policy',
+            'depends_on': ['role']
+        }
+    managed_policies = {**role_backup.get('role_aws_managed_policies', {}), **role_backup.get('role_customer_managed_policies', {})}
+    for policy_name, policy_info in managed_policies.items():
+        restore_steps[f"managed:{policy_name}"] = {
+            'action': lambda policy_info=policy_info: slave_iam_client.attach_role_policy(
+                RoleName=role_name,
+                PolicyArn=policy_info['policy_arn']
+            ) is not None,
+            'description': 'Attach managed policy',
+            'depends_on': ['role']
+        }
+    for profile in role_backup.get('role_instance_profiles', []):
+        restore_steps[f"instance_profile:{profile['InstanceProfileName']}"] = {
+            'action': lambda profile=profile: ensure_instance_profile(role_name, profile, slave_iam_client, slave_account_id),
+            'description': 'Restore instance profile',
+            'depends_on': ['role']
+        }
+
+    step_results = run_step_graph(restore_steps, max_workers=max_workers)
+    failed_steps = [name for name, succeeded in step_results.items() if not succeeded]
+    if failed_steps:
+        print(f"ERROR: Restore of role {role_name} in account {slave_account_id} incomplete, failed steps: {', '.join(failed_steps)}")
+        return False
+    print(f"SUCCESS: Role {role_name} restored in account {slave_account_id}")
+    return True
+
+
+def restore_role_stage(job):
+    role_backup = json.loads(job['load_backup']())
+    slave_account_id = job['slave_account_id']
+    role_arn_account = arnparse(role_backup['role_arn']).account_id
+    if role_arn_account != slave_account_id:
+        print(f"CRITICAL: Backup of role {role_backup['role_name']} belongs to account {role_arn_account}, not {slave_account_id}. Skipping restore")
+        return False
+    return restore_role(
+        role_backup,
+        get_iam_client(get_worker_session(job), slave_account_id),
+        slave_account_id,
+        max_workers=job.get('cleanup_workers', 4)
+    )
+
+
+BACKUP_BUCKET_REGION = 'ap-northeast-2'
+_PIPELINE_DONE = object()
+_worker_state = threading.local()
+
+
+def get_worker_session(job):
+    """Per-thread copy of the account session, boto3 sessions must not be shared across threads"""
+    sessions = getattr(_worker_state, 'sessions', None)
+    if sessions is None:
+        sessions = _worker_state.sessions = {}
+    if job['slave_account_id'] not in sessions:
+        sessions[job['slave_account_id']] = clone_session(job['slave_session'])
+    return sessions[job['slave_account_id']]
+
+
+def get_worker_s3_client():
+    """Per-thread S3 client for backup uploads, built once and reused for every upload"""
+    s3_client = getattr(_worker_state, 's3_client', None)
+    if s3_client is None:
+        s3_client = _worker_state.s3_client = boto3.Session().client('s3', region_name=BACKUP_BUCKET_REGION)
+    return s3_client
+
+
+def is_protected_role(delete_role_name, slave_role_name, master_role_arn):
+    return delete_role_name in [slave_role_name, arnparse(master_role_arn).resource]
+
+
+def journal_record(job, state, reset=False, **fields):
+    """Record the progress of a job in the run journal, when the run has one"""
+    journal = job.get('journal')
+    if journal is None:
+        return
+    try:
+        journal.record(job['slave_account_id'], job['delete_role_name'], state, reset=reset, **fields)
+    except Exception as e:
+        print(f"WARNING: Unable to record state {state} of role {job['delete_role_name']} in account {job['slave_account_id']} in the run journal: {str(e)}")
+
+
+def is_backup_in_s3(s3_client, bucket_name, s3_key, checksum_sha256):
+    """Check that an earlier upload is still in S3 with the expected SHA-256"""
+    try:
+        response = s3_client.head_object(Bucket=bucket_name, Key=s3_key, ChecksumMode='ENABLED')
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+            return False
+        raise
+    return response.get('ChecksumSHA256') == base64.b64encode(bytes.fromhex(checksum_sha256)).decode('ascii')
+
+
+def run_pipeline(stages, feed, queue_size=50, on_job_done=None):
+    """
+    Run jobs through stages connected by bounded queues.
+
+    stages is a list of (name, worker_count, handler). A handler returns True to pass the
+    job to the next stage and False to drop it; an exception drops it as well. feed is
+    called with the put function of the first queue and must return once all jobs are queued.
+    on_job_done(job) is called when a job leaves the pipeline, whichever stage that is.
+    Returns per stage counters and the time spent in each handler.
+    """
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+    remaining_workers = [worker_count for _, worker_count, _ in stages]
+    stats = {name: {'passed': 0, 'dropped': 0, 'failed': 0, 'seconds': 0.0} for name, _, _ in stages}
+    lock = threading.Lock()
+
+    def worker(index):
+        name, _, handler = stages[index]
+        while True:
+            job = queues[index].get()
+            if job is _PIPELINE_DONE:
+                break
+            started = time.monotonic()
+            try:
+                outcome = 'passed' if handler(job) else 'dropped'
+            except Exception as e:
+                print(f"ERROR: Stage {name} failed for role {job.get('delete_role_name')} in account {job.get('slave_account_id')}: {str(e)}")
+                outcome = 'failed'
+                job['stage_error'] = {'stage': name, 'error': str(e)}
+            with lock:
+                stats[name][outcome] += 1
+                stats[name]['seconds'] += time.monotonic() - started
+            if outcome == 'passed' and index + 1 < len(stages):
+                queues[index + 1].put(job)
+            elif on_job_done is not None:
+                try:
+                    on_job_done(job)
+                except Exception as e:
+                    print(f"ERROR: Finishing role {job.get('delete_role_name')} in account {job.get('slave_account_id')} failed: {str(e)}")
+
+        # Last worker of a stage closes the next stage
+        with lock:
+            remaining_workers[index] -= 1
+            stage_finished = remaining_workers[index] == 0
+        if stage_finished and index + 1 < len(stages):
+            for _ in range(stages[index + 1][1]):
+                queues[index + 1].put(_PIPELINE_DONE)
+
+    threads = []
+    for index, (name, worker_count, _) in enumerate(stages):
+        for worker_number in range(worker_count):
+            thread = threading.Thread(target=worker, args=(index,), name=f"{name}-{worker_number}", daemon=True)
+            thread.start()
+            threads.append(thread)
+
+    try:
+        feed(queues[0].put)
+    finally:
+        for _ in range(stages[0][1]):
+            queues[0].put(_PIPELINE_DONE)
+        # Even when feed raises, roles already in the pipeline must finish: a delete stopped midway
+        # leaves a role with its policies detached but not deleted
+        for thread in threads:
+            thread.join()
+    return stats
+
+
+def fetch_role_stage(job):
+    journal_entry = job.get('journal_entry')
+    if journal_entry and journal_entry['state'] == 'deleted':
+        # An earlier run deleted the role but stopped before verifying it
+        print(f"INFO: Role {job['delete_role_name']} in account {job['slave_account_id']} was deleted by run {journal_entry['run_id']}, verifying deletion")
+        job['plan_outcome'] = 'already_deleted'
+        if wait_for_role_deletion(
+            delete_role_name=job['delete_role_name'],
+            slave_iam_client=get_iam_client(get_worker_session(job), job['slave_account_id']),
+            slave_account_id=job['slave_account_id']
+        ):
+            journal_record(job, 'verified')
+        else:
+            print(f"ERROR: Could not verify deletion of role {job['delete_role_name']} in account {job['slave_account_id']}")
+            job['plan_error'] = f"Deleted by run {journal_entry['run_id']} but the deletion could not be verified"
+        return False
+
+    delete_role_details = get_role_details(
+        delete_role_name=job['delete_role_name'],
+        slave_session=get_worker_session(job),
+        role_deletion_threshold_days=job['role_deletion_threshold_days'],
+        slave_account_id=job['slave_account_id'],
+        account_snapshot=job.get('account_snapshot'),
+        policy_cache=job.get('policy_cache')
+    )
+    if not delete_role_details:
+        print(f"INFO: Skipping deletion for Account {job['slave_account_id']} Role {job['delete_role_name']} due to missing details or threshold not met.")
+        job['criteria_met'] = False
+        return False
+
+    print(f"SUCCESS: Role {job['delete_role_name']} in account {job['slave_account_id']} read successfully.")
+    job['delete_role_details'] = delete_role_details
+    journal_record(job, 'fetched')
+
+    # Start the Access Advisor job now, the access_advisor stage collects it
+    access_advisor = job.get('access_advisor')
+    if access_advisor is not None:
+        access_advisor.submit(get_iam_client(get_worker_session(job), job['slave_account_id']),
+                              delete_role_details['role_raw_data']['Arn'])
+    return True
+
+
+def access_advisor_stage(job):
+    delete_role_details = job['delete_role_details']
+    result = job['access_advisor'].get(delete_role_details['role_raw_data']['Arn'])
+
+    # Kept in the backup as the evidence behind the deletion decision
+    delete_role_details['role_service_last_accessed'] = summarize_service_last_accessed(result)
+    job['access_advisor_met'] = check_service_last_accessed_criteria(
+        delete_role_name=job['delete_role_name'],
+        service_last_accessed=delete_role_details['role_service_last_accessed'],
+        slave_account_id=job['slave_account_id'],
+        role_deletion_threshold_days=job['role_deletion_threshold_days']
+    )
+    return job['access_advisor_met']
+
+
+def backup_role_stage(job):
+    delete_role_name = job['delete_role_name']
+    slave_account_id = job['slave_account_id']
+
+    # Serialize once and keep the bytes for the upload stage
+    backup_bytes = serialize_role_backup(job['delete_role_details'])
+    backup_sha256 = hashlib.sha256(backup_bytes).hexdigest()
+
+    # Role unchanged since an earlier run uploaded its backup, reuse that backup if S3 still holds it
+    journal_entry = job.get('journal_entry')
+    reused_entry = None
+    if (journal_entry and journal_entry.get('s3_key') and journal_entry.get('backup_sha256') == backup_sha256
+            and RunJournal.state_index(journal_entry['state']) >= RunJournal.state_index('uploaded')):
+        try:
+            backup_in_s3 = is_backup_in_s3(get_worker_s3_client(), job['s3_bucket'], journal_entry['s3_key'], journal_entry['upload_sha256'])
+        except Exception as e:
+            print(f"WARNING: Unable to check earlier backup of role {delete_role_name} in account {slave_account_id}: {str(e)}")
+            backup_in_s3 = False
+        if backup_in_s3:
+            print(f"INFO: Role {delete_role_name} in account {slave_account_id} is unchanged since run {journal_entry['run_id']}, reusing backup s3://{job['s3_bucket']}/{journal_entry['s3_key']}")
+            # The upload is skipped, the local backup and the account archive of this run are still written below
+            reused_entry = journal_entry
+        else:
+            print(f"INFO: Backup of role {delete_role_name} in account {slave_account_id} recorded in the run journal is not in S3, backing up again")
+
+    backup_store = job.get('backup_store')
+    if backup_store is not None:
+        # Content addressed: a small manifest plus policy documents and raw objects stored once
+        backup_name = get_backup_file_name(slave_account_id, delete_role_name)
+        backup_file, upload_bytes, backup_blobs = backup_store.store(
+            job['delete_role_details'], backup_bytes, slave_account_id, delete_role_name, backup_name
+        )
+        print(f"INFO: Role backup for role {delete_role_name} in account {slave_account_id} is saved to {backup_file} (sha256 {backup_sha256})")
+
+        # Verify the store rebuilds exactly the serialized bytes
+        try:
+            verified = hashlib.sha256(backup_store.rebuild(backup_file)).hexdigest() == backup_sha256
+        except Exception as e:
+            print(f"ERROR: Unable to rebuild backup of role {delete_role_name} in account {slave_account_id}: {str(e)}")
+            verified = False
+        if not verified:
+            print(f"ERROR: Backup store verification failed for role {delete_role_name} in account {slave_account_id}. Skipping Deletion for safety.....")
+            return False
+        job['backup_blobs'] = backup_blobs
+    else:
+        backup_name = None
+        backup_blobs = None
+        upload_bytes = backup_bytes
+        backup_file = write_json_to_file(
+            json_data=job['delete_role_details'],
+            slave_account_id=slave_account_id,
+            delete_role_name=delete_role_name,
+            workspace=job['workspace'],
+            backup_bytes=backup_bytes
+        )
+        if not backup_file:
+            print(f"ERROR: Failed to backup role {delete_role_name} in account {slave_account_id}. Skipping Deletion for safety.....")
+            return False
+
+        print(f"INFO: Role backup for role {delete_role_name} in account {slave_account_id} is saved to {backup_file} (sha256 {backup_sha256})")
+
+        # Verify backup file holds exactly the serialized bytes
+        if not verify_backup_file(backup_file, backup_sha256):
+            print(f"ERROR: Backup file verification failed for role {delete_role_name} in account {slave_account_id}. Skipping Deletion for safety.....")
+            return False
+
+    # Append the full backup to the account archive from memory, no second read of the file
+    archives = job.get('archives')
+    if archives is not None:
+        try:
+            archives.add(slave_account_id, backup_name or os.path.basename(backup_file), backup_bytes)
+        except Exception as e:
+            print(f"ERROR: Failed to add backup of role {delete_role_name} to archive of account {slave_account_id}: {str(e)}")
+
+    job['backup_file'] = backup_file
+    job['backup_sha256'] = backup_sha256
+    job['backup_verified'] = True
+    if reused_entry:
+        job['upload_sha256'] = reused_entry['upload_sha256']
+        job['s3_key'] = reused_entry['s3_key']
+        job['s3_uploaded'] = True
+        journal_record(job, reused_entry['state'], backup_file=backup_file)
+        return True
+
+    job['backup_bytes'] = upload_bytes
+    job['upload_sha256'] = hashlib.sha256(upload_bytes).hexdigest() if backup_blobs is not None else backup_sha256
+    journal_record(job, 'backed_up', reset=True, backup_sha256=backup_sha256,
+                   backup_file=backup_file, upload_sha256=job['upload_sha256'])
+    return True
+
+
+def upload_backup_blobs(job, s3_client):
+    """Upload the blobs of a content addressed backup that are not in S3 yet"""
+    backup_store = job['backup_store']
+    for digest, content in job.get('backup_blobs', {}).items():
+        if not backup_store.mark_uploaded(digest):
+            continue
+        blob_key = s3_blob_key('role_backups', digest)
+        try:
+            s3_client.head_object(Bucket=job['s3_bucket'], Key=blob_key)
+            continue
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ('404', 'NoSuchKey', 'NotFound'):
+                raise
+        if not upload_file_s3(
+            bucket_name=job['s3_bucket'],
+            file_name=blob_key,
+            file_content=content,
+            s3_client=s3_client,
+            checksum_sha256=digest
+        ):
+            return False
+    return True
+
+
+def upload_role_stage(job):
+    if job.get('s3_uploaded'):
+        # Backup reused from an earlier run
+        return True
+
+    s3_key = f"role_backups/{job['slave_account_id']}/{os.path.basename(job['backup_file'])}"
+
+    # Blobs go first so a manifest in S3 never references a missing blob
+    if job.get('backup_blobs') is not None:
+        if not upload_backup_blobs(job, get_worker_s3_client()):
+            print(f"ERROR: Failed to upload backup blobs to S3 for role {job['delete_role_name']} in account {job['slave_account_id']}. Skipping deletion for safety...")
+            return False
+        job.pop('backup_blobs', None)
+
+    s3_upload_success = upload_file_s3(
+        bucket_name=job['s3_bucket'],
+        file_name=s3_key,
+        file_content=job['backup_bytes'],
+        s3_client=get_worker_s3_client(),
+        checksum_sha256=job['upload_sha256']
+    )
+    # The bytes are on disk and in S3 now, do not keep them in the queue
+    job.pop('backup_bytes', None)
+
+    if not s3_upload_success:
+        print(f"ERROR: Failed to upload backup to S3 for role {job['delete_role_name']} in account {job['slave_account_id']}. Skipping deletion for safety...")
+        return False
+
+    print(f"SUCCESS: Role backup uploaded to s3://{job['s3_bucket']}/{s3_key}")
+    job['s3_key'] = s3_key
+    job['s3_uploaded'] = True
+    journal_record(job, 'uploaded', s3_key=s3_key)
+    return True
+
+
+def delete_role_stage(job):
+    delete_role_name = job['delete_role_name']
+    slave_account_id = job['slave_account_id']
+
+    # Never delete without a verified local backup and a successful upload
+    if not (job.get('delete_role_details') and job.get('backup_verified') and job.get('s3_uploaded')):
+        print(f"CRITICAL: Refusing to delete role {delete_role_name} in account {slave_account_id} without a verified and uploaded backup")
+        return False
+
+    if is_protected_role(delete_role_name, job['slave_role_name'], job['master_role_arn']):
+        print(f"CRITICAL: Skipping Role {delete_role_name}. Protected pipeline roles cannot be deleted")
+        return False
+
+    deletion_success = delete_role_safely(
+        delete_role_name=delete_role_name,
+        delete_role_details=job['delete_role_details'],
+        slave_session=get_worker_session(job),
+        role_deletion_threshold_days=job['role_deletion_threshold_days'],
+        slave_account_id=slave_account_id,
+        max_workers=job.get('cleanup_workers', 4),
+        on_deleted=lambda: journal_record(job, 'deleted')
+    )
+    if deletion_success:
+        journal_record(job, 'verified')
+    else:
+        print(f"WARNING: Role deletion failed for role {delete_role_name} in account {slave_account_id} but backup exists in S3: s3://{job['s3_bucket']}/{job['s3_key']}")
+    return deletion_success
+
+
+PLAN_FORMAT = 'role-cleanup-plan-v1'
+
+
+def plan_access_advisor_evidence(service_last_accessed):
+    """Access Advisor summary of a role as plain JSON for the plan, with the date of the latest service access"""
+    evidence = {key: value.isoformat() if isinstance(value, datetime) else value for key, value in service_last_accessed.items()
+                if key != 'services_accessed'}
+    services_accessed = [
+        {key: value.isoformat() if isinstance(value, datetime) else value for key, value in service.items()}
+        for service in service_last_accessed.get('services_accessed', [])
+    ]
+    if 'services_accessed' in service_last_accessed:
+        evidence['services_accessed'] = services_accessed
+        # Sorted newest first by summarize_service_last_accessed
+        evidence['last_accessed_date'] = services_accessed[0]['LastAuthenticated'] if services_accessed else None
+    return evidence
+
+
+def build_plan_entry(job):
+    """
+    Plan record of a role that went through the plan pipeline: outcome, what apply removes, its backup
+    and the evidence behind the decision. criteria_not_met is only given when a check ran and failed,
+    roles that could not be evaluated are fetch_failed with the error.
+    """
+    entry = {
+        'account_id': job['slave_account_id'],
+        'role_name': job['delete_role_name']
+    }
+    if job.get('plan_outcome'):
+        entry['outcome'] = job['plan_outcome']
+        if job.get('plan_error'):
+            entry['error'] = job['plan_error']
+        return entry
+
+    stage_error = job.get('stage_error')
+    delete_role_details = job.get('delete_role_details')
+    if not delete_role_details:
+        if job.get('criteria_met') is False:
+            entry['outcome'] = 'criteria_not_met'
+        else:
+            entry['outcome'] = 'fetch_failed'
+            entry['error'] = stage_error['error'] if stage_error else 'Role details could not be read'
+        return entry
+
+    service_last_accessed = delete_role_details.get('role_service_last_accessed')
+    if stage_error and stage_error['stage'] == 'access_advisor':
+        entry['outcome'] = 'fetch_failed'
+        entry['error'] = f"Access Advisor: {stage_error['error']}"
+        return entry
+    if job.get('access_advisor_met') is False:
+        if service_last_accessed.get('job_status') != 'COMPLETED':
+            entry['outcome'] = 'fetch_failed'
+            entry['error'] = f"Access Advisor job {service_last_accessed.get('job_status')}: {service_last_accessed.get('error')}"
+        else:
+            entry['outcome'] = 'criteria_not_met'
+            entry['service_last_accessed'] = plan_access_advisor_evidence(service_last_accessed)
+        return entry
+    if not (job.get('backup_verified') and job.get('s3_uploaded')):
+        entry['outcome'] = 'backup_failed'
+        if stage_error:
+            entry['error'] = f"{stage_error['stage']}: {stage_error['error']}"
+        return entry
+
+    role_last_used_date = delete_role_details.get('role_last_used_date')
+    entry.update({
+        'outcome': 'delete',
+        'role_create_date': delete_role_details['role_create_date'].isoformat(),
+        'role_last_used_date': role_last_used_date.isoformat() if role_last_used_date else None,
+        'instance_profiles': sorted(profile['InstanceProfileName'] for profile in delete_role_details.get('role_instance_profiles', [])),
+        'aws_managed_policies': {name: policy['policy_arn'] for name, policy in sorted(delete_role_details.get('role_aws_managed_policies', {}).items())},
+        'customer_managed_policies': {name: policy['policy_arn'] for name, policy in sorted(delete_role_details.get('role_customer_managed_policies', {}).items())},
+        'inline_policies': sorted(delete_role_details.get('role_inline_policies', {})),
+        'backup_sha256': job['backup_sha256'],
+        'upload_sha256': job['upload_sha256'],
+        's3_key': job['s3_key']
+    })
+    if service_last_accessed is not None:
+        # Approvers see which services the role reached and when, apply checks it again
+        entry['service_last_accessed'] = plan_access_advisor_evidence(service_last_accessed)
+    return entry
+
+
+def write_plan_file(plan_entries, plan_file, run_id, role_deletion_threshold_days):
+    plan = {
+        'format': PLAN_FORMAT,
+        'run_id': run_id,
+        'created': datetime.now(timezone.utc).isoformat(),
+        'role_deletion_threshold_days': role_deletion_threshold_days,
+        'entries': sorted(plan_entries, key=lambda entry: (entry['account_id'], entry['role_name']))
+    }
+    plan_bytes = json.dumps(plan, indent=1, sort_keys=True).encode('utf-8')
+    with open(plan_file, 'wb') as f:
+        f.write(plan_bytes)
+    outcomes = {}
+    for entry in plan_entries:
+        outcomes[entry['outcome']] = outcomes.get(entry['outcome'], 0) + 1
+    print(f"SUCCESS: Plan written to {plan_file} (sha256 {hashlib.sha256(plan_bytes).hexdigest()}): " +
+          ', '.join(f"{outcome} {count}" for outcome, count in sorted(outcomes.items())))
+
+
+def read_plan_file(plan_file):
+    try:
+        with open(plan_file, 'rb') as f:
+            plan_bytes = f.read()
+        plan = json.loads(plan_bytes)
+    except Exception as e:
+        print(f"ERROR: Failed to read plan file '{plan_file}': {str(e)}")
+        sys.exit(1)
+    if plan.get('format') != PLAN_FORMAT:
+        print(f"ERROR: Unsupported plan format {plan.get('format')} in '{plan_file}'")
+        sys.exit(1)
+    print(f"INFO: Applying plan {plan_file} from run {plan['run_id']} created {plan['created']} (sha256 {hashlib.sha256(plan_bytes).hexdigest()})")
+    return plan
+
+
+def plan_entry_role_details(entry):
+    """Rebuild the delete_role_safely input from a plan entry, without reading the role again"""
+    role_raw_data = {'RoleName': entry['role_name'], 'CreateDate': datetime.fromisoformat(entry['role_create_date'])}
+    if entry.get('role_last_used_date'):
+        role_raw_data['RoleLastUsed'] = {'LastUsedDate': datetime.fromisoformat(entry['role_last_used_date'])}
+    role_details = {
+        'role_name': entry['role_name'],
+        'role_raw_data': role_raw_data,
+        'role_instance_profiles': [{'InstanceProfileName': name} for name in entry['instance_profiles']],
+        'role_aws_managed_policies': {name: {'policy_arn': arn} for name, arn in entry['aws_managed_policies'].items()},
+        'role_customer_managed_policies': {name: {'policy_arn': arn} for name, arn in entry['customer_managed_policies'].items()},
+        'role_inline_policies': {name: {} for name in entry['inline_policies']}
+    }
+    if 'service_last_accessed' in entry:
+        # delete_role_safely checks the planned Access Advisor evidence against the threshold again
+        role_details['role_service_last_accessed'] = entry['service_last_accessed']
+    return role_details
+
+
+def apply_plan_stage(job):
+    entry = job['plan_entry']
+    delete_role_name = entry['role_name']
+    slave_account_id = entry['account_id']
+
+    if is_protected_role(delete_role_name, job['slave_role_name'], job['master_role_arn']):
+        print(f"CRITICAL: Skipping Role {delete_role_name}. Protected pipeline roles cannot be deleted")
+        return False
+
+    # The plan points at the uploaded backup, make sure it is still there before deleting
+    try:
+        backup_in_s3 = is_backup_in_s3(get_worker_s3_client(), job['s3_bucket'], entry['s3_key'], entry['upload_sha256'])
+    except Exception as e:
+        print(f"ERROR: Unable to check backup of role {delete_role_name} in account {slave_account_id}: {str(e)}")
+        backup_in_s3 = False
+    if not backup_in_s3:
+        print(f"CRITICAL: Backup s3://{job['s3_bucket']}/{entry['s3_key']} of role {delete_role_name} is missing or changed. Skipping Deletion for safety.....")
+        return False
+
+    deletion_success = delete_role_safely(
+        delete_role_name=delete_role_name,
+        delete_role_details=plan_entry_role_details(entry),
+        slave_session=get_worker_session(job),
+        role_deletion_threshold_days=job['role_deletion_threshold_days'],
+        slave_account_id=slave_account_id,
+        max_workers=job.get('cleanup_workers', 4),
+        on_deleted=lambda: journal_record(job, 'deleted')
+    )
+    if deletion_success:
+        journal_record(job, 'verified')
+    else:
+        print(f"WARNING: Role deletion failed for role {delete_role_name} in account {slave_account_id} but backup exists in S3: s3://{job['s3_bucket']}/{entry['s3_key']}")
+    return deletion_success
+
+
+def print_pipeline_stats(stats):
+    for name, counters in stats.items():
+        print(f"INFO: Stage {name}: {counters['passed']} passed, {counters['dropped']} dropped, "
+              f"{counters['failed']} failed, {counters['seconds']:.1f}s busy")
+
 
 if __name__ == '__main__':
     # Read parameters from Jenkins build
@@ -886,8 +2393,206 @@ if __name__ == '__main__':
     session_name = f"CIA-Terraform-Pipeline--PR-CHECK--{build_number}"
     role_deletion_threshold_days = 25
     task = read_parameter('Task', 'backup')
-    
-    
+    use_snapshot = read_parameter('Snapshot', 'false').lower() == 'true'
+    # Point PolicyCacheDir outside WORKSPACE to keep AWS managed documents across builds
+    policy_cache = PolicyDocumentCache(cache_dir=read_parameter('PolicyCacheDir') or None)
+    s3_bucket = "your-backup-bucket-name"  # Replace with your S3 bucket name
+
+    # Worker pools per pipeline stage and the size of the queues between them
+    fetch_workers = int(read_parameter('FetchWorkers', '8'))
+    backup_workers = int(read_parameter('BackupWorkers', '2'))
+    upload_workers = int(read_parameter('UploadWorkers', '4'))
+    delete_workers = int(read_parameter('DeleteWorkers', '4'))
+    pipeline_queue_size = int(read_parameter('PipelineQueueSize', '50'))
+    cleanup_workers = int(read_parameter('CleanupWorkers', '4'))
+    archives = AccountBackupArchives(workspace, archive_format=read_parameter('ArchiveFormat', 'zip').lower())
+    # BackupFormat=cas stores a manifest per role and every policy document / raw object once
+    backup_store = None
+    if read_parameter('BackupFormat', 'full').lower() == 'cas':
+        backup_store = ContentAddressedStore(os.path.join(workspace, 'backup_store'))
+
+    # Journal=<path> keeps per role progress so a rerun skips finished roles and resumes the rest.
+    # Point it outside WORKSPACE, or archive it, to keep it across builds.
+    journal = None
+    if read_parameter('Journal'):
+        journal = RunJournal(read_parameter('Journal'), run_id=build_number)
+
+    # AccessAdvisor=true adds per service last access evidence to the backup and the deletion decision
+    access_advisor = None
+    if read_parameter('AccessAdvisor', 'false').lower() == 'true':
+        access_advisor = AccessAdvisorCollector(max_in_flight=int(read_parameter('AccessAdvisorJobs', '200')))
+
+    # Calls per second allowed per account against the IAM control plane
+    IAM_RATE_GOVERNOR = IamRateGovernor(
+        read_rate=float(read_parameter('IamReadRate', '10')),
+        write_rate=float(read_parameter('IamWriteRate', '3'))
+    )
+
+    # Shard=i/N runs only this agent's share of the accounts, ShardHistory balances shards by past durations
+    shard = read_parameter('Shard')
+    shard_history = read_parameter('ShardHistory') or None
+    if shard:
+        # Checked here, before any role is assumed, rather than where the accounts are known
+        try:
+            parse_shard(shard)
+        except ValueError as e:
+            print(f"ERROR: {str(e)}")
+            sys.exit(1)
+
+    if task == 'discover':
+        # Find unused roles across the organization and write them as a File for a later backup/delete run
+        master_session = assume_master_role(master_role_arn=master_role_arn, session_name=session_name)
+        if account_id.isdigit() and len(account_id) == 12:
+            discover_account_ids = [account_id]
+        elif account_id.lower() == 'all':
+            discover_account_ids = list_org_accounts(master_session)
+        else:
+            print(f"INFO: Invalid account ID: {account_id}")
+            sys.exit(1)
+        discover_account_ids = select_shard(discover_account_ids, shard, shard_history)
+        # Filter="role.name~^legacy-;account=111111111111" narrows discovery, see filters.ResourceFilter.parse
+        try:
+            resource_filter = parse_filter(read_parameter('Filter'))
+        except ValueError as e:
+            print(f"ERROR: {str(e)}")
+            sys.exit(1)
+        print(f"INFO: Discovering unused roles in {len(resource_filter.accounts(discover_account_ids))} accounts")
+
+        # ResultsStore=/path/results.db keeps the candidates of every discovery run for comparisons across runs
+        store_path = read_parameter('ResultsStore')
+        store = ResultsStore(store_path, default_run_id('iam-discover')) if store_path else None
+        if store:
+            # Started before discovery, runs are ordered by their start time
+            store.start_run('role_candidates')
+        run_status = 'failed'
+        try:
+            candidates = discover_candidates(
+                account_ids=discover_account_ids,
+                master_session=master_session,
+                slave_role_name=slave_role_name,
+                session_name=session_name,
+                master_role_arn=master_role_arn,
+                role_deletion_threshold_days=role_deletion_threshold_days,
+                excluded_paths=[path.strip() for path in read_parameter('DiscoveryExcludePaths', ','.join(DISCOVERY_EXCLUDED_PATHS)).split(',') if path.strip()],
+                excluded_tags=parse_tag_filters(read_parameter('DiscoveryExcludeTags')),
+                account_workers=int(read_parameter('DiscoveryWorkers', '8')),
+                role_workers=int(read_parameter('DiscoveryRoleWorkers', '4')),
+                resource_filter=resource_filter
+            )
+            write_candidate_file(candidates, os.path.join(workspace, read_parameter('CandidateFile', 'role_candidates.csv')))
+            if store:
+                candidates_by_account = {}
+                for candidate in candidates:
+                    candidates_by_account.setdefault(candidate['account_id'], []).append(candidate)
+                for candidate_account_id, account_candidates in candidates_by_account.items():
+                    store.write_account('role_candidates', candidate_account_id, account_candidates)
+            run_status = 'success'
+        finally:
+            if store:
+                store.finish_run(run_status)
+                store.close()
+        IAM_RATE_GOVERNOR.print_stats()
+        sys.exit(0)
+
+    if task == 'restore':
+        # Recreate roles from their latest backup, local (RestorePath) or uploaded (RestoreS3Prefix)
+        if account_id.lower() == 'all':
+            restore_account_ids = None
+        elif account_id.isdigit() and len(account_id) == 12:
+            restore_account_ids = {account_id}
+        else:
+            print(f"INFO: Invalid account ID: {account_id}")
+            sys.exit(1)
+
+        restore_path = read_parameter('RestorePath')
+        restore_s3_prefix = read_parameter('RestoreS3Prefix')
+        if restore_path:
+            found_backups = find_local_role_backups(os.path.join(workspace, restore_path))
+        elif restore_s3_prefix:
+            found_backups = find_s3_role_backups(get_worker_s3_client(), s3_bucket, restore_s3_prefix)
+        else:
+            print("ERROR: Either RestorePath or RestoreS3Prefix is required to restore roles")
+            sys.exit(1)
+
+        role_backups = latest_role_backups(found_backups, account_ids=restore_account_ids, role_name=read_parameter('Role') or None)
+        if not role_backups:
+            print("ERROR: No role backups found to restore")
+            sys.exit(1)
+        print(f"INFO: Restoring {len(role_backups)} roles from {len(found_backups)} backups found")
+
+        master_session = assume_master_role(master_role_arn=master_role_arn, session_name=session_name)
+
+        def feed_restores(put):
+            restore_accounts = {}
+            for (slave_account_id, safe_role_name), load_backup in role_backups.items():
+                restore_accounts.setdefault(slave_account_id, []).append((safe_role_name, load_backup))
+            for slave_account_id, load_backups in restore_accounts.items():
+                try:
+                    slave_session = assume_slave_role(slave_account_id=slave_account_id, slave_role_name=slave_role_name,
+                                                      session_name=session_name, master_role_arn=master_role_arn,
+                                                      master_session=master_session)
+                except (Exception, SystemExit) as e:
+                    print(f"ERROR: Failed to assume slave Role {slave_role_name} in Account {slave_account_id}, skipping its restores: {str(e)}")
+                    continue
+                for safe_role_name, load_backup in load_backups:
+                    put({
+                        'slave_account_id': slave_account_id,
+                        'delete_role_name': safe_role_name,
+                        'slave_session': slave_session,
+                        'load_backup': load_backup,
+                        'cleanup_workers': cleanup_workers
+                    })
+
+        pipeline_stats = run_pipeline([('restore', int(read_parameter('RestoreWorkers', '8')), restore_role_stage)],
+                                      feed_restores, queue_size=pipeline_queue_size)
+        print_pipeline_stats(pipeline_stats)
+        IAM_RATE_GOVERNOR.print_stats()
+        sys.exit(0 if pipeline_stats['restore']['failed'] + pipeline_stats['restore']['dropped'] == 0 else 1)
+
+    if task == 'apply':
+        plan = read_plan_file(os.path.join(workspace, read_parameter('PlanFile', 'role_plan.json')))
+        plan_accounts = {}
+        for entry in plan['entries']:
+            if entry['outcome'] == 'delete':
+                plan_accounts.setdefault(entry['account_id'], []).append(entry)
+        plan_accounts = {slave_account_id: plan_accounts[slave_account_id]
+                         for slave_account_id in select_shard(list(plan_accounts), shard, shard_history)}
+        print(f"INFO: Plan deletes {sum(len(entries) for entries in plan_accounts.values())} roles in {len(plan_accounts)} accounts")
+
+        master_session = assume_master_role(master_role_arn=master_role_arn, session_name=session_name)
+
+        def feed_plan(put):
+            for slave_account_id, entries in plan_accounts.items():
+                try:
+                    slave_session = assume_slave_role(slave_account_id=slave_account_id, slave_role_name=slave_role_name,
+                                                      session_name=session_name, master_role_arn=master_role_arn,
+                                                      master_session=master_session)
+                except (Exception, SystemExit) as e:
+                    print(f"ERROR: Failed to assume slave Role {slave_role_name} in Account {slave_account_id}, skipping its planned deletions: {str(e)}")
+                    continue
+                for entry in entries:
+                    put({
+                        'slave_account_id': slave_account_id,
+                        'delete_role_name': entry['role_name'],
+                        'slave_session': slave_session,
+                        'plan_entry': entry,
+                        'role_deletion_threshold_days': role_deletion_threshold_days,
+                        's3_bucket': s3_bucket,
+                        'slave_role_name': slave_role_name,
+                        'master_role_arn': master_role_arn,
+                        'cleanup_workers': cleanup_workers,
+                        'journal': journal
+                    })
+
+        pipeline_stats = run_pipeline([('apply', int(read_parameter('ApplyWorkers', '16')), apply_plan_stage)],
+                                      feed_plan, queue_size=pipeline_queue_size)
+        print_pipeline_stats(pipeline_stats)
+        IAM_RATE_GOVERNOR.print_stats()
+        if journal is not None:
+            journal.print_summary()
+            journal.close()
+        sys.exit(0 if pipeline_stats['apply']['failed'] + pipeline_stats['apply']['dropped'] == 0 else 1)
+
     if account_id.lower() == 'all':
         file = read_parameter('File')
         file_path = os.path.join(workspace, file)
@@ -903,119 +2608,109 @@ if __name__ == '__main__':
     else:
         print(f"INFO: Invalid account ID: {account_id}")
         sys.exit(1)
+    account_mappings = {slave_account_id: account_mappings[slave_account_id]
+                        for slave_account_id in select_shard(list(account_mappings), shard, shard_history)}
 
     master_session = assume_master_role(master_role_arn= master_role_arn, session_name=session_name)
- 
-    for slave_account_id, delete_roles in account_mappings.items():
-        try:
-            slave_session = assume_slave_role(slave_account_id=slave_account_id, slave_role_name=slave_role_name, 
-                                           session_name=session_name, master_role_arn=master_role_arn, 
-                                           master_session=master_session)
-            if not slave_session:
-                print(f"ERROR: Failed to assume role for slave account {slave_account_id}. Skipping deletion on this account.....")
-                continue
 
-            for delete_role_name in delete_roles:
-                try:
-                    if delete_role_name in [slave_role_name, arnparse(master_role_arn).resource]:
-                        print(f"CRITICAL: Skipping Role {delete_role_name}. You cannot delete Role: {arnparse(master_role_arn).resource} and Role: {slave_role_name}")
-                        continue
-                    
-                    print(f"INFO: Processing slave account ID: {slave_account_id} to delete role name role: {delete_role_name}")
-                    
-                    try:
-                        delete_role_details = get_role_details(delete_role_name=delete_role_name, slave_session=slave_session, role_deletion_threshold_days=role_deletion_threshold_days, slave_account_id=slave_account_id)
-                        if not delete_role_details:
-                            print(f"INFO: Skipping deletion for Account {slave_account_id} Role {delete_role_name} due to missing details or threshold not met.")
-                            continue
-                        else:
-                            print(f"SUCCESS: Role {delete_role_name} in account {slave_account_id} read successfully.")
-                            json_output = json.dumps(delete_role_details, indent=3, sort_keys=True, ensure_ascii=False, default=str)
-                                
-                            # Write the JSON output to a file
-                            backup_file = write_json_to_file(
-                                    json_data=delete_role_details,
-                                    slave_account_id=slave_account_id,
-                                    delete_role_name=delete_role_name,
-                                    workspace=workspace
-                            )
-                            if not backup_file:
-                                print(f"ERROR: Failed to backup role {delete_role_name} in account {slave_account_id}. Skipping Deletion for safety.....")
-                                continue
-                                
-                            print(f"INFO: Role backup for role {delete_role_name} in account {slave_account_id} is saved to {backup_file}")
-                            
-                            # Verify backup file exists and is not empty
-                            if not os.path.exists(backup_file) or os.path.getsize(backup_file) == 0:
-                                print(f"ERROR: Backup file verification failed for role {delete_role_name} in account {slave_account_id}. Skipping Deletion for safety.....")
-                                continue
-                                
-                            try:
-                                # Verify backup file contains valid JSON
-                                with open(backup_file, 'r') as f:
-                                    backup_content = json.load(f)
-                                if not backup_content:
-                                    print(f"ERROR: Backup file is empty or invalid for role {delete_role_name} in account {slave_account_id}. Skipping Deletion for safety.....")
-                                    continue
-
-                                # Upload backup to S3 before deletion
-                                s3_bucket = "your-backup-bucket-name"  # Replace with your S3 bucket name
-                                s3_key = f"role_backups/{slave_account_id}/{os.path.basename(backup_file)}"
-                                
-                                try:
-                                    with open(backup_file, 'rb') as f:
-                                        s3_upload_success = upload_file_s3(
-                                            bucket_name=s3_bucket,
-                                            file_name=s3_key,
-                                            file_content=f.read()
-                                        )
-                                    
-                                    if not s3_upload_success:
-                                        print(f"ERROR: Failed to upload backup to S3 for role {delete_role_name} in account {slave_account_id}. Skipping deletion for safety...")
-                                        continue
-                                        
-                                    print(f"SUCCESS: Role backup uploaded to s3://{s3_bucket}/{s3_key}")
-                                    
-                                    # Proceed with deletion only after successful backup and upload
-                                    if delete_role_details and backup_file and backup_content and s3_upload_success and task == 'delete':
-                                        deletion_success = delete_role_safely(
-                                            delete_role_name=delete_role_name,
-                                            delete_role_details=delete_role_details,
-                                            slave_session=slave_session,
-                                            role_deletion_threshold_days=role_deletion_threshold_days,
-                                            slave_account_id=slave_account_id
-                                        )
-                                    
-                                        if not deletion_success:
-                                            print(f"WARNING: Role deletion failed for role {delete_role_name} in account {slave_account_id} but backup exists in S3: s3://{s3_bucket}/{s3_key}")
-                                        
-                                except Exception as e:
-                                    print(f"ERROR: Failed to upload backup to S3 for role {delete_role_name} in account {slave_account_id}: {str(e)}")
-                                    continue
-                            except Exception as e:
-                                print(f"ERROR: Failed to delete role {delete_role_name} safely for account {slave_account_id}: {str(e)}")
+    def feed_roles(put):
+        for slave_account_id, delete_roles in account_mappings.items():
+            if journal is not None:
+                pending_roles = []
+                for delete_role_name in delete_roles:
+                    if journal.is_complete(slave_account_id, delete_role_name, task):
+                        print(f"INFO: Skipping role {delete_role_name} in account {slave_account_id}, already completed for task {task} in the run journal")
+                    else:
+                        pending_roles.append(delete_role_name)
+                delete_roles = pending_roles
+                if not delete_roles:
+                    continue
 
-                    except Exception as e:
-                        print(f"ERROR: Failed to get role {delete_role_name} details for account {slave_account_id}: {str(e)}")
-                        
-                except Exception as e:
-                    print(f"ERROR: Failed to process role {delete_role_name} in account {slave_account_id}: {str(e)}")
+            try:
+                slave_session = assume_slave_role(slave_account_id=slave_account_id, slave_role_name=slave_role_name, 
+                                               session_name=session_name, master_role_arn=master_role_arn, 
+                                               master_session=master_session)
+                if not slave_session:
+                    print(f"ERROR: Failed to assume role for slave account {slave_account_id}. Skipping deletion on this account.....")
                     continue
-                    
-        except Exception as e:
-            print(f"ERROR: Failed to assume slave Role {slave_role_name} in Account {slave_account_id}: {str(e)}")
-            continue
-        
-        # After processing all roles for this account, create zip file
-        try:
-            zip_path = zip_account_json_files(workspace, slave_account_id)
-            if zip_path:
-                print(f"SUCCESS: Created zip archive for account {slave_account_id} at {zip_path}")
-            else:
-                print(f"WARNING: No zip archive created for account {slave_account_id}")
-        except Exception as e:
-            print(f"ERROR: Failed to create zip archive for account {slave_account_id}: {str(e)}")
- 
 
+                account_snapshot = None
+                if use_snapshot:
+                    try:
+                        account_snapshot = build_account_snapshot(get_iam_client(slave_session, slave_account_id), slave_account_id)
+                    except Exception as e:
+                        print(f"WARNING: Falling back to per-role reads for account {slave_account_id}: {str(e)}")
 
+                archives.open_account(slave_account_id)
+                for delete_role_name in delete_roles:
+                    if is_protected_role(delete_role_name, slave_role_name, master_role_arn):
+                        print(f"CRITICAL: Skipping Role {delete_role_name}. You cannot delete Role: {arnparse(master_role_arn).resource} and Role: {slave_role_name}")
+                        continue
+
+                    print(f"INFO: Processing slave account ID: {slave_account_id} to delete role name role: {delete_role_name}")
+                    archives.job_queued(slave_account_id)
+                    put({
+                        'slave_account_id': slave_account_id,
+                        'delete_role_name': delete_role_name,
+                        'slave_session': slave_session,
+                        'account_snapshot': account_snapshot,
+                        'policy_cache': policy_cache,
+                        'role_deletion_threshold_days': role_deletion_threshold_days,
+                        'workspace': workspace,
+                        's3_bucket': s3_bucket,
+                        'slave_role_name': slave_role_name,
+                        'master_role_arn': master_role_arn,
+                        'cleanup_workers': cleanup_workers,
+                        'archives': archives,
+                        'backup_store': backup_store,
+                        'journal': journal,
+                        'access_advisor': access_advisor,
+                        'journal_entry': journal.get(slave_account_id, delete_role_name) if journal is not None else None
+                    })
+                archives.seal_account(slave_account_id)
+            # assume_slave_role exits on failure, which must not stop the roles of the other accounts
+            except (Exception, SystemExit) as e:
+                print(f"ERROR: Failed to assume slave Role {slave_role_name} in Account {slave_account_id}: {str(e)}")
+                continue
 
+    stages = [('fetch', fetch_workers, fetch_role_stage)]
+    if access_advisor is not None:
+        # Workers only wait on the collector, the polling happens on its own scheduler
+        stages.append(('access_advisor', int(read_parameter('AccessAdvisorWorkers', '16')), access_advisor_stage))
+    stages.extend([
+        ('backup', backup_workers, backup_role_stage),
+        ('upload', upload_workers, upload_role_stage)
+    ])
+    if task == 'delete':
+        stages.append(('delete', delete_workers, delete_role_stage))
+
+    # Task=plan records the outcome of every role, Task=apply later deletes exactly the planned ones
+    plan_entries = []
+    plan_lock = threading.Lock()
+
+    def finish_job(job):
+        archives.job_done(job['slave_account_id'])
+        if task == 'plan':
+            plan_entry = build_plan_entry(job)
+            with plan_lock:
+                plan_entries.append(plan_entry)
+
+    pipeline_stats = run_pipeline(stages, feed_roles, queue_size=pipeline_queue_size, on_job_done=finish_job)
+    print_pipeline_stats(pipeline_stats)
+    if task == 'plan':
+        write_plan_file(plan_entries, os.path.join(workspace, read_parameter('PlanFile', 'role_plan.json')),
+                        build_number, role_deletion_threshold_days)
+
+    # Normally every archive is already closed when its last role finished
+    archives.close_all()
+    if backup_store is not None:
+        backup_store.print_stats()
+
+    policy_cache.print_stats()
+    IAM_RATE_GOVERNOR.print_stats()
+    if access_advisor is not None:
+        access_advisor.print_stats()
+        access_advisor.close()
+    if journal is not None:
+        journal.print_summary()
+        journal.close()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+
+import argparse
+import csv
+import glob
+import json
+import os
+import shutil
+import sys
+from datetime import datetime
+
+
+def find_shard_files(input_dirs, pattern):
+    """Files matching pattern anywhere under each shard directory, in shard order"""
+    files = []
+    for input_dir in input_dirs:
+        files.extend(sorted(glob.glob(os.path.join(input_dir, '**', pattern), recursive=True)))
+    return files
+
+
+def read_csv_rows(files):
+    headers = []
+    rows = []
+    for file in files:
+        with open(file, 'r', newline='') as csvfile:
+            reader = csv.DictReader(csvfile)
+            for column in reader.fieldnames or []:
+                if column not in headers:
+                    headers.append(column)
+            rows.extend(reader)
+    return headers, rows
+
+
+def merge_csv_files(files, output_file, sort_key=None):
+    """Concatenate CSV reports with the same layout, rows grouped by account unless sort_key is given"""
+    headers, rows = read_csv_rows(files)
+    rows.sort(key=sort_key or (lambda row: row.get('account', '')))
+    with open(output_file, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=headers)
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"INFO: Merged {len(files)} files into {output_file} ({len(rows)} rows)")
+
+
+def copy_per_account_files(files, output_dir):
+    for file in files:
+        target = os.path.join(output_dir, os.path.basename(file))
+        if os.path.exists(target):
+            print(f"ERROR: {os.path.basename(file)} is present in more than one shard, shards overlap")
+            sys.exit(1)
+        shutil.copyfile(file, target)
+    print(f"INFO: Copied {len(files)} per account files into {output_dir}")
+
+
+def copy_parquet_datasets(input_dirs, output_dir, dataset_names):
+    """
+    Parquet datasets (OutputFormat=parquet) merged by copying each shard's
+    <dataset>/run_date=*/account=* partition trees into output_dir/<dataset>. Returns the accounts copied.
+    """
+    copied = 0
+    for dataset_name in dataset_names:
+        account_dirs = [account_dir for account_dir in find_shard_files(input_dirs, os.path.join(dataset_name, 'run_date=*', 'account=*'))
+                        if os.path.isdir(account_dir)]
+        for account_dir in account_dirs:
+            run_date_dir = os.path.dirname(account_dir)
+            target = os.path.join(output_dir, dataset_name, os.path.basename(run_date_dir), os.path.basename(account_dir))
+            if os.path.exists(target):
+                print(f"ERROR: {dataset_name}/{os.path.basename(run_date_dir)}/{os.path.basename(account_dir)} is present in more than one shard, shards overlap")
+                sys.exit(1)
+            shutil.copytree(account_dir, target)
+        if account_dirs:
+            print(f"INFO: Copied {len(account_dirs)} account partitions of the {dataset_name} dataset into {os.path.join(output_dir, dataset_name)}")
+        copied += len(account_dirs)
+    return copied
+
+
+def merge_ct2(input_dirs, output_dir):
+    from ct2 import trails_to_csv
+
+    merged = copy_parquet_datasets(input_dirs, output_dir, ['trails', 's3_buckets', 's3_monitoring'])
+
+    # Rebuilt through trails_to_csv so the columns come out exactly as a single run orders them
+    trail_files = find_shard_files(input_dirs, 'trails.csv')
+    if trail_files:
+        _, rows = read_csv_rows(trail_files)
+        trails_data = {}
+        for row in sorted(rows, key=lambda row: row['account']):
+            account = row.pop('account')
+            region = row.pop('region')
+            trails_data.setdefault(account, {}).setdefault(region, []).append(row)
+        trails_to_csv(trails_data, output_file=os.path.join(output_dir, 'trails.csv'))
+        merged += len(trail_files)
+
+    for file_name in ['s3_buckets.csv', 's3_monitoring.csv']:
+        files = find_shard_files(input_dirs, file_name)
+        if files:
+            merge_csv_files(files, os.path.join(output_dir, file_name))
+            merged += len(files)
+    return merged
+
+
+def merge_s3(input_dirs, output_dir):
+    csv_files = find_shard_files(input_dirs, 's3_analysis_*.csv')
+    copy_per_account_files(csv_files, output_dir)
+    merged_files = len(csv_files) + copy_parquet_datasets(input_dirs, output_dir, ['s3_analysis'])
+
+    merged = {'master_account': {}, 'slave_accounts': {}}
+    json_files = find_shard_files(input_dirs, 's3_analysis_*.json')
+    for file in json_files:
+        with open(file, 'r') as f:
+            results = json.load(f)
+        if results.get('master_account'):
+            merged['master_account'] = results['master_account']
+        merged['slave_accounts'].update(results.get('slave_accounts', {}))
+    if json_files:
+        output_file = os.path.join(output_dir, f's3_analysis_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json')
+        with open(output_file, 'w') as f:
+            json.dump(merged, f, indent=2, default=str)
+        print(f"INFO: Merged {len(json_files)} results files into {output_file} ({len(merged['slave_accounts'])} accounts)")
+    return merged_files + len(json_files)
+
+
+def merge_iam(input_dirs, output_dir):
+    from iam import PLAN_FORMAT, write_plan_file
+
+    candidate_files = find_shard_files(input_dirs, 'role_candidates.csv')
+    if candidate_files:
+        # Same ranking as a single discovery run: longest idle first
+        candidates = []
+        for file in candidate_files:
+            with open(file, 'r') as f:
+                candidates.extend(line.rstrip('\n').split(',') for line in f if line.strip())
+        candidates.sort(key=lambda candidate: (-int(candidate[2]), candidate[0], candidate[1]))
+        output_file = os.path.join(output_dir, 'role_candidates.csv')
+        with open(output_file, 'w') as f:
+            f.writelines(','.join(candidate) + '\n' for candidate in candidates)
+        print(f"INFO: Merged {len(candidate_files)} candidate files into {output_file} ({len(candidates)} roles)")
+
+    plan_files = find_shard_files(input_dirs, 'role_plan.json')
+    if plan_files:
+        plans = []
+        for file in plan_files:
+            with open(file, 'r') as f:
+                plans.append(json.load(f))
+        if any(plan.get('format') != PLAN_FORMAT for plan in plans):
+            print("ERROR: Shard plans have an unsupported format")
+            sys.exit(1)
+        if len({plan['role_deletion_threshold_days'] for plan in plans}) != 1:
+            print("ERROR: Shard plans were made with different deletion thresholds")
+            sys.exit(1)
+        write_plan_file([entry for plan in plans for entry in plan['entries']], os.path.join(output_dir, 'role_plan.json'),
+                        ','.join(sorted({str(plan['run_id']) for plan in plans})), plans[0]['role_deletion_threshold_days'])
+
+    archive_files = find_shard_files(input_dirs, 'role_backups_*.zip') + find_shard_files(input_dirs, 'role_backups_*.tar.zst')
+    copy_per_account_files(archive_files, output_dir)
+    return len(candidate_files) + len(plan_files) + len(archive_files)
+
+
+MERGERS = {
+    'ct2': merge_ct2,
+    's3': merge_s3,
+    'iam': merge_iam
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Combine the outputs of sharded runs into the reports of a single run')
+    parser.add_argument('--kind', required=True, choices=sorted(MERGERS), help='ct2.py, s3/aws.py or iam.py outputs')
+    parser.add_argument('--inputs', required=True, nargs='+', help='Output directory of every shard')
+    parser.add_argument('--output', required=True, help='Directory for the merged reports')
+    args = parser.parse_args()
+
+    missing = [input_dir for input_dir in args.inputs if not os.path.isdir(input_dir)]
+    if missing:
+        print(f"ERROR: Shard output directories not found: {', '.join(missing)}")
+        sys.exit(1)
+
+    os.makedirs(args.output, exist_ok=True)
+    # Mergers return how many shard outputs they found, none means the shards wrote something this script does not know
+    if not MERGERS[args.kind](args.inputs, args.output):
+        print(f"ERROR: No {args.kind} outputs found in the shard directories, nothing was merged")
+        sys.exit(1)
+    print(f"SUCCESS: Merged {len(args.inputs)} shards into {args.output}")
+
+
+if __name__ == '__main__':
+    main()
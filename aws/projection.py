@@ -0,0 +1,21 @@
+def parse_columns(value):
+    """'bucket_name,encryption' -> ['bucket_name', 'encryption']. Empty means every column (None)"""
+    columns = [column.strip() for column in (value or '').split(',') if column.strip()]
+    return columns or None
+
+
+def required_calls(columns, column_calls):
+    """API calls behind the requested columns, every call of column_calls when columns is None"""
+    if columns is None:
+        columns = column_calls.keys()
+    return {call for column in columns for call in column_calls.get(column, ())}
+
+
+def project_columns(headers, columns, key_columns=()):
+    """Headers restricted to the requested columns in report order, key columns are always kept"""
+    if columns is None:
+        return list(headers)
+    unknown = [column for column in columns if column not in headers]
+    if unknown:
+        raise ValueError(f"Unknown columns {', '.join(unknown)}, expected any of: {', '.join(headers)}")
+    return [header for header in headers if header in columns or header in key_columns]
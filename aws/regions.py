@@ -0,0 +1,145 @@
+import os
+import threading
+import traceback
+import boto3
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+# Regions whose opt-in status means API endpoints will actually answer
+ENABLED_REGION_STATUSES = ['ENABLED', 'ENABLED_BY_DEFAULT']
+ENABLED_EC2_OPT_IN_STATUSES = ['opt-in-not-required', 'opted-in']
+
+# The Account API is global and only served from us-east-1
+ACCOUNT_API_REGION = 'us-east-1'
+DEFAULT_REGION_WORKERS = 8
+
+_enabled_regions_cache = {}
+_enabled_regions_lock = threading.Lock()
+
+
+def get_session_account_id(session):
+    """Return the account ID the session credentials belong to"""
+    return session.client('sts').get_caller_identity()['Account']
+
+
+def clone_session(session, region_name=None):
+    """
+    Build an independent session from the same credentials. boto3 sessions are not
+    thread safe, so every worker thread gets its own copy. Sessions that manage
+    their own sharing (collectors.SharedSession) hand out a regional view instead.
+    """
+    if hasattr(session, 'clone'):
+        return session.clone(region_name)
+    credentials = session.get_credentials().get_frozen_credentials()
+    return boto3.Session(
+        aws_access_key_id=credentials.access_key,
+        aws_secret_access_key=credentials.secret_key,
+        aws_session_token=credentials.token,
+        region_name=region_name or session.region_name
+    )
+
+
+def bucket_region(location):
+    """Region of a bucket from its get_bucket_location response: no constraint is us-east-1, legacy EU is eu-west-1"""
+    region = location.get('LocationConstraint') or 'us-east-1'
+    return 'eu-west-1' if region == 'EU' else region
+
+
+def _list_regions_from_account_api(session):
+    account_client = session.client('account', region_name=ACCOUNT_API_REGION)
+    regions = []
+    for page in account_client.get_paginator('list_regions').paginate(RegionOptStatusContains=ENABLED_REGION_STATUSES):
+        regions.extend(region['RegionName'] for region in page.get('Regions', []))
+    return regions
+
+
+def _list_regions_from_ec2(session):
+    ec2_client = session.client('ec2', region_name=session.region_name or ACCOUNT_API_REGION)
+    response = ec2_client.describe_regions(
+        AllRegions=True,
+        Filters=[{'Name': 'opt-in-status', 'Values': ENABLED_EC2_OPT_IN_STATUSES}]
+    )
+    return [region['RegionName'] for region in response.get('Regions', [])]
+
+
+def list_enabled_regions(session, account_id=None, service_name=None, refresh=False):
+    """
+    Return the sorted list of regions enabled in the account of the given session.
+    Results are cached per account for the lifetime of the process. When service_name
+    is given, regions where the service has no endpoint are dropped as well.
+    """
+    if not account_id:
+        account_id = get_session_account_id(session)
+
+    with _enabled_regions_lock:
+        regions = None if refresh else _enabled_regions_cache.get(account_id)
+
+    if regions is None:
+        try:
+            regions = _list_regions_from_account_api(session)
+            print(f"INFO: Found {len(regions)} enabled regions in account {account_id} using account:ListRegions")
+        except Exception as e:
+            print(f"WARNING: account:ListRegions failed for account {account_id}, falling back to ec2:DescribeRegions: {str(e)}")
+            try:
+                regions = _list_regions_from_ec2(session)
+                print(f"INFO: Found {len(regions)} enabled regions in account {account_id} using ec2:DescribeRegions")
+            except Exception as e:
+                print(f"ERROR: Unable to discover enabled regions for account {account_id}: {str(e)}")
+                raise
+
+        regions = sorted(set(regions))
+        with _enabled_regions_lock:
+            _enabled_regions_cache[account_id] = regions
+
+    if service_name:
+        available_regions = set(session.get_available_regions(service_name))
+        regions = [region for region in regions if region in available_regions]
+
+    return list(regions)
+
+
+def is_region_enabled(session, region, account_id=None):
+    """Check a single region against the cached enabled region list"""
+    return region in list_enabled_regions(session, account_id=account_id)
+
+
+def run_region_collectors(session, collector, account_id=None, regions=None, service_name=None, max_workers=DEFAULT_REGION_WORKERS):
+    """
+    Run collector(session, region) concurrently for every enabled region. Each call
+    receives its own session pinned to the region it collects from.
+
+    regions restricts the run to a subset; any region in it that is not enabled
+    in the account is skipped up front rather than left to time out.
+    Returns a dictionary of region -> collector result. Regions whose collector
+    raised are logged and left out of the result.
+    """
+    if not account_id:
+        account_id = get_session_account_id(session)
+
+    enabled_regions = list_enabled_regions(session, account_id=account_id, service_name=service_name)
+    if regions is not None:
+        requested_regions = set(regions)
+        for region in sorted(requested_regions - set(enabled_regions)):
+            print(f"WARNING: Skipping region {region} in account {account_id}, region is not enabled")
+        target_regions = [region for region in enabled_regions if region in requested_regions]
+    else:
+        target_regions = enabled_regions
+
+    results = {}
+    if not target_regions:
+        print(f"WARNING: No enabled regions to collect from in account {account_id}")
+        return results
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(target_regions)))) as executor:
+        futures = {executor.submit(collector, clone_session(session, region), region): region for region in target_regions}
+        for future in as_completed(futures):
+            region = futures[future]
+            try:
+                results[region] = future.result()
+            except Exception as e:
+                # Innermost frame, where the collector failed rather than where its result was read here
+                frame = traceback.extract_tb(e.__traceback__)[-1] if e.__traceback__ else None
+                location = f"{os.path.basename(frame.filename)}:{frame.lineno}" if frame else 'unknown'
+                print(f"ERROR: Region collector failed for region {region} in account {account_id} at {location}: {str(e)}")
+
+    return results
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+from datetime import datetime, timedelta, timezone
+
+
+# Row columns stored as indexed columns of each report, the whole row is kept as JSON in data
+REPORT_KEYS = {
+    'trails': {'trail_name': 'trail_name', 'region': 'region'},
+    's3_buckets': {'bucket_name': 'bucket_name', 'region': 'bucket_region'},
+    's3_monitoring': {'bucket_name': 'bucket_name'},
+    's3_buckets_inventory': {'bucket_name': 'Bucket Name'},
+    's3_analysis': {'bucket_name': 'Bucket Name', 'region': 'Region', 'size_bytes': 'Total Size (Bytes)',
+                    'object_count': 'Total Objects'},
+    'role_candidates': {'role_name': 'role_name'}
+}
+
+
+def default_run_id(prefix):
+    """<job>-<build> under Jenkins, so the runs of different jobs sharing a store never collide, <prefix>-<timestamp> otherwise"""
+    if os.environ.get('BUILD_NUMBER'):
+        return f"{os.environ.get('JOB_NAME', prefix)}-{os.environ['BUILD_NUMBER']}"
+    return f"{prefix}-{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+
+
+def as_count(value):
+    """Sizes and counts are 'Not Analyzed' for skipped buckets, stored as NULL"""
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    return int(value) if isinstance(value, str) and value.isdigit() else None
+
+
+class ResultsStore:
+    """
+    SQLite file every run appends its report rows to under its run id, so questions across
+    runs are answered with indexed queries instead of reading back old CSV and JSON reports.
+    Rows are written per account and an account written again in the same run replaces its
+    earlier rows, so retried accounts are not counted twice.
+    """
+
+    def __init__(self, store_path, run_id=None):
+        self.store_path = store_path
+        self.run_id = run_id
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(store_path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY,
+                started_at TEXT NOT NULL,
+                finished_at TEXT,
+                status TEXT,
+                description TEXT
+            )
+        ''')
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS results (
+                run_id TEXT NOT NULL,
+                report TEXT NOT NULL,
+                account_id TEXT NOT NULL,
+                region TEXT,
+                bucket_name TEXT,
+                trail_name TEXT,
+                role_name TEXT,
+                size_bytes INTEGER,
+                object_count INTEGER,
+                data TEXT NOT NULL
+            )
+        ''')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS results_run ON results (run_id, report, account_id)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS results_account ON results (account_id, report, run_id)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS results_bucket ON results (bucket_name, report, run_id)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS results_trail ON results (trail_name, run_id)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS results_role ON results (role_name, run_id)')
+        self.connection.commit()
+        print(f"INFO: Using results store {store_path}")
+
+    def start_run(self, description=''):
+        """Record the run, a rerun with the same run id keeps its first start time"""
+        with self.lock:
+            self.connection.execute(
+                'INSERT OR IGNORE INTO runs (run_id, started_at, description) VALUES (?, ?, ?)',
+                (self.run_id, datetime.now(timezone.utc).isoformat(), description)
+            )
+            self.connection.execute('UPDATE runs SET status = ? WHERE run_id = ?', ('running', self.run_id))
+            self.connection.commit()
+
+    def finish_run(self, status='success'):
+        with self.lock:
+            self.connection.execute(
+                'UPDATE runs SET finished_at = ?, status = ? WHERE run_id = ?',
+                (datetime.now(timezone.utc).isoformat(), status, self.run_id)
+            )
+            self.connection.commit()
+
+    def write_account(self, report, account_id, rows):
+        """Store the rows of one account for the report, in place of any stored earlier in this run"""
+        keys = REPORT_KEYS[report]
+        values = []
+        for row in rows:
+            fields = {column: row.get(row_column) for column, row_column in keys.items()}
+            values.append((
+                self.run_id, report, str(account_id), fields.get('region'), fields.get('bucket_name'), fields.get('trail_name'),
+                fields.get('role_name'), as_count(fields.get('size_bytes')), as_count(fields.get('object_count')),
+                json.dumps(row, default=str)
+            ))
+        with self.lock:
+            self.connection.execute('DELETE FROM results WHERE run_id = ? AND report = ? AND account_id = ?',
+                                    (self.run_id, report, str(account_id)))
+            self.connection.executemany(
+                'INSERT INTO results (run_id, report, account_id, region, bucket_name, trail_name, role_name, size_bytes, '
+                'object_count, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                values
+            )
+            self.connection.commit()
+
+    def query(self, sql, parameters=()):
+        with self.lock:
+            cursor = self.connection.execute(sql, parameters)
+            columns = [description[0] for description in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def runs(self, limit=20):
+        return self.query(
+            'SELECT runs.run_id, started_at, finished_at, status, description, '
+            '(SELECT COUNT(*) FROM results WHERE results.run_id = runs.run_id) AS rows '
+            'FROM runs ORDER BY started_at DESC LIMIT ?',
+            (limit,)
+        )
+
+    def latest_run(self, report, before=None):
+        """Most recent run that stored rows of the report, started no later than before when given"""
+        rows = self.query(
+            'SELECT run_id, started_at FROM runs WHERE (? IS NULL OR started_at <= ?) '
+            'AND EXISTS (SELECT 1 FROM results WHERE results.run_id = runs.run_id AND report = ?) '
+            'ORDER BY started_at DESC LIMIT 1',
+            (before, before, report)
+        )
+        return rows[0] if rows else None
+
+    def bucket_growth(self, factor=2.0, days=30, run_id=None):
+        """
+        Buckets of the s3_analysis report whose size in run_id (the latest run by default) is at
+        least factor times their size in the latest run started days or more before it
+        """
+        if run_id:
+            current = (self.query('SELECT run_id, started_at FROM runs WHERE run_id = ?', (run_id,)) or [None])[0]
+        else:
+            current = self.latest_run('s3_analysis')
+        if current is None:
+            return None, None, []
+        before = (datetime.fromisoformat(current['started_at']) - timedelta(days=days)).isoformat()
+        baseline = self.latest_run('s3_analysis', before)
+        if baseline is None:
+            return current, None, []
+        rows = self.query(
+            'SELECT new.account_id, new.bucket_name, new.region, old.size_bytes AS old_size_bytes, new.size_bytes AS size_bytes, '
+            'ROUND(CAST(new.size_bytes AS REAL) / old.size_bytes, 2) AS growth '
+            'FROM results new JOIN results old ON old.bucket_name = new.bucket_name AND old.account_id = new.account_id '
+            'AND old.report = new.report AND old.run_id = ? '
+            'WHERE new.run_id = ? AND new.report = ? AND old.size_bytes > 0 AND new.size_bytes >= old.size_bytes * ? '
+            'ORDER BY growth DESC, new.account_id, new.bucket_name',
+            (baseline['run_id'], current['run_id'], 's3_analysis', factor)
+        )
+        return current, baseline, rows
+
+    def history(self, key_column, name, report=None):
+        """Every stored row of a bucket, trail or role across runs, newest first"""
+        if key_column not in ('bucket_name', 'trail_name', 'role_name'):
+            raise ValueError(f"Unknown key column {key_column}")
+        return self.query(
+            f"SELECT results.run_id, runs.started_at, report, account_id, region, size_bytes, object_count, data "
+            f"FROM results JOIN runs ON runs.run_id = results.run_id "
+            f"WHERE {key_column} = ? AND (? IS NULL OR report = ?) ORDER BY runs.started_at DESC, report, account_id",
+            (name, report, report)
+        )
+
+    def account_summary(self, account_id, limit=10):
+        """Rows per report of the account in its most recent runs"""
+        return self.query(
+            'SELECT results.run_id, runs.started_at, report, COUNT(*) AS rows, SUM(size_bytes) AS size_bytes '
+            'FROM results JOIN runs ON runs.run_id = results.run_id WHERE account_id = ? '
+            'GROUP BY results.run_id, report ORDER BY runs.started_at DESC, report LIMIT ?',
+            (account_id, limit)
+        )
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def print_table(rows, columns=None):
+    if not rows:
+        print("No results")
+        return
+    columns = columns or list(rows[0])
+    widths = {column: max(len(column), *(len(str(row[column])) for row in rows)) for column in columns}
+    print('  '.join(column.ljust(widths[column]) for column in columns))
+    for row in rows:
+        print('  '.join(str(row[column]).ljust(widths[column]) for column in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query the results store that collector runs append to')
+    parser.add_argument('--store', required=True, help='SQLite results store, the ResultsStore parameter of the runs')
+    commands = parser.add_subparsers(dest='command', required=True)
+    runs_parser = commands.add_parser('runs', help='Recent runs and their row counts')
+    runs_parser.add_argument('--limit', type=int, default=20)
+    growth_parser = commands.add_parser('growth', help='Buckets that grew by a factor since an earlier run')
+    growth_parser.add_argument('--factor', type=float, default=2.0)
+    growth_parser.add_argument('--days', type=int, default=30, help='Compare with the latest run at least this many days older')
+    growth_parser.add_argument('--run', help='Run to compare, the latest by default')
+    for kind in ('bucket', 'trail', 'role'):
+        history_parser = commands.add_parser(kind, help=f"Every stored row of a {kind} across runs")
+        history_parser.add_argument('name')
+        history_parser.add_argument('--report', choices=sorted(REPORT_KEYS))
+        history_parser.add_argument('--data', action='store_true', help='Show the full stored rows')
+    account_parser = commands.add_parser('account', help='Rows per report of an account in its recent runs')
+    account_parser.add_argument('account_id')
+    account_parser.add_argument('--limit', type=int, default=10)
+    args = parser.parse_args()
+
+    store = ResultsStore(args.store)
+    try:
+        if args.command == 'runs':
+            print_table(store.runs(args.limit), ['run_id', 'started_at', 'finished_at', 'status', 'rows', 'description'])
+        elif args.command == 'growth':
+            current, baseline, rows = store.bucket_growth(args.factor, args.days, args.run)
+            if current is None:
+                print("ERROR: No run with s3_analysis results found")
+                sys.exit(1)
+            if baseline is None:
+                print(f"ERROR: No s3_analysis run found {args.days} days or more before run {current['run_id']}")
+                sys.exit(1)
+            print(f"INFO: Run {current['run_id']} ({current['started_at']}) against run {baseline['run_id']} ({baseline['started_at']})")
+            print_table(rows, ['account_id', 'bucket_name', 'region', 'old_size_bytes', 'size_bytes', 'growth'])
+        elif args.command in ('bucket', 'trail', 'role'):
+            rows = store.history(f"{args.command}_name", args.name, args.report)
+            columns = ['run_id', 'started_at', 'report', 'account_id', 'region', 'size_bytes', 'object_count']
+            print_table(rows, columns + (['data'] if args.data else []))
+        else:
+            print_table(store.account_summary(args.account_id, args.limit), ['run_id', 'started_at', 'report', 'rows', 'size_bytes'])
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
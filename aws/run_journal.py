@@ -0,0 +1,119 @@
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+
+# Per role progress, in the order a role moves through the cleanup
+JOURNAL_STATES = ['fetched', 'backed_up', 'uploaded', 'deleted', 'verified']
+
+# State at which a role needs no more work for the given Task
+COMPLETED_STATE = {
+    'backup': 'uploaded',
+    'delete': 'verified'
+}
+
+JOURNAL_COLUMNS = ['backup_sha256', 'backup_file', 'upload_sha256', 's3_key']
+
+
+class RunJournal:
+    """
+    SQLite journal of (account, role) progress shared by every build that points at
+    the same file. Reruns use it to skip roles that are done and to pick up in-flight
+    roles after their last completed state.
+    """
+
+    def __init__(self, journal_path, run_id):
+        self.journal_path = journal_path
+        self.run_id = run_id
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(journal_path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS role_state (
+                account_id TEXT NOT NULL,
+                role_name TEXT NOT NULL,
+                state TEXT NOT NULL,
+                backup_sha256 TEXT,
+                backup_file TEXT,
+                upload_sha256 TEXT,
+                s3_key TEXT,
+                run_id TEXT,
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (account_id, role_name)
+            )
+        ''')
+        self.connection.commit()
+        print(f"INFO: Using run journal {journal_path}")
+
+    @staticmethod
+    def state_index(state):
+        return JOURNAL_STATES.index(state) if state in JOURNAL_STATES else -1
+
+    def get(self, account_id, role_name):
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT state, backup_sha256, backup_file, upload_sha256, s3_key, run_id, updated_at '
+                'FROM role_state WHERE account_id = ? AND role_name = ?',
+                (account_id, role_name)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(['state'] + JOURNAL_COLUMNS + ['run_id', 'updated_at'], row))
+
+    def record(self, account_id, role_name, state, reset=False, **fields):
+        """
+        Move a role to state. The state never goes backwards unless reset is set, which
+        also clears the columns not given in fields (used when a new backup replaces the old one).
+        """
+        unknown = set(fields) - set(JOURNAL_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown journal columns {sorted(unknown)}")
+
+        now = datetime.now(timezone.utc).isoformat()
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT state FROM role_state WHERE account_id = ? AND role_name = ?',
+                (account_id, role_name)
+            ).fetchone()
+            if row is not None and not reset and self.state_index(row[0]) > self.state_index(state):
+                state = row[0]
+
+            values = {column: fields.get(column) for column in JOURNAL_COLUMNS}
+            if row is None or reset:
+                self.connection.execute(
+                    'INSERT OR REPLACE INTO role_state (account_id, role_name, state, backup_sha256, backup_file, '
+                    'upload_sha256, s3_key, run_id, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (account_id, role_name, state, values['backup_sha256'], values['backup_file'],
+                     values['upload_sha256'], values['s3_key'], self.run_id, now)
+                )
+            else:
+                assignments = ['state = ?', 'run_id = ?', 'updated_at = ?']
+                parameters = [state, self.run_id, now]
+                for column in JOURNAL_COLUMNS:
+                    if column in fields:
+                        assignments.append(f"{column} = ?")
+                        parameters.append(fields[column])
+                self.connection.execute(
+                    f"UPDATE role_state SET {', '.join(assignments)} WHERE account_id = ? AND role_name = ?",
+                    parameters + [account_id, role_name]
+                )
+            self.connection.commit()
+
+    def is_complete(self, account_id, role_name, task):
+        entry = self.get(account_id, role_name)
+        if entry is None:
+            return False
+        return self.state_index(entry['state']) >= self.state_index(COMPLETED_STATE.get(task, 'verified'))
+
+    def print_summary(self):
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT state, COUNT(*) FROM role_state WHERE run_id = ? GROUP BY state', (self.run_id,)
+            ).fetchall()
+        counts = dict(rows)
+        print(f"INFO: Run journal for run {self.run_id}: " +
+              ', '.join(f"{state} {counts.get(state, 0)}" for state in JOURNAL_STATES))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -1,23 +1,66 @@
 import boto3
-import json
 import os
 import sys
 from datetime import datetime
-import csv
 from pathlib import Path
 from typing import Dict, List, Any
 
+# Shared helpers live one directory up in aws/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from filters import ResourceFilter, parse_filter, tag_dict
+from projection import parse_columns, required_calls
+from regions import bucket_region, run_region_collectors
+from results_store import ResultsStore, default_run_id
+from sharding import parse_shard, select_shard
+from sinks import CsvSink, JsonObjectSink, ParquetDatasetSink, choose_output_format
+
 
 # Get BUILD_NUMBER from environment variable with a fallback
 BUILD_NUMBER = os.getenv('BUILD_NUMBER', 'manual')
 SESSION_NAME = f"S3Analysis-{BUILD_NUMBER}"
 
+# Report columns of Utility.save_to_csv, the CSV headers behind each and the bucket data they need
+S3_ANALYSIS_COLUMNS = {
+    'bucket_name': (['Bucket Name'], ()),
+    'region': (['Region'], ('get_bucket_location',)),
+    'owner': (['Owner Display Name', 'Owner ID'], ()),
+    'creation_date': (['Creation Date'], ()),
+    'has_tags': (['Has Tags'], ('get_bucket_tagging',)),
+    'has_pii_tags': (['Has PII Tags'], ('get_bucket_tagging',)),
+    'total_size': (['Total Size (Bytes)', 'Total Size (Human Readable)'], ('get_bucket_tagging', 'list_objects_v2')),
+    'total_objects': (['Total Objects'], ('get_bucket_tagging', 'list_objects_v2')),
+    'storage_classes': ([], ('get_bucket_tagging', 'list_objects_v2')),
+    'tag_list': (['Tag List'], ('get_bucket_tagging',))
+}
+# Storage classes get a fixed pair of columns each, so no pass over the buckets is needed to lay out the report
+S3_STORAGE_CLASSES = sorted([
+    'DEEP_ARCHIVE', 'EXPRESS_ONEZONE', 'GLACIER', 'GLACIER_IR', 'INTELLIGENT_TIERING', 'ONEZONE_IA',
+    'OUTPOSTS', 'REDUCED_REDUNDANCY', 'SNOW', 'STANDARD', 'STANDARD_IA'
+]) + ['OTHER']
+S3_ANALYSIS_COLUMN_CALLS = {column: calls for column, (_, calls) in S3_ANALYSIS_COLUMNS.items()}
+
+
+def validate_analysis_columns(columns):
+    unknown = [column for column in columns or [] if column not in S3_ANALYSIS_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown columns {', '.join(unknown)}, expected any of: {', '.join(S3_ANALYSIS_COLUMNS)}")
+
 
 class S3Analyzer:
-    def __init__(self, session_name: str, master_role: str, slave_role:str):
+    def __init__(self, session_name: str, master_role: str, slave_role:str, region_workers: int = 8, columns: List[str] = None,
+                 resource_filter: ResourceFilter = None):
         self.session_name = session_name
         self.master_role = master_role
         self.slave_role = slave_role
+        self.region_workers = region_workers
+        # Only the calls the requested report columns depend on are made, plus those the filter reads
+        validate_analysis_columns(columns)
+        self.calls = required_calls(columns, S3_ANALYSIS_COLUMN_CALLS)
+        self.resource_filter = resource_filter or ResourceFilter()
+        if self.resource_filter.needs('bucket', 'region'):
+            self.calls.add('get_bucket_location')
+        if self.resource_filter.needs('bucket', 'tags'):
+            self.calls.add('get_bucket_tagging')
         # Start with EC2's instance profile
         self.base_session = boto3.Session()
         self.master_session = None
@@ -72,9 +115,10 @@ class S3Analyzer:
             print(f"Error assuming role in account {account_id}: {str(e)}")
             raise
 
-    def analyze_bucket(self, session: boto3.Session, bucket_name: str, owner_info: Dict = None) -> Dict[str, Any]:
+    def analyze_bucket(self, session: boto3.Session, bucket_name: str, owner_info: Dict = None, region: str = None) -> Dict[str, Any]:
         try:
-            s3_client = session.client('s3')
+            # A client in the bucket's own region avoids a redirect on every request
+            s3_client = session.client('s3', region_name=region) if region else session.client('s3')
 
             # Initialize metrics
             metrics = {
@@ -95,13 +139,25 @@ class S3Analyzer:
             }
 
             # Get bucket region
-            try:
-                location = s3_client.get_bucket_location(Bucket=bucket_name)
-                metrics['bucket_info']['region'] = location.get('LocationConstraint') or 'us-east-1'
-            except Exception as e:
-                print(f"Error getting bucket location for {bucket_name}: {str(e)}")
+            if region:
+                metrics['bucket_info']['region'] = region
+            elif 'get_bucket_location' in self.calls:
+                try:
+                    location = s3_client.get_bucket_location(Bucket=bucket_name)
+                    metrics['bucket_info']['region'] = bucket_region(location)
+                except Exception as e:
+                    print(f"Error getting bucket location for {bucket_name}: {str(e)}")
+                if not self.resource_filter.check('bucket', region=metrics['bucket_info']['region']):
+                    metrics['filtered_out'] = True
+                    return metrics
 
             
+            if 'list_objects_v2' not in self.calls:
+                metrics['skipped_analysis'] = True
+                metrics['skip_reason'] = 'Not requested'
+            if 'get_bucket_tagging' not in self.calls:
+                return metrics
+
             # Check bucket tags first
             try:
                 tag_response = s3_client.get_bucket_tagging(Bucket=bucket_name)
@@ -122,8 +178,15 @@ class S3Analyzer:
                 else:
                     raise
 
+            # Filtered buckets are dropped before their objects are listed
+            if not self.resource_filter.check('bucket', tags=tag_dict(metrics['tags']['tag_list'])):
+                metrics['filtered_out'] = True
+                return metrics
+
             # Only analyze bucket contents if it has no tags or has PII tags
-            if not metrics['tags']['has_tags'] or metrics['tags']['has_pii']:
+            if metrics.get('skipped_analysis'):
+                pass
+            elif not metrics['tags']['has_tags'] or metrics['tags']['has_pii']:
                 print(f"Analyzing contents of bucket {bucket_name} - No tags: {not metrics['tags']['has_tags']}, Has PII: {metrics['tags']['has_pii']}")
 
                 paginator = s3_client.get_paginator('list_objects_v2')
@@ -160,37 +223,145 @@ class S3Analyzer:
             return None
     
 
-    def analyze_accounts(self, slave_accounts: List[str], check_master_too: bool = False) -> Dict[str, Any]:
+    @staticmethod
+    def owner_info(list_buckets_response: Dict) -> Dict[str, str]:
+        """Bucket owner from list_buckets in the display_name/id form the reports read"""
+        owner = list_buckets_response.get('Owner', {})
+        return {'display_name': owner.get('DisplayName', 'unknown'), 'id': owner.get('ID', 'unknown')}
+
+    def locate_buckets(self, session: boto3.Session, buckets: List[Dict]) -> Dict[str, List[Dict]]:
+        """Group buckets by the region they live in, buckets whose region fails the filter are left out"""
+        if not self.calls & {'get_bucket_location', 'list_objects_v2'}:
+            # Neither the Region column, a region filter nor a content listing needs the location
+            return {'unknown': list(buckets)}
+        s3_client = session.client('s3')
+        buckets_by_region = {}
+        for bucket in buckets:
+            try:
+                location = s3_client.get_bucket_location(Bucket=bucket['Name'])
+                region = bucket_region(location)
+            except Exception as e:
+                print(f"Error getting bucket location for {bucket['Name']}: {str(e)}")
+                region = 'unknown'
+            if not self.resource_filter.check('bucket', region=region):
+                continue
+            buckets_by_region.setdefault(region, []).append(bucket)
+        return buckets_by_region
+
+    def analyze_account_buckets(self, session: boto3.Session, account_id: str, buckets: List[Dict], owner_info: Dict) -> Dict[str, Any]:
+        """
+        Analyze all buckets of one account, one worker per bucket region.
+        Buckets in regions that are not enabled in the account are reported as skipped
+        without calling their regional endpoint.
+        """
+        # Name and creation date come with list_buckets, so those filters cost no call at all
+        buckets = [bucket for bucket in buckets
+                   if self.resource_filter.check('bucket', name=bucket['Name'], created=bucket['CreationDate'])]
+        buckets_by_region = self.locate_buckets(session, buckets)
+
+        def analyze_region(region_session: boto3.Session, region: str) -> Dict[str, Any]:
+            region_results = {}
+            for bucket in buckets_by_region[region]:
+                bucket_result = self.analyze_bucket(region_session, bucket['Name'], owner_info, region=region)
+                if bucket_result is not None and bucket_result.get('filtered_out'):
+                    continue
+                if bucket_result is not None:
+                    bucket_result['bucket_info']['creation_date'] = bucket['CreationDate'].isoformat()
+                    region_results[bucket['Name']] = bucket_result
+                else:
+                    print(f"Skipping bucket {bucket['Name']} in account {account_id} due to analysis failure")
+            return region_results
+
+        located_regions = [region for region in buckets_by_region if region != 'unknown']
+        try:
+            region_results = run_region_collectors(
+                session,
+                analyze_region,
+                account_id=account_id,
+                regions=located_regions,
+                service_name='s3',
+                max_workers=self.region_workers
+            ) if located_regions else {}
+        except Exception as e:
+            # Neither account:ListRegions nor ec2:DescribeRegions allowed, the enabled regions are unknown
+            print(f"WARNING: Unable to list the enabled regions of account {account_id}, analyzing its buckets with the default client: {str(e)}")
+            region_results = {region: analyze_region(session, region) for region in located_regions}
+
+        results = {}
+        for region in located_regions:
+            if region in region_results:
+                results.update(region_results[region])
+                continue
+            for bucket in buckets_by_region[region]:
+                print(f"Skipping bucket {bucket['Name']} in account {account_id}, region {region} is not enabled or failed")
+                results[bucket['Name']] = {
+                    'bucket_name': bucket['Name'],
+                    'total_size': 0,
+                    'total_objects': 0,
+                    'storage_classes': {},
+                    'tags': {'has_tags': False, 'has_pii': False, 'tag_list': []},
+                    'bucket_info': {
+                        'region': region,
+                        'owner': owner_info or {'display_name': 'unknown', 'id': 'unknown'},
+                        'creation_date': bucket['CreationDate'].isoformat()
+                    },
+                    'skipped_analysis': True,
+                    'skip_reason': f"Region {region} not enabled or unreachable"
+                }
+
+        # Buckets whose location lookup failed fall back to the default client
+        for bucket in buckets_by_region.get('unknown', []):
+            bucket_result = self.analyze_bucket(session, bucket['Name'], owner_info)
+            if bucket_result is not None and bucket_result.get('filtered_out'):
+                continue
+            if bucket_result is not None:
+                bucket_result['bucket_info']['creation_date'] = bucket['CreationDate'].isoformat()
+                results[bucket['Name']] = bucket_result
+            else:
+                print(f"Skipping bucket {bucket['Name']} in account {account_id} due to analysis failure")
+
+        return results
+
+    def analyze_accounts(self, slave_accounts: List[str], check_master_too: bool = False, on_account_done=None) -> Dict[str, Any]:
+        """
+        Analyze the master (optionally) and slave accounts. With on_account_done(account, buckets) each
+        account is handed over as soon as it is analyzed ('master' for the master account) instead of
+        being kept in the returned results.
+        """
+        def account_done(section, account_key, buckets):
+            if on_account_done:
+                on_account_done(account_key, buckets)
+            elif section == 'master_account':
+                results['master_account'] = buckets
+            else:
+                results['slave_accounts'][account_key] = buckets
+
         try:
             results = {'master_account': {}, 'slave_accounts': {}}
 
             # Assume master role first
             self.assume_master_role()
 
-            if check_master_too:
+            master_account_id = self.master_role.split(':')[4]
+            if check_master_too and not self.resource_filter.accounts([master_account_id]):
+                print(f"INFO: Master account {master_account_id} excluded by the filter")
+            elif check_master_too:
                 s3_client = self.master_session.client('s3')
                 try:
                     # Single list_buckets call for master account
                     list_buckets_response = s3_client.list_buckets()
                     buckets = list_buckets_response['Buckets']
-                    owner_info = list_buckets_response['Owner']
+                    owner_info = self.owner_info(list_buckets_response)
 
                     if len(buckets) >= 1000:
                         print("Warning: Possible bucket list truncation in master account")
 
                     print("Analyzing master account buckets...")
-                    for bucket in buckets:
-                        bucket_name = bucket['Name']
-                        bucket_result = self.analyze_bucket(self.master_session, bucket_name, owner_info)
-                        if bucket_result is not None:
-                            bucket_result['bucket_info']['creation_date'] = bucket['CreationDate'].isoformat()
-                            results['master_account'][bucket_name] = bucket_result
-                        else:
-                            print(f"Skipping bucket {bucket_name} due to analysis failure")
+                    account_done('master_account', 'master', self.analyze_account_buckets(self.master_session, master_account_id, buckets, owner_info))
                 except Exception as e:
                     print(f"Error analyzing master account: {str(e)}")
 
-            for account_id in slave_accounts:
+            for account_id in self.resource_filter.accounts(slave_accounts):
                 try:
                     print(f"Analyzing account {account_id}...")
                     # Re-assume master role before each slave role assumption
@@ -201,20 +372,12 @@ class S3Analyzer:
                     # Single list_buckets call for each slave account
                     list_buckets_response = s3_client.list_buckets()
                     buckets = list_buckets_response['Buckets']
-                    owner_info = list_buckets_response['Owner']
+                    owner_info = self.owner_info(list_buckets_response)
 
                     if len(buckets) >= 1000:
                         print(f"Warning: Possible bucket list truncation in account {account_id}")
 
-                    results['slave_accounts'][account_id] = {}
-                    for bucket in buckets:
-                        bucket_name = bucket['Name']
-                        bucket_result = self.analyze_bucket(slave_session, bucket_name, owner_info)
-                        if bucket_result is not None:
-                            bucket_result['bucket_info']['creation_date'] = bucket['CreationDate'].isoformat()
-                            results['slave_accounts'][account_id][bucket_name] = bucket_result
-                        else:
-                            print(f"Skipping bucket {bucket_name} in account {account_id} due to analysis failure")
+                    account_done('slave_accounts', account_id, self.analyze_account_buckets(slave_session, account_id, buckets, owner_info))
                 except Exception as e:
                     print(f"Error analyzing account {account_id}: {str(e)}")
                     continue
@@ -270,7 +433,7 @@ class Utility:
                     print(f"    Objects: {stats['object_count']}")
                     print(f"    Size: {Utility.format_bytes(stats['total_size'])}")
             else:
-                print("Content analysis skipped - Has tags but no PII")
+                print(f"Content analysis skipped - {metrics.get('skip_reason', 'Has tags but no PII')}")
 
         # Print tag summary
         print(f"\nUntagged Buckets ({len(untagged_buckets)}):")
@@ -287,19 +450,8 @@ class Utility:
 
     
     @staticmethod
-    def save_to_csv(account_id: str, buckets_data: Dict[str, Any], output_dir: Path):
-        csv_filename = output_dir / f"s3_analysis_{account_id}.csv"
-
-        # First pass: collect all unique storage classes across all buckets
-        storage_classes = set()
-        for metrics in buckets_data.values():
-            if not metrics.get('skipped_analysis'):
-                storage_classes.update(metrics['storage_classes'].keys())
-
-        # Sort storage classes for consistent column ordering
-        storage_classes = sorted(list(storage_classes))
-
-        # Define CSV headers
+    def analysis_headers(columns: List[str] = None) -> List[str]:
+        """Fixed layout of s3_analysis_<account>.csv, only the requested columns (and the bucket name) when columns is set"""
         base_headers = [
             'Bucket Name',
             'Region',
@@ -315,7 +467,7 @@ class Utility:
 
         # Add columns for each storage class (size and count)
         storage_class_headers = []
-        for sc in storage_classes:
+        for sc in S3_STORAGE_CLASSES:
             storage_class_headers.extend([
                 f'{sc}_Objects',
                 f'{sc}_Size'
@@ -323,45 +475,86 @@ class Utility:
 
         headers = base_headers + storage_class_headers + ['Tag List']
 
-        with open(csv_filename, 'w', newline='') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=headers)
-            writer.writeheader()
+        # Only the requested columns, the bucket name is always kept
+        if columns is not None:
+            selected = {'Bucket Name'}
+            for column in columns:
+                selected.update(S3_ANALYSIS_COLUMNS[column][0])
+            if 'storage_classes' in columns:
+                selected.update(storage_class_headers)
+            headers = [header for header in headers if header in selected]
+        return headers
 
-            for bucket_name, metrics in buckets_data.items():
-                # Prepare tag list string
-                tag_list = [f"{tag['Key']}={tag['Value']}"
-                        for tag in metrics['tags'].get('tag_list', [])]
-
-                # Initialize row with base data
-                row = {
-                    'Bucket Name': bucket_name,
-                    'Region': metrics['bucket_info']['region'],
-                    'Owner Display Name': metrics['bucket_info']['owner']['display_name'],
-                    'Owner ID': metrics['bucket_info']['owner']['id'],
-                    'Creation Date': metrics['bucket_info']['creation_date'],
-                    'Has Tags': 'Yes' if metrics['tags']['has_tags'] else 'No',
-                    'Has PII Tags': 'Yes' if metrics['tags']['has_pii'] else 'No',
-                    'Total Size (Bytes)': metrics['total_size'] if not metrics.get('skipped_analysis') else 'Not Analyzed',
-                    'Total Size (Human Readable)': Utility.format_bytes(metrics['total_size']) if not metrics.get('skipped_analysis') else 'Not Analyzed',
-                    'Total Objects': metrics['total_objects'] if not metrics.get('skipped_analysis') else 'Not Analyzed',
-                    'Tag List': '; '.join(tag_list) if tag_list else 'No Tags'
-                }
+    @staticmethod
+    def bucket_row(bucket_name: str, metrics: Dict[str, Any]) -> Dict[str, Any]:
+        # Prepare tag list string
+        tag_list = [f"{tag['Key']}={tag['Value']}"
+                for tag in metrics['tags'].get('tag_list', [])]
+
+        # Initialize row with base data
+        row = {
+            'Bucket Name': bucket_name,
+            'Region': metrics['bucket_info']['region'],
+            'Owner Display Name': metrics['bucket_info']['owner']['display_name'],
+            'Owner ID': metrics['bucket_info']['owner']['id'],
+            'Creation Date': metrics['bucket_info']['creation_date'],
+            'Has Tags': 'Yes' if metrics['tags']['has_tags'] else 'No',
+            'Has PII Tags': 'Yes' if metrics['tags']['has_pii'] else 'No',
+            'Total Size (Bytes)': metrics['total_size'] if not metrics.get('skipped_analysis') else 'Not Analyzed',
+            'Total Size (Human Readable)': Utility.format_bytes(metrics['total_size']) if not metrics.get('skipped_analysis') else 'Not Analyzed',
+            'Total Objects': metrics['total_objects'] if not metrics.get('skipped_analysis') else 'Not Analyzed',
+            'Tag List': '; '.join(tag_list) if tag_list else 'No Tags',
+            # Map column of the Parquet dataset, left out of the CSV report
+            'Tags': tag_dict(metrics['tags'].get('tag_list'))
+        }
+
+        # Add storage class data
+        if not metrics.get('skipped_analysis'):
+            for sc in S3_STORAGE_CLASSES:
+                row[f'{sc}_Objects'] = 0
+                row[f'{sc}_Size'] = 0
+            for sc, stats in metrics['storage_classes'].items():
+                # Classes newer than S3_STORAGE_CLASSES are counted under OTHER
+                column = sc if sc in S3_STORAGE_CLASSES else 'OTHER'
+                row[f'{column}_Objects'] += stats['object_count']
+                row[f'{column}_Size'] += stats['total_size']
+        else:
+            for sc in S3_STORAGE_CLASSES:
+                row[f'{sc}_Objects'] = 'Not Analyzed'
+                row[f'{sc}_Size'] = 'Not Analyzed'
+        return row
 
-                # Add storage class data
-                if not metrics.get('skipped_analysis'):
-                    for sc in storage_classes:
-                        if sc in metrics['storage_classes']:
-                            row[f'{sc}_Objects'] = metrics['storage_classes'][sc]['object_count']
-                            row[f'{sc}_Size'] = metrics['storage_classes'][sc]['total_size']
-                        else:
-                            row[f'{sc}_Objects'] = 0
-                            row[f'{sc}_Size'] = 0
-                else:
-                    for sc in storage_classes:
-                        row[f'{sc}_Objects'] = 'Not Analyzed'
-                        row[f'{sc}_Size'] = 'Not Analyzed'
+    @staticmethod
+    def analysis_schema(columns: List[str] = None) -> List[tuple]:
+        """Typed layout of the s3_analysis Parquet dataset, where the tag list is the Tags map column"""
+        schema = []
+        for header in Utility.analysis_headers(columns):
+            if header == 'Tag List':
+                schema.append(('Tags', 'tags'))
+            elif header == 'Creation Date':
+                schema.append((header, 'timestamp'))
+            elif header in ('Has Tags', 'Has PII Tags'):
+                schema.append((header, 'bool'))
+            elif header in ('Total Size (Bytes)', 'Total Objects') or header.endswith(('_Objects', '_Size')):
+                schema.append((header, 'int'))
+            else:
+                schema.append((header, 'string'))
+        return schema
 
-                writer.writerow(row)
+    @staticmethod
+    def save_to_parquet(account_id: str, buckets_data: Dict[str, Any], sink: ParquetDatasetSink):
+        for bucket_name, metrics in buckets_data.items():
+            sink.write(dict(Utility.bucket_row(bucket_name, metrics), account=account_id))
+        sink.close_account(account_id)
+        print(f"Parquet report of account {account_id} saved under: {sink.root_dir}")
+
+    @staticmethod
+    def save_to_csv(account_id: str, buckets_data: Dict[str, Any], output_dir: Path, columns: List[str] = None):
+        csv_filename = output_dir / f"s3_analysis_{account_id}.csv"
+
+        with CsvSink(csv_filename, Utility.analysis_headers(columns)) as sink:
+            for bucket_name, metrics in buckets_data.items():
+                sink.write(Utility.bucket_row(bucket_name, metrics))
 
         print(f"CSV report saved as: {csv_filename}")
 
@@ -377,6 +570,14 @@ if __name__ == "__main__":
     SLAVE_ACCOUNTS = [ '111111111111' ]
     SLAVE_ROLE = 'xyx'
     CHECK_MASTER = True
+    # Columns=region,has_tags limits the reports and the API calls to those columns, empty means all
+    COLUMNS = parse_columns(os.environ.get('Columns', ''))
+    # Filter="bucket.name~^prod-;tag:pii" keeps only matching accounts and buckets, see filters.ResourceFilter.parse
+    FILTER = os.environ.get('Filter', '')
+    # OutputFormat=csv|parquet|auto, auto writes Parquet for runs over many accounts
+    OUTPUT_FORMAT = os.environ.get('OutputFormat', '')
+    # ResultsStore=/path/results.db also appends every account to the store shared by all runs
+    RESULTS_STORE = os.environ.get('ResultsStore', '').strip()
 
 
     # Validate configuration
@@ -394,10 +595,25 @@ if __name__ == "__main__":
         sys.exit(1)
 
 
-    # Initialize and run analysis
-    analyzer = S3Analyzer(session_name=SESSION_NAME, master_role=MASTER_ROLE_ARN, slave_role=SLAVE_ROLE)
-    results = analyzer.analyze_accounts(slave_accounts=SLAVE_ACCOUNTS, check_master_too=CHECK_MASTER)
+    # Shard=i/N analyzes only this agent's share of the accounts, the master account goes with shard 0
+    shard = os.environ.get('Shard', '').strip()
+    if shard:
+        try:
+            shard_index, _ = parse_shard(shard)
+        except ValueError as e:
+            print(f"Error: {str(e)}")
+            sys.exit(1)
+        SLAVE_ACCOUNTS = select_shard(SLAVE_ACCOUNTS, shard, os.environ.get('ShardHistory', '').strip() or None)
+        CHECK_MASTER = CHECK_MASTER and shard_index == 0
 
+    # Initialize and run analysis
+    try:
+        analyzer = S3Analyzer(session_name=SESSION_NAME, master_role=MASTER_ROLE_ARN, slave_role=SLAVE_ROLE, columns=COLUMNS,
+                              resource_filter=parse_filter(FILTER))
+        output_format = choose_output_format(OUTPUT_FORMAT, len(SLAVE_ACCOUNTS) + (1 if CHECK_MASTER else 0))
+    except ValueError as e:
+        print(f"Error: {str(e)}")
+        sys.exit(1)
     
     # Create output directory for reports
     try:
@@ -408,24 +624,46 @@ if __name__ == "__main__":
         sys.exit(1)
     
     
-    # Save results to file
+    # Every account goes to the results file and its CSV report as soon as it is analyzed
     output_file = output_dir / f's3_analysis_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json'
-    with open(output_file, 'w') as f:
-        json.dump(results, f, indent=2, default=str)
+    results_sink = JsonObjectSink(output_file, 'slave_accounts')
+    master_buckets = {}
+    store = ResultsStore(RESULTS_STORE, default_run_id('s3-analysis')) if RESULTS_STORE else None
+    if store:
+        store.start_run('s3_analysis')
+    # One dataset for the whole run, partitioned by run date, account and region
+    parquet_sink = None
+    if output_format == 'parquet':
+        parquet_sink = ParquetDatasetSink(output_dir / 's3_analysis', Utility.analysis_schema(COLUMNS), run_id=BUILD_NUMBER,
+                                          region_column='Region')
 
-    # Print summary
     print("\nAnalysis Summary:")
     print("================")
 
-    
-    # Print master account summary
-    if CHECK_MASTER:
-        Utility.print_account_summary("Master Account", results['master_account'])
-        Utility.save_to_csv("master", results['master_account'], output_dir)
-
-    # Print slave accounts summary
-    for account_id, buckets in results['slave_accounts'].items():
-        Utility.print_account_summary(f"Account: {account_id}", buckets)
-        Utility.save_to_csv(account_id, buckets, output_dir)
+    def report_account(account_id, buckets):
+        if account_id == 'master':
+            master_buckets.update(buckets)
+            Utility.print_account_summary("Master Account", buckets)
+        else:
+            results_sink.write(account_id, buckets)
+            Utility.print_account_summary(f"Account: {account_id}", buckets)
+        if parquet_sink:
+            Utility.save_to_parquet(account_id, buckets, parquet_sink)
+        else:
+            Utility.save_to_csv(account_id, buckets, output_dir, COLUMNS)
+        if store:
+            store.write_account('s3_analysis', account_id, [Utility.bucket_row(bucket_name, metrics) for bucket_name, metrics in buckets.items()])
+
+    run_status = 'failed'
+    try:
+        analyzer.analyze_accounts(slave_accounts=SLAVE_ACCOUNTS, check_master_too=CHECK_MASTER, on_account_done=report_account)
+        run_status = 'success'
+    finally:
+        results_sink.close(master_account=master_buckets)
+        if parquet_sink:
+            parquet_sink.close()
+        if store:
+            store.finish_run(run_status)
+            store.close()
 
     print(f"\nAll reports have been saved in directory: {output_dir}")
@@ -1,9 +1,23 @@
 import boto3
-import csv
 import os
+import sys
 from datetime import datetime
+from pathlib import Path
 
-def read_data(slave_session):
+# Shared helpers live one directory up in aws/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from filters import ResourceFilter, parse_filter
+from regions import bucket_region
+from sinks import CsvSink
+
+
+INVENTORY_HEADERS = ['Account ID', 'Bucket Name', 'Bucket ARN', 'Created By Terraform', 'Role', 'Number of Lifecycle Rules']
+INVENTORY_COLUMN_TYPES = {'Number of Lifecycle Rules': 'int'}
+
+
+def read_data(slave_session, resource_filter=None):
+    """Inventory rows of the account's buckets, buckets outside resource_filter are dropped as early as their data allows"""
+    resource_filter = resource_filter or ResourceFilter()
     s3_client = slave_session.client('s3')
     account_id = slave_session.client('sts').get_caller_identity()['Account']
 
@@ -14,6 +28,14 @@ def read_data(slave_session):
 
     for bucket in response['Buckets']:
         bucket_name = bucket['Name']
+        if not resource_filter.check('bucket', name=bucket_name, created=bucket['CreationDate']):
+            continue
+
+        # The region is not part of the inventory, it is only looked up for a region filter
+        if resource_filter.needs('bucket', 'region'):
+            location = s3_client.get_bucket_location(Bucket=bucket_name)
+            if not resource_filter.check('bucket', region=bucket_region(location)):
+                continue
 
         # Get bucket ARN
         bucket_arn = f"arn:aws:s3:::{bucket_name}"
@@ -28,6 +50,8 @@ def read_data(slave_session):
             else:
                 print(f"Error getting tags for bucket {bucket_name}: {str(e)}")
                 tags = e.response['Error']['Code']
+        if not resource_filter.check('bucket', tags=tags if isinstance(tags, dict) else {}):
+            continue
 
         # Determine if created by Terraform
         created_by_terraform = "No"
@@ -68,45 +92,36 @@ def read_data(slave_session):
 
     return buckets_data
 
-def collect_all_accounts_data(slave_account_ids):
+def collect_all_accounts_data(slave_account_ids, resource_filter=None):
     """
     Collects S3 bucket data from multiple AWS accounts and saves to CSV.
 
     Args:
         slave_account_ids: List of slave account IDs to process
+        resource_filter: Optional ResourceFilter, accounts and buckets outside it are skipped
 
     Returns:
         str: Path to the generated CSV file
     """
-    all_data = []
-
-    for slave_account_id in slave_account_ids:
-        try:
-            # Assume you have a function to create a session for each account
-            # This is a placeholder - you'll need to implement the actual session creation
-            slave_session = create_session_for_account(slave_account_id)
-
-            # Get data for this account
-            account_data = read_data(slave_session)
-            if account_data:  # Only append if there's data to add
-                all_data.append(account_data)  # Append individual account data to the list
-               
-
-            print(f"Successfully processed account {slave_account_id}")
-        except Exception as e:
-            print(f"Error processing account {slave_account_id}: {str(e)}")
-
-    # Write all data to CSV
+    resource_filter = resource_filter or ResourceFilter()
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     csv_filename = f"s3_buckets_inventory_{timestamp}.csv"
 
-    with open(csv_filename, 'w', newline='') as csvfile:
-        fieldnames = ['Account ID', 'Bucket Name', 'Bucket ARN', 'Created By Terraform', 'Role', 'Number of Lifecycle Rules']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+    # Rows go to the CSV as each account finishes, nothing is kept across accounts
+    with CsvSink(csv_filename, INVENTORY_HEADERS) as sink:
+        for slave_account_id in resource_filter.accounts(slave_account_ids):
+            try:
+                # Assume you have a function to create a session for each account
+                # This is a placeholder - you'll need to implement the actual session creation
+                slave_session = create_session_for_account(slave_account_id)
+
+                # Get data for this account
+                sink.write_rows(read_data(slave_session, resource_filter))
+                sink.flush()
 
-        writer.writeheader()
-        for row in all_data:
-            writer.writerow(row)
+                print(f"Successfully processed account {slave_account_id}")
+            except Exception as e:
+                print(f"Error processing account {slave_account_id}: {str(e)}")
 
     print(f"Data written to {csv_filename}")
     return csv_filename
@@ -149,8 +164,15 @@ if __name__ == "__main__":
     # Example list of slave account IDs
     slave_account_ids = ['123456789012', '234567890123', '345678901234']
 
+    # Filter="bucket.name~^prod-;created>=2024-01-01" limits the inventory, see filters.ResourceFilter.parse
+    try:
+        resource_filter = parse_filter(os.environ.get('Filter', ''))
+    except ValueError as e:
+        print(f"Error: {str(e)}")
+        sys.exit(1)
+
     # Collect data from all accounts
-    csv_file = collect_all_accounts_data(slave_account_ids)
+    csv_file = collect_all_accounts_data(slave_account_ids, resource_filter)
 
     # Created/Modified files during execution:
     print(f"Created file: {csv_file}")
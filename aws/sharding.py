@@ -0,0 +1,63 @@
+import hashlib
+import json
+import os
+
+
+def parse_shard(shard_spec):
+    """'i/N' -> (i, N) with 0 <= i < N"""
+    try:
+        index, count = (int(part) for part in shard_spec.split('/'))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{shard_spec}', expected i/N")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard '{shard_spec}', i must be between 0 and N-1")
+    return index, count
+
+
+def stable_hash(account_id):
+    return int(hashlib.sha256(str(account_id).encode('utf-8')).hexdigest(), 16)
+
+
+def load_shard_weights(history_file):
+    """Expected seconds per account from a duration history file (account_durations.json format)"""
+    if not history_file or not os.path.exists(history_file):
+        return {}
+    with open(history_file, 'r') as f:
+        return {account_id: entry['duration'] for account_id, entry in json.load(f).items()}
+
+
+def assign_shards(account_ids, shard_count, weights=None):
+    """
+    Map every account to a shard. Every shard computes the same assignment from the same inputs.
+
+    Without weights an account goes to hash(account) mod N, so it stays put as accounts come
+    and go. With weights the heaviest accounts are placed first on the least loaded shard,
+    preferring the hash shard on ties. Accounts without history weigh the average.
+    """
+    account_ids = sorted(set(account_ids))
+    if not weights:
+        return {account_id: stable_hash(account_id) % shard_count for account_id in account_ids}
+
+    known_weights = [weights[account_id] for account_id in account_ids if account_id in weights]
+    default_weight = sum(known_weights) / len(known_weights) if known_weights else 1.0
+    loads = [0.0] * shard_count
+    assignment = {}
+    for account_id in sorted(account_ids, key=lambda account_id: (-weights.get(account_id, default_weight), stable_hash(account_id))):
+        home_shard = stable_hash(account_id) % shard_count
+        shard = min(range(shard_count), key=lambda shard: (loads[shard], shard != home_shard, shard))
+        assignment[account_id] = shard
+        loads[shard] += weights.get(account_id, default_weight)
+    return assignment
+
+
+def select_shard(account_ids, shard_spec, history_file=None, weights=None):
+    """Accounts of account_ids that belong to shard i of N, in their original order. weights, when given, replace the history file"""
+    if not shard_spec:
+        return list(account_ids)
+    index, count = parse_shard(shard_spec)
+    if weights is None:
+        weights = load_shard_weights(history_file)
+    assignment = assign_shards(account_ids, count, weights)
+    selected = [account_id for account_id in account_ids if assignment[account_id] == index]
+    print(f"INFO: Shard {index}/{count} holds {len(selected)} of {len(set(account_ids))} accounts")
+    return selected
@@ -0,0 +1,287 @@
+import csv
+import json
+import os
+import threading
+from datetime import datetime
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+# Rows written between two flushes of a sink when the producer does not flush itself
+DEFAULT_FLUSH_ROWS = 100
+# Rows per Parquet row group, large enough for long sequential scans of a column
+DEFAULT_ROW_GROUP_ROWS = 64 * 1024
+OUTPUT_FORMATS = ('auto', 'csv', 'parquet')
+# Runs over at least this many accounts default to Parquet, smaller ones to CSV
+LARGE_RUN_ACCOUNTS = 50
+
+
+class CsvSink:
+    """
+    Rows appended to a CSV file with a schema fixed up front. The header goes out on open
+    and rows are flushed every flush_rows rows and on flush(), so nothing but the current
+    row is held in memory and the rows written so far survive a crash. Thread safe.
+    """
+
+    def __init__(self, output_file, schema, flush_rows=DEFAULT_FLUSH_ROWS):
+        self.output_file = output_file
+        self.schema = list(schema)
+        self.flush_rows = flush_rows
+        self.lock = threading.Lock()
+        self.rows = 0
+        self.unflushed = 0
+        self.file = open(output_file, 'w', newline='')
+        # Fields outside the schema are dropped rather than changing the layout mid file
+        self.writer = csv.DictWriter(self.file, fieldnames=self.schema, extrasaction='ignore')
+        self.writer.writeheader()
+        self.file.flush()
+
+    def write(self, row):
+        with self.lock:
+            self.writer.writerow(row)
+            self.rows += 1
+            self.unflushed += 1
+            if self.unflushed >= self.flush_rows:
+                self._flush()
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.write(row)
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        self.file.flush()
+        self.unflushed = 0
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class PartitionedCsvSink:
+    """One CsvSink per partition (usually an account), opened on its first row as file_pattern.format(partition)"""
+
+    def __init__(self, file_pattern, schema, flush_rows=DEFAULT_FLUSH_ROWS):
+        self.file_pattern = file_pattern
+        self.schema = schema
+        self.flush_rows = flush_rows
+        self.lock = threading.Lock()
+        self.sinks = {}
+
+    def sink(self, partition):
+        with self.lock:
+            if partition not in self.sinks:
+                self.sinks[partition] = CsvSink(self.file_pattern.format(partition), self.schema, self.flush_rows)
+            return self.sinks[partition]
+
+    def write(self, partition, row):
+        self.sink(partition).write(row)
+
+    def close_partition(self, partition):
+        """Done with the partition, its file is complete"""
+        with self.lock:
+            sink = self.sinks.pop(partition, None)
+        if sink:
+            sink.close()
+            print(f"CSV report saved as: {sink.output_file}")
+
+    def flush(self):
+        with self.lock:
+            sinks = list(self.sinks.values())
+        for sink in sinks:
+            sink.flush()
+
+    def close(self):
+        with self.lock:
+            partitions = list(self.sinks)
+        for partition in partitions:
+            self.close_partition(partition)
+
+
+class JsonObjectSink:
+    """
+    {"<member_key>": {name: value, ...}, <fields given to close()>} written one member at a
+    time. Each member is flushed as soon as it is written.
+    """
+
+    def __init__(self, output_file, member_key):
+        self.output_file = output_file
+        self.lock = threading.Lock()
+        self.members = 0
+        self.file = open(output_file, 'w')
+        self.file.write('{' + json.dumps(member_key) + ': {')
+        self.file.flush()
+
+    def write(self, name, value):
+        with self.lock:
+            self.file.write((',\n' if self.members else '\n') + json.dumps(str(name)) + ': ' + json.dumps(value, default=str))
+            self.file.flush()
+            self.members += 1
+
+    def close(self, **fields):
+        with self.lock:
+            if self.file.closed:
+                return
+            self.file.write('\n}')
+            for name, value in fields.items():
+                self.file.write(',\n' + json.dumps(name) + ': ' + json.dumps(value, default=str))
+            self.file.write('}\n')
+            self.file.close()
+
+
+def arrow_type(type_name):
+    """Arrow type of a column type name used in report schemas: string, bool, int, timestamp or tags"""
+    return {
+        'string': pyarrow.string(),
+        'bool': pyarrow.bool_(),
+        'int': pyarrow.int64(),
+        'timestamp': pyarrow.timestamp('us', tz='UTC'),
+        'tags': pyarrow.map_(pyarrow.string(), pyarrow.string())
+    }[type_name]
+
+
+def typed_schema(headers, column_types):
+    """[(column, type name)] of a report, columns missing from column_types are strings"""
+    return [(header, column_types.get(header, 'string')) for header in headers]
+
+
+def choose_output_format(output_format, account_count):
+    """
+    csv or parquet for a run over account_count accounts. auto picks Parquet for large runs.
+    Parquet falls back to CSV when pyarrow is not installed.
+    """
+    output_format = (output_format or 'auto').lower()
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format '{output_format}', expected any of: {', '.join(OUTPUT_FORMATS)}")
+    if output_format == 'auto':
+        output_format = 'parquet' if account_count >= LARGE_RUN_ACCOUNTS else 'csv'
+    if output_format == 'parquet' and pyarrow is None:
+        print("WARNING: pyarrow module is not installed, falling back to CSV reports")
+        return 'csv'
+    return output_format
+
+
+def typed_value(value, type_name):
+    """
+    Report value as the column type. Values the type cannot hold, such as 'Unknown' in a count
+    or 'Not_Found' for tags, become null; the comments column of the report says why.
+    """
+    if value is None:
+        return None
+    if type_name == 'bool':
+        if isinstance(value, bool):
+            return value
+        return {'yes': True, 'true': True, 'no': False, 'false': False}.get(str(value).lower())
+    if type_name == 'int':
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+        return int(value) if isinstance(value, str) and value.isdigit() else None
+    if type_name == 'timestamp':
+        if isinstance(value, datetime):
+            return value
+        try:
+            return datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if type_name == 'tags':
+        return [(str(key), str(tag_value)) for key, tag_value in value.items()] if isinstance(value, dict) else None
+    return value if isinstance(value, str) else str(value)
+
+
+class ParquetDatasetSink:
+    """
+    Typed rows written as a Parquet dataset partitioned like
+    <root_dir>/run_date=YYYY-MM-DD/account=<id>/region=<region>/part-<run_id>.parquet,
+    readable as one table by pyarrow.dataset, Spark or Athena with hive partitioning.
+    schema is [(column, type name)], see arrow_type; the partition values are taken out
+    of each row's account_column and region_column and are not repeated inside the files.
+    Rows are buffered per partition and written a row group at a time, a partition's file
+    is complete once close_account() or close() is called. Thread safe.
+    """
+
+    def __init__(self, root_dir, schema, run_id, run_date=None, account_column='account', region_column='region',
+                 row_group_rows=DEFAULT_ROW_GROUP_ROWS):
+        if pyarrow is None:
+            raise RuntimeError("pyarrow module is not installed, Parquet output is not available")
+        self.root_dir = root_dir
+        self.run_id = run_id
+        self.run_date = (run_date or datetime.now()).strftime('%Y-%m-%d')
+        self.account_column = account_column
+        self.region_column = region_column
+        self.columns = [(column, type_name) for column, type_name in schema if column not in (account_column, region_column)]
+        self.arrow_schema = pyarrow.schema([(column, arrow_type(type_name)) for column, type_name in self.columns])
+        self.row_group_rows = row_group_rows
+        self.lock = threading.Lock()
+        self.rows = 0
+        self.files = 0
+        # (account, region) -> [writer, buffered rows]
+        self.partitions = {}
+
+    def write(self, row):
+        account = str(row.get(self.account_column) or 'unknown')
+        # Reports without a region go under region=global
+        region = str(row.get(self.region_column) or 'unknown') if self.region_column else 'global'
+        with self.lock:
+            partition = self.partitions.setdefault((account, region), [None, []])
+            partition[1].append(row)
+            self.rows += 1
+            if len(partition[1]) >= self.row_group_rows:
+                self._write_row_group(account, region, partition)
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.write(row)
+
+    def _write_row_group(self, account, region, partition):
+        writer, rows = partition
+        if not rows:
+            return
+        if writer is None:
+            partition_dir = os.path.join(self.root_dir, f"run_date={self.run_date}", f"account={account}", f"region={region}")
+            os.makedirs(partition_dir, exist_ok=True)
+            writer = partition[0] = pyarrow.parquet.ParquetWriter(os.path.join(partition_dir, f"part-{self.run_id}.parquet"),
+                                                                  self.arrow_schema, compression='zstd')
+            self.files += 1
+        table = pyarrow.Table.from_pydict(
+            {column: [typed_value(row.get(column), type_name) for row in rows] for column, type_name in self.columns},
+            schema=self.arrow_schema
+        )
+        writer.write_table(table, row_group_size=self.row_group_rows)
+        partition[1] = []
+
+    def _close_partition(self, key):
+        partition = self.partitions.pop(key)
+        self._write_row_group(key[0], key[1], partition)
+        if partition[0] is not None:
+            partition[0].close()
+
+    def close_account(self, account):
+        """Done with the account, its files are complete"""
+        with self.lock:
+            for key in [key for key in self.partitions if key[0] == str(account)]:
+                self._close_partition(key)
+
+    def close(self):
+        with self.lock:
+            for key in list(self.partitions):
+                self._close_partition(key)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
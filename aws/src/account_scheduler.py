@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from aws_processor import AwsProcessor, FAILURE_POLICIES
+
+
+# Weight of the latest run in the expected duration of an account
+DURATION_SMOOTHING = 0.5
+
+
+def load_duration_history(history_file):
+    if not history_file or not os.path.exists(history_file):
+        return {}
+    try:
+        with open(history_file, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable duration history {history_file}: {e}")
+        return {}
+
+
+def save_duration_history(history_file, history, summary):
+    """Blend the durations of this run into the history, only for accounts that succeeded"""
+    for account_id, result in summary.items():
+        if result['status'] != 'success':
+            continue
+        previous = history.get(account_id)
+        if previous is None:
+            history[account_id] = {'duration': result['duration'], 'runs': 1}
+        else:
+            history[account_id] = {
+                'duration': DURATION_SMOOTHING * result['duration'] + (1 - DURATION_SMOOTHING) * previous['duration'],
+                'runs': previous['runs'] + 1
+            }
+
+    tmp_file = f"{history_file}.tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump(history, f, indent=2, sort_keys=True)
+    os.replace(tmp_file, history_file)
+    print(f"Duration history for {len(history)} accounts saved to {history_file}")
+
+
+def order_longest_first(account_list, history):
+    """
+    Longest expected duration first, so the slow accounts start early and the short ones
+    fill the gaps at the end. Accounts without history are treated as the slowest known one.
+    """
+    known_durations = [entry['duration'] for entry in history.values()]
+    unknown_duration = max(known_durations) if known_durations else 0.0
+    return sorted(
+        account_list,
+        key=lambda account_id: history.get(account_id, {}).get('duration', unknown_duration),
+        reverse=True
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run an AWS action across accounts on a fixed pool of workers')
+    parser.add_argument('--action', required=True)
+    parser.add_argument('--base_assume_arn', required=True, help='Role ARN, ACCOUNT_ID is replaced by each account')
+    parser.add_argument('--accounts', help='Comma separated account IDs')
+    parser.add_argument('--accounts_file', help='File with one account ID per line')
+    parser.add_argument('--workers', type=int, default=10)
+    parser.add_argument('--failure-policy', choices=FAILURE_POLICIES, default='continue')
+    parser.add_argument('--shard', help='i/N, run only shard i of N, balanced by the durations in --history')
+    parser.add_argument('--history', default='account_durations.json', help='Durations of previous runs, updated after this one')
+    args = parser.parse_args()
+
+    if args.accounts:
+        account_list = [account_id.strip() for account_id in args.accounts.split(',') if account_id.strip()]
+    elif args.accounts_file:
+        account_list = AwsProcessor.read_accounts_list(args.accounts_file)
+    else:
+        parser.error('one of --accounts or --accounts_file is required')
+
+    history = load_duration_history(args.history)
+    if args.shard:
+        # Imported only here: Jenkins runs this script from build/scripts without the aws directory next to it
+        from sharding import select_shard
+        try:
+            weights = {account_id: entry['duration'] for account_id, entry in history.items()}
+            account_list = select_shard(account_list, args.shard, weights=weights)
+        except ValueError as e:
+            parser.error(str(e))
+    ordered_accounts = order_longest_first(account_list, history)
+    print(f"Scheduling {len(ordered_accounts)} accounts on {args.workers} workers, longest expected first")
+
+    if not ordered_accounts:
+        print("No accounts detected to process")
+        return
+
+    # The executor hands the next account to whichever worker frees up first
+    summary, first_error = AwsProcessor.run_accounts(
+        ordered_accounts,
+        args.action,
+        args.base_assume_arn,
+        os.environ.get('WORKSPACE', os.getcwd()),
+        max_workers=args.workers,
+        failure_policy=args.failure_policy
+    )
+    save_duration_history(args.history, history, summary)
+
+    if first_error is not None or any(result['status'] != 'success' for result in summary.values()):
+        print("Error in scheduled run: not every account was processed successfully")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
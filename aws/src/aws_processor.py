@@ -1,4 +1,15 @@
-import subprocess
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from aws_runner import run_action
+
+# fail-fast: stop on the first failure, continue: finish every account,
+# retry-later: requeue failed accounts behind the rest before giving up on them
+FAILURE_POLICIES = ('fail-fast', 'continue', 'retry-later')
 
 class AwsProcessor:
     @staticmethod
@@ -19,39 +30,114 @@ class AwsProcessor:
 
     @staticmethod
     def run_aws_command(action, assume_role_arn, workspace):
-        cmd = [
-            f"{workspace}/src/aws_runner.sh",
-            "--action", action,
-            "--assume_arn", assume_role_arn
-        ]
-
+        # Runs in process with cached sessions instead of starting aws_runner.sh and the AWS CLI.
+        # workspace is kept so existing callers do not change.
         try:
-            result = subprocess.run(
-                cmd,
-                check=True,
-                text=True,
-                capture_output=True
-            )
-            print(f"AWS Command Output:\n{result.stdout}")
-            return result.stdout
-        except subprocess.CalledProcessError as e:
+            output = run_action(action, assume_role_arn)
+            print(f"AWS Command Output:\n{output}")
+            return output
+        except Exception as e:
             print(f"Error running AWS command: {e}")
             raise
 
     @staticmethod
-    def process_accounts(account_list, action, base_assume_role_arn, workspace):
-        if not account_list:
-            print("No accounts detected to process")
-            return
+    def process_account(account_id, action, base_assume_role_arn, workspace):
+        print(f"Processing Account ID: {account_id}")
+        assume_role_arn = AwsProcessor.construct_role_arn(
+            account_id,
+            base_assume_role_arn
+        )
+        return AwsProcessor.run_aws_command(action, assume_role_arn, workspace)
+
+    @staticmethod
+    def print_summary(summary):
+        print("Account processing summary:")
+        for account_id, result in summary.items():
+            line = f"  {account_id}: {result['status']} in {result['duration']:.1f}s ({result['attempts']} attempts)"
+            if result.get('error'):
+                line += f" - {result['error']}"
+            print(line)
+        statuses = [result['status'] for result in summary.values()]
+        print(f"Processed {len(statuses)} accounts: {statuses.count('success')} succeeded, "
+              f"{statuses.count('failed')} failed, {statuses.count('cancelled')} cancelled")
+
+    @staticmethod
+    def run_accounts(account_list, action, base_assume_role_arn, workspace,
+                     max_workers=1, failure_policy='fail-fast', retry_attempts=1):
+        """
+        Run the action for every account on max_workers threads, handing accounts out in
+        list order. Returns the per account summary of status, duration and attempts, and
+        the error that stopped a fail-fast run (None otherwise).
+        """
+        if failure_policy not in FAILURE_POLICIES:
+            raise ValueError(f"Unknown failure policy '{failure_policy}', expected one of: {', '.join(FAILURE_POLICIES)}")
+
+        summary = {account_id: {'status': 'cancelled', 'duration': 0.0, 'attempts': 0} for account_id in account_list}
 
-        for account_id in account_list:
+        def timed_process(account_id):
+            started = time.monotonic()
             try:
-                print(f"Processing Account ID: {account_id}")
-                assume_role_arn = AwsProcessor.construct_role_arn(
-                    account_id,
-                    base_assume_role_arn
-                )
-                AwsProcessor.run_aws_command(action, assume_role_arn, workspace)
+                AwsProcessor.process_account(account_id, action, base_assume_role_arn, workspace)
+                return None, time.monotonic() - started
             except Exception as e:
-                print(f"Failed to process account {account_id}: {e}")
-                raise
+                return e, time.monotonic() - started
+
+        first_error = None
+        workers = max(1, max_workers)
+        pending = deque(account_list)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            running = {}
+            while pending or running:
+                # Only as many accounts in flight as there are workers, so fail-fast starts nothing after a failure
+                while pending and len(running) < workers and first_error is None:
+                    account_id = pending.popleft()
+                    running[executor.submit(timed_process, account_id)] = account_id
+                if not running:
+                    # Accounts not started yet are left as cancelled
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    account_id = running.pop(future)
+                    error, duration = future.result()
+                    result = summary[account_id]
+                    result['attempts'] += 1
+                    result['duration'] += duration
+                    if error is None:
+                        result['status'] = 'success'
+                        result.pop('error', None)
+                        continue
+
+                    print(f"Failed to process account {account_id}: {error}")
+                    result['status'] = 'failed'
+                    result['error'] = str(error)
+                    if failure_policy == 'retry-later' and result['attempts'] <= retry_attempts:
+                        print(f"Retrying account {account_id} after the remaining accounts")
+                        pending.append(account_id)
+                    elif failure_policy == 'fail-fast' and first_error is None:
+                        first_error = error
+
+        AwsProcessor.print_summary(summary)
+        return summary, first_error
+
+    @staticmethod
+    def process_accounts(account_list, action, base_assume_role_arn, workspace,
+                         max_workers=1, failure_policy='fail-fast', retry_attempts=1):
+        """
+        Process every account and return the summary of run_accounts. Raises once the run
+        is over if any account failed, or straight after the first failure with fail-fast.
+        """
+        if not account_list:
+            print("No accounts detected to process")
+            return {}
+
+        summary, first_error = AwsProcessor.run_accounts(
+            account_list, action, base_assume_role_arn, workspace,
+            max_workers=max_workers, failure_policy=failure_policy, retry_attempts=retry_attempts
+        )
+        if first_error is not None:
+            raise first_error
+        failed_accounts = [account_id for account_id, result in summary.items() if result['status'] == 'failed']
+        if failed_accounts:
+            raise RuntimeError(f"Failed to process accounts: {', '.join(failed_accounts)}")
+        return summary
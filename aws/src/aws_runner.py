@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+
+import boto3
+
+
+# Refresh cached role credentials this long before they expire
+CREDENTIAL_REFRESH_MARGIN = timedelta(minutes=5)
+
+_base_sts_client = None
+_session_cache = {}
+_cache_lock = threading.Lock()
+
+
+def get_base_sts_client():
+    """STS client of the Jenkins instance credentials, built once per process"""
+    global _base_sts_client
+    with _cache_lock:
+        if _base_sts_client is None:
+            _base_sts_client = boto3.Session().client('sts')
+        return _base_sts_client
+
+
+def get_assumed_session(assume_role_arn, session_name=None):
+    """
+    boto3 session for the role, cached until its credentials are about to expire.
+    Returns (session, assumed role user ARN) so no extra get-caller-identity call is needed.
+    """
+    with _cache_lock:
+        cached = _session_cache.get(assume_role_arn)
+    if cached and cached['expiration'] - CREDENTIAL_REFRESH_MARGIN > datetime.now(timezone.utc):
+        return cached['session'], cached['identity']
+
+    session_name = session_name or f"AWS-S3-List-{os.environ.get('BUILD_NUMBER', 'local')}"
+    response = get_base_sts_client().assume_role(RoleArn=assume_role_arn, RoleSessionName=session_name)
+    credentials = response['Credentials']
+    session = boto3.Session(
+        aws_access_key_id=credentials['AccessKeyId'],
+        aws_secret_access_key=credentials['SecretAccessKey'],
+        aws_session_token=credentials['SessionToken']
+    )
+    with _cache_lock:
+        _session_cache[assume_role_arn] = {
+            'session': session,
+            'identity': response['AssumedRoleUser']['Arn'],
+            'expiration': credentials['Expiration']
+        }
+    return session, response['AssumedRoleUser']['Arn']
+
+
+def list_s3(session):
+    lines = ["Listing S3 buckets for assumed role..."]
+    for bucket in session.client('s3').list_buckets().get('Buckets', []):
+        # Same layout as `aws s3 ls`
+        lines.append(f"{bucket['CreationDate'].astimezone().strftime('%Y-%m-%d %H:%M:%S')} {bucket['Name']}")
+    return lines
+
+
+ACTIONS = {
+    'list': list_s3
+}
+
+
+def run_action(action, assume_role_arn):
+    """In-process equivalent of aws_runner.sh --action <action> --assume_arn <arn>. Returns the output text"""
+    if action not in ACTIONS:
+        raise ValueError(f"Unknown action '{action}', expected one of: {', '.join(sorted(ACTIONS))}")
+
+    output = [f"Assuming role: {assume_role_arn}"]
+    session, identity = get_assumed_session(assume_role_arn)
+    output.append(json.dumps({'Arn': identity}, indent=4))
+    output.extend(ACTIONS[action](session))
+    return '\n'.join(output) + '\n'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run an AWS action as an assumed role')
+    parser.add_argument('--action', required=True, choices=sorted(ACTIONS))
+    parser.add_argument('--assume_arn', required=True)
+    args = parser.parse_args()
+    print(run_action(args.action, args.assume_arn), end='')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,15 @@
 #!/usr/bin/env python3
 
-from src.python.aws_processor import AwsProcessor
+from src.python.aws_processor import AwsProcessor, FAILURE_POLICIES
+import argparse
 import os
 
 def main():
+    parser = argparse.ArgumentParser(description='Run an AWS action in every account of config/accounts.list')
+    parser.add_argument('--workers', type=int, default=1, help='Accounts processed at once, 1 keeps the sequential run')
+    parser.add_argument('--failure-policy', choices=FAILURE_POLICIES, default='fail-fast')
+    args = parser.parse_args()
+
     try:
         # Read accounts
         accounts = AwsProcessor.read_accounts_list('config/accounts.list')
@@ -11,12 +17,14 @@ def main():
         # Base role ARN with placeholder
         base_assume_role_arn = "arn:aws:iam::ACCOUNT_ID:role/cross-account-role"
 
-        # Process accounts sequentially
+        # Sequential by default, --workers N processes N accounts at a time
         AwsProcessor.process_accounts(
             accounts,
             "list",
             base_assume_role_arn,
-            os.environ['WORKSPACE']
+            os.environ['WORKSPACE'],
+            max_workers=args.workers,
+            failure_policy=args.failure_policy
         )
     except Exception as e:
         print(f"Error in main execution: {e}")
@@ -50,6 +50,34 @@ def parallelBuild(buildableResourcePaths, action, assumeRoleArn) {
     }
 }
 
+/**
+ * Run every account through one Python scheduler call. Workers take the next account
+ * as soon as they are free, longest expected first from the durations of earlier runs,
+ * instead of waiting for the slowest account of a batch of 10.
+ */
+def scheduledBuild(buildableResourcePaths, action, assumeRoleArn, workers = 10) {
+    if (buildableResourcePaths.isEmpty()) {
+        println("No accounts detected to process")
+        return
+    }
+
+    def accountIDs = buildableResourcePaths.collect { path -> path.tokenize('/').last() }
+    println("Scheduling ${accountIDs.size()} accounts on ${workers} workers")
+
+    // Durations of the previous build, kept as an artifact since the workspace is cleaned
+    copyArtifacts(projectName: env.JOB_NAME, selector: lastCompleted(), filter: 'account_durations.json', optional: true)
+    try {
+        sh(script: "python3 ${WORKSPACE}/build/scripts/account_scheduler.py " +
+            "--action ${action} " +
+            "--base_assume_arn ${assumeRoleArn} " +
+            "--accounts ${accountIDs.join(',')} " +
+            "--workers ${workers} " +
+            "--history ${WORKSPACE}/account_durations.json")
+    } finally {
+        archiveArtifacts(artifacts: 'account_durations.json', allowEmptyArchive: true)
+    }
+}
+
 def runAwsCommand(action, AssumeRoleArn) {
     def runScript = sh(script: "${WORKSPACE}/build/scripts/aws_runner.sh " +
         "--action ${action} " +